@@ -0,0 +1,526 @@
+"""Benchmarks offline de los caminos críticos del pipeline ML.
+
+No usa red ni MongoDB: las barras salen de `SyntheticProvider` y la base es
+`config.memory_db.MemoryDB`. Todo se ejecuta en un directorio temporal para no
+tocar `models/` ni `data/` del repo.
+
+Uso:
+    python -m benchmarks.run --tickers 20 --bars 750 --out bench.json
+    python -m benchmarks.run --out nuevo.json --compare bench.json --threshold 0.25
+
+Con --compare, los casos cuya mediana empeora más que el umbral se marcan como
+regresión y el proceso termina con código 1.
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+CASES: List[dict] = []
+
+
+def case(name: str, setup: Optional[Callable] = None, warmup: int = 0):
+    """Registra una función de benchmark; `setup(env)` corre antes de cada repetición sin medirse."""
+
+    def deco(fn):
+        CASES.append({"name": name, "fn": fn, "setup": setup, "warmup": warmup})
+        return fn
+
+    return deco
+
+
+class Env:
+    """Entorno aislado: directorio temporal, almacén de barras sintético y DB en memoria."""
+
+    def __init__(self, n_tickers: int, n_bars: int, n_interactions: int, seed: int = 0):
+        from benchmarks.synthetic import SyntheticProvider, seed_interactions, synthetic_tickers
+        from config.db import use_database
+        from config.memory_db import MemoryDB
+        from ml.feature_store import FeatureStore, set_feature_store
+        from services.bar_store import get_bar_store, set_provider
+
+        self.tmp = tempfile.mkdtemp(prefix="ml_bench_")
+        self.prev_cwd = os.getcwd()
+        os.chdir(self.tmp)
+        self.tickers = synthetic_tickers(n_tickers)
+        self.n_bars = n_bars
+        self.provider = SyntheticProvider(n_bars=n_bars, seed=seed)
+        store = get_bar_store()
+        store.root = os.path.join(self.tmp, "bars")
+        set_provider(self.provider)
+        set_feature_store(FeatureStore(os.path.join(self.tmp, "features")))
+        self.db = MemoryDB()
+        use_database(self.db)
+        with contextlib.redirect_stdout(io.StringIO()):
+            seed_interactions(self.db, self.tickers, n_interactions, n_bars=n_bars, seed=seed)
+        self.period = "2y" if n_bars >= 500 else "1y"
+
+    def fresh_bar_root(self) -> None:
+        from services.bar_store import get_bar_store
+
+        get_bar_store().root = tempfile.mkdtemp(prefix="bars_", dir=self.tmp)
+
+    def fresh_feature_root(self) -> None:
+        from ml.feature_store import FeatureStore, set_feature_store
+
+        set_feature_store(FeatureStore(tempfile.mkdtemp(prefix="features_", dir=self.tmp)))
+
+    def fresh_backtest_cache(self) -> None:
+        import ml.backtest
+
+        ml.backtest.CACHE_DIR = tempfile.mkdtemp(prefix="backtests_", dir=self.tmp)
+
+    def close(self) -> None:
+        os.chdir(self.prev_cwd)
+
+
+# ---- casos ----------------------------------------------------------------
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ("pandas", "yfinance", "pymongo", "xgboost", "sklearn")
+
+
+def _import_fresh(statement: str, forbidden=()) -> None:
+    """Ejecuta `statement` en un intérprete nuevo; falla si quedó importado algo de `forbidden`."""
+    code = f"import sys; {statement}; print(','.join(m for m in {tuple(forbidden)!r} if m in sys.modules))"
+    out = subprocess.run(
+        [sys.executable, "-c", code], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+    ).stdout.strip()
+    if out:
+        raise AssertionError(f"`{statement}` importa {out}")
+
+
+@case("startup.import_main")
+def bench_import_main(env):
+    _import_fresh("import main", forbidden=HEAVY_MODULES)
+
+
+@case("startup.import_recomendacion")
+def bench_import_recomendacion(env):
+    _import_fresh("import ml.recomendacion", forbidden=("yfinance", "xgboost", "sklearn"))
+
+
+def _frames(env):
+    from services.bar_store import get_history_many
+
+    return get_history_many(env.tickers, period=env.period)
+
+
+@case("bar_store.history_many.cold", setup=lambda env: env.fresh_bar_root())
+def bench_history_cold(env):
+    _frames(env)
+
+
+@case("bar_store.history_many.warm", warmup=1)
+def bench_history_warm(env):
+    _frames(env)
+
+
+@case("features.per_ticker_loop", warmup=1)
+def bench_features_loop(env):
+    from ml.features import add_basic_features, make_supervised
+
+    for df in _frames(env).values():
+        make_supervised(add_basic_features(df), up_pct=0.01)
+
+
+@case("features.panel", warmup=1)
+def bench_features_panel(env):
+    from ml.features import supervised_panel_from_frames
+
+    supervised_panel_from_frames(_frames(env), up_pct=0.01)
+
+
+@case("feature_store.features_many.cold", setup=lambda env: env.fresh_feature_root())
+def bench_feature_store_cold(env):
+    from ml.feature_store import get_feature_store
+
+    get_feature_store().features_many(_frames(env))
+
+
+@case("feature_store.features_many.warm", warmup=1)
+def bench_feature_store_warm(env):
+    from ml.feature_store import get_feature_store
+
+    get_feature_store().features_many(_frames(env))
+
+
+@case("indicators.panel.todos", warmup=1)
+def bench_indicators_panel(env):
+    from ml.features import to_panel
+    from ml.indicators import INDICATORS, compute_indicators
+
+    compute_indicators(to_panel(_frames(env)), list(INDICATORS))
+
+
+@case("indicators.por_ticker.todos", warmup=1)
+def bench_indicators_per_ticker(env):
+    from ml.indicators import INDICATORS, compute_indicators
+
+    for df in _frames(env).values():
+        compute_indicators(df, list(INDICATORS))
+
+
+def _seed_metadata(env):
+    """Nombres ya en el caché de metadatos: el caso común, sin get_info() (y sin red)."""
+    from services.ticker_metadata import get_metadata_cache
+
+    get_metadata_cache().put_many({t: {"name": f"{t} Corp"} for t in env.tickers})
+
+
+@case("stocks.get_stock_info_many", setup=_seed_metadata, warmup=1)
+def bench_stock_info_many(env):
+    from services.stocks import get_stock_info_many
+
+    get_stock_info_many(env.tickers)
+
+
+@case("global_models.build_dataset_for_tickers", warmup=1)
+def bench_build_dataset(env):
+    from ml.global_models import build_dataset_for_tickers
+
+    build_dataset_for_tickers(env.tickers, period=env.period)
+
+
+@case("trainer.train_buy_model_optimizado", warmup=1)
+def bench_train_local(env):
+    from ml.trainer import train_buy_model_optimizado
+
+    train_buy_model_optimizado(env.tickers[0], periodo=env.period)
+
+
+@case("trainer.tune_buy_model.20_candidatos")
+def bench_tune_local(env):
+    from ml.trainer import tune_buy_model
+
+    tune_buy_model(env.tickers[0], periodo=env.period, n_candidates=20)
+
+
+def _remove_global(env, name, registry_name):
+    """Entrenamiento desde cero: sin .pkl heredado ni versiones en el registro."""
+    from config import model_registry
+
+    path = os.path.join("models", name)
+    if os.path.exists(path):
+        os.remove(path)
+    shutil.rmtree(os.path.join(model_registry.REGISTRY_DIR, registry_name), ignore_errors=True)
+
+
+@case("global_models.train_or_update_xgb_global", setup=lambda env: _remove_global(env, "global_xgb.pkl", "GLOBAL_XGB"))
+def bench_train_xgb_global(env):
+    from ml.global_models import train_or_update_xgb_global
+
+    train_or_update_xgb_global(env.tickers, period=env.period)
+
+
+@case("self_training._dataset_from_db")
+def bench_dataset_from_db(env):
+    from ml.self_training import _dataset_from_db
+
+    _dataset_from_db(limit=env.db.acciones_usuario.count_documents({}))
+
+
+@case("self_training.train_mlp_from_db_recent", setup=lambda env: _remove_global(env, "global_mlp.pkl", "GLOBAL_MLP"))
+def bench_train_mlp_db(env):
+    from ml.self_training import train_mlp_from_db_recent
+
+    train_mlp_from_db_recent(limit=500)
+
+
+def _remove_online_mlp(env):
+    from ml.online_mlp import REPLAY_PATH
+
+    _remove_global(env, "global_mlp.pkl", "GLOBAL_MLP")
+    if os.path.exists(REPLAY_PATH):
+        os.remove(REPLAY_PATH)
+
+
+@case("online_mlp.train_mlp_online.500_nuevos", setup=_remove_online_mlp)
+def bench_train_mlp_online(env):
+    from ml.online_mlp import train_mlp_online
+
+    train_mlp_online(max_new=500)
+
+
+@case("snapshot_writer.submit_y_close.1000")
+def bench_snapshot_submit(env):
+    from datetime import datetime
+
+    from services.snapshot_writer import SnapshotWriter
+
+    writer = SnapshotWriter(flush_size=100, flush_interval_s=0.5, spill_dir=None)
+    for i in range(1000):
+        writer.submit({"ticker": env.tickers[i % len(env.tickers)], "price": float(i), "timestamp": datetime.now()})
+    writer.close()
+
+
+def _seed_snapshots(env):
+    """50.000 snapshots crudos (250 por día y ticker) en una base propia."""
+    if not hasattr(env, "_snap_db"):
+        from datetime import datetime, timedelta
+
+        import numpy as np
+        from config.memory_db import MemoryDB
+
+        rng = np.random.default_rng(0)
+        base = datetime(2024, 1, 1, 9, 30)
+        n_por_ticker = 50000 // len(env.tickers)
+        docs = [
+            {
+                "ticker": t,
+                "price": float(100 + rng.normal()),
+                "volume": int(i % 250) * 1000,
+                "timestamp": base + timedelta(days=i // 250, seconds=90 * (i % 250)),
+            }
+            for t in env.tickers
+            for i in range(n_por_ticker)
+        ]
+        env._snap_db = MemoryDB()
+        env._snap_db.history.insert_many(docs)
+    env._snap_db.drop_collection("history_daily")
+
+
+@case("quote_history.rollup_daily.50k_snapshots", setup=_seed_snapshots)
+def bench_rollup_daily(env):
+    from services.quote_history import rollup_daily
+
+    rollup_daily(env._snap_db, full=True)
+
+
+@case("recomendacion.smart_recommendation.local_xgb", warmup=1)
+def bench_smart_local(env):
+    from ml.recomendacion import smart_recommendation
+
+    smart_recommendation(env.tickers[0], registrar=False, model_type="local_xgb")
+
+
+@case("recomendacion.smart_recommendation.global_xgb", warmup=1)
+def bench_smart_global(env):
+    from ml.recomendacion import smart_recommendation
+
+    smart_recommendation(env.tickers[1 % len(env.tickers)], registrar=False, model_type="global_xgb")
+
+
+@case("recomendacion.smart_recommendation_many.global_xgb", warmup=1)
+def bench_smart_many(env):
+    from ml.recomendacion import smart_recommendation_many
+
+    smart_recommendation_many(env.tickers, registrar=False, model_type="global_xgb")
+
+
+@case("server.recommend.concurrent64.global_xgb", warmup=1)
+def bench_server_concurrent(env):
+    import asyncio
+
+    from server import RecommendationService
+
+    service = RecommendationService(max_wait_ms=5.0)
+
+    async def burst():
+        tickers = [env.tickers[i % len(env.tickers)] for i in range(64)]
+        await asyncio.gather(*(service.recommend(t, model_type="global_xgb") for t in tickers))
+
+    try:
+        asyncio.run(burst())
+    finally:
+        service.executor.shutdown()
+
+
+@case("backtest.evaluate_thresholds.51_umbrales", warmup=1)
+def bench_backtest_thresholds(env):
+    import numpy as np
+    import pandas as pd
+
+    from ml.backtest import evaluate_thresholds
+
+    if not hasattr(env, "_bt_scores"):
+        rng = np.random.default_rng(0)
+        dates = pd.bdate_range(end="2024-12-31", periods=env.n_bars)
+        n = len(dates) * len(env.tickers)
+        env._bt_scores = pd.DataFrame({
+            "Date": np.repeat(dates, len(env.tickers)),
+            "ticker": np.tile(env.tickers, len(dates)),
+            "score": rng.random(n),
+            "y": rng.integers(0, 2, n),
+            "ret": rng.normal(0, 0.02, n),
+        })
+    evaluate_thresholds(env._bt_scores)
+
+
+@case("backtest.local_xgb.walk_forward", setup=lambda env: env.fresh_backtest_cache())
+def bench_backtest_local(env):
+    from ml.backtest import backtest
+
+    backtest(env.tickers[:4], model_type="local_xgb", period=env.period, retrain_every=126, min_train=200)
+
+
+def _trained_models(env):
+    if not hasattr(env, "_models"):
+        from ml.global_models import build_dataset_for_tickers
+        from ml.self_training import _load_or_init_pipeline
+        from xgboost import XGBClassifier
+
+        X, y = build_dataset_for_tickers(env.tickers, period=env.period)
+        xgb = XGBClassifier(n_estimators=300, max_depth=5).fit(X, y)
+        mlp = _load_or_init_pipeline("models/_bench_mlp.pkl").fit(X, y)
+        env._models = {"xgb": xgb, "mlp": mlp}
+    return env._models
+
+
+def _roundtrip_joblib(model):
+    import joblib
+
+    buffer = io.BytesIO()
+    joblib.dump(model, buffer)
+    joblib.load(io.BytesIO(buffer.getvalue()))
+
+
+def _roundtrip_store(model):
+    from config.model_store import deserialize, serialize
+
+    formato, blob, _ = serialize(model)
+    deserialize(formato, blob)
+
+
+@case("model_store.roundtrip.xgb.joblib", warmup=1)
+def bench_rt_xgb_joblib(env):
+    _roundtrip_joblib(_trained_models(env)["xgb"])
+
+
+@case("model_store.roundtrip.xgb.native", warmup=1)
+def bench_rt_xgb_native(env):
+    _roundtrip_store(_trained_models(env)["xgb"])
+
+
+@case("model_store.roundtrip.mlp.joblib", warmup=1)
+def bench_rt_mlp_joblib(env):
+    _roundtrip_joblib(_trained_models(env)["mlp"])
+
+
+@case("model_store.roundtrip.mlp.npz", warmup=1)
+def bench_rt_mlp_npz(env):
+    _roundtrip_store(_trained_models(env)["mlp"])
+
+
+@case("profiling.span.10000_anidados", warmup=1)
+def bench_span_overhead(env):
+    from config.profiling import span
+
+    for _ in range(5000):
+        with span("_bench"), span("_hijo"):
+            pass
+
+
+# ---- ejecución ----------------------------------------------------------------
+
+
+def run(env: Env, repeats: int, only: Optional[List[str]] = None) -> Dict[str, dict]:
+    results = {}
+    for c in CASES:
+        if only and not any(sel in c["name"] for sel in only):
+            continue
+        times = []
+        error = None
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                for _ in range(c["warmup"]):
+                    if c["setup"]:
+                        c["setup"](env)
+                    c["fn"](env)
+                for _ in range(repeats):
+                    if c["setup"]:
+                        c["setup"](env)
+                    t0 = time.perf_counter()
+                    c["fn"](env)
+                    times.append(time.perf_counter() - t0)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        if error:
+            results[c["name"]] = {"error": error}
+            print(f"[WARN] {c['name']}: {error}")
+            continue
+        results[c["name"]] = {
+            "median_s": statistics.median(times),
+            "min_s": min(times),
+            "max_s": max(times),
+            "repeats": len(times),
+        }
+        print(f"{c['name']:<55} mediana {results[c['name']]['median_s'] * 1000:10.2f} ms")
+    return results
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> List[str]:
+    """Lista de regresiones: casos cuya mediana creció más que `threshold` (proporción)."""
+    regressions = []
+    base = baseline.get("results", {})
+    print(f"\n{'caso':<55} {'base ms':>10} {'actual ms':>10} {'cambio':>8}")
+    for name, res in current.get("results", {}).items():
+        old = base.get(name)
+        if not old or "median_s" not in old or "median_s" not in res:
+            continue
+        delta = res["median_s"] / old["median_s"] - 1.0 if old["median_s"] > 0 else 0.0
+        flag = "  REGRESIÓN" if delta > threshold else ""
+        print(f"{name:<55} {old['median_s'] * 1000:10.2f} {res['median_s'] * 1000:10.2f} {delta * 100:7.1f}%{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks offline del pipeline ML")
+    parser.add_argument("--tickers", type=int, default=20, help="Cantidad de tickers sintéticos")
+    parser.add_argument("--bars", type=int, default=750, help="Barras diarias por ticker")
+    parser.add_argument("--interactions", type=int, default=2000, help="Documentos en acciones_usuario")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--only", nargs="*", default=None, help="Filtra casos por subcadena")
+    parser.add_argument("--out", default=None, help="Archivo JSON de resultados")
+    parser.add_argument("--compare", default=None, help="JSON previo contra el cual comparar")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Empeoramiento tolerado (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    env = Env(args.tickers, args.bars, args.interactions)
+    try:
+        results = run(env, args.repeats, args.only)
+    finally:
+        env.close()
+
+    payload = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "params": {k: getattr(args, k) for k in ("tickers", "bars", "interactions", "repeats")},
+        },
+        "results": results,
+    }
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as fh:
+            json.dump(payload, fh, indent=2)
+        print(f"[OK] Resultados guardados en {args.out}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as fh:
+            baseline = json.load(fh)
+        regressions = compare(payload, baseline, args.threshold)
+        if regressions:
+            print(f"[WARN] Regresiones: {regressions}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""Datos sintéticos para benchmarks: OHLCV reproducible e interacciones de usuario."""
+
+from __future__ import annotations
+
+import zlib
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from ml.feature_store import SCHEMA_HASH, feature_hash
+from ml.features import FEATURE_COLUMNS, add_basic_features
+
+
+def _seed(ticker: str, seed: int) -> int:
+    return (zlib.crc32(ticker.encode()) + seed) % (2**32)
+
+
+def generate_ohlcv(ticker: str, n_bars: int = 750, seed: int = 0, end: Optional[datetime] = None) -> pd.DataFrame:
+    """Barras diarias (días hábiles) con precio lognormal; mismo ticker+seed → mismas barras."""
+    rng = np.random.default_rng(_seed(ticker, seed))
+    end = end or datetime.now()
+    idx = pd.bdate_range(end=end.date(), periods=n_bars, name="Date")
+    rets = rng.normal(0.0003, 0.018, n_bars)
+    close = 20 + 180 * rng.random() * np.exp(np.cumsum(rets))
+    spread = np.abs(rng.normal(0, 0.01, n_bars))
+    open_ = close * (1 + rng.normal(0, 0.004, n_bars))
+    return pd.DataFrame(
+        {
+            "Open": open_,
+            "High": np.maximum(open_, close) * (1 + spread),
+            "Low": np.minimum(open_, close) * (1 - spread),
+            "Close": close,
+            "Volume": rng.integers(100_000, 50_000_000, n_bars).astype(float),
+        },
+        index=idx,
+    )
+
+
+def synthetic_tickers(n: int) -> List[str]:
+    return [f"SYN{i:04d}" for i in range(n)]
+
+
+class SyntheticProvider:
+    """Provider para el almacén de barras que genera datos en memoria (sin red)."""
+
+    def __init__(self, n_bars: int = 750, seed: int = 0):
+        self.n_bars = n_bars
+        self.seed = seed
+        self.calls = 0
+        self._cache: Dict[str, pd.DataFrame] = {}
+
+    def _full(self, ticker: str) -> pd.DataFrame:
+        if ticker not in self._cache:
+            self._cache[ticker] = generate_ohlcv(ticker, self.n_bars, self.seed)
+        return self._cache[ticker]
+
+    def fetch(self, ticker: str, start, end=None) -> pd.DataFrame:
+        self.calls += 1
+        df = self._full(ticker)
+        if start is not None:
+            df = df[df.index >= pd.Timestamp(start)]
+        if end is not None:
+            df = df[df.index < pd.Timestamp(end)]
+        return df
+
+    def fetch_many(self, tickers, start, end=None) -> Dict[str, pd.DataFrame]:
+        self.calls += 1
+        return {t: self.fetch(t, start, end) for t in tickers}
+
+
+def seed_interactions(db, tickers: List[str], n: int, n_bars: int = 750, seed: int = 0) -> int:
+    """Inserta `n` documentos de acciones_usuario que referencian barras reales de las series sintéticas."""
+    rng = np.random.default_rng(seed)
+    feats = {t: add_basic_features(generate_ohlcv(t, n_bars, seed)).dropna() for t in tickers}
+    now = datetime.now()
+    docs = []
+    for i in range(n):
+        t = tickers[i % len(tickers)]
+        row = feats[t].iloc[int(rng.integers(0, len(feats[t])))]
+        y_pred = int(rng.random() < 0.4)
+        doc = {
+            "ticker": t,
+            "fecha": now - timedelta(minutes=n - i),
+            "precio": float(row["Close"]),
+            "recomendacion_ml": "comprar" if y_pred else "no_comprar",
+            "probabilidad": float(rng.random()),
+            "y_pred": y_pred,
+            "feature_ref": {
+                "date": row.name.to_pydatetime(),
+                "schema": SCHEMA_HASH,
+                "hash": feature_hash(row[FEATURE_COLUMNS]),
+            },
+            "decision_usuario": None,
+            "modelo_usado": "local_xgb",
+            "umbral": 0.5,
+        }
+        if rng.random() < 0.5:
+            doc["y_true"] = int(rng.random() < 0.35)
+        docs.append(doc)
+    db.acciones_usuario.insert_many(docs)
+    return len(docs)
@@ -1,37 +1,35 @@
-"""Persistencia de modelos en MongoDB como binarios."""
-
-from config.db import get_db
-from bson.binary import Binary
-import joblib
-import io
-from datetime import datetime
-
-def guardar_modelo_en_mongo(ticker, modelo):
-    """Guarda un modelo serializado (joblib) en MongoDB bajo la clave ticker."""
-    buffer = io.BytesIO()
-    joblib.dump(modelo, buffer)
-    buffer.seek(0)
-
-    db = get_db()
-    db.modelos_binarios.replace_one(
-        {"ticker": ticker},
-        {
-            "ticker": ticker,
-            "modelo": Binary(buffer.read()),
-            "ultima_actualizacion": datetime.now()
-        },
-        upsert=True
-    )
-    print(f"[INFO] Modelo para {ticker} guardado en MongoDB.")
+"""Persistencia de modelos en MongoDB como binarios.
+
+El formato y el almacenamiento (booster nativo de XGBoost, arreglos comprimidos
+para el MLP, GridFS para artefactos grandes, deduplicación por hash y copias
+locales) viven en config.model_store. Las lecturas pasan por el caché en
+memoria (config.model_cache): si la versión no cambió no se descarga el binario.
+"""
+
+from config import model_store
+
+
+def guardar_modelo_en_mongo(ticker, modelo, metadata=None):
+    """Guarda un modelo en MongoDB bajo la clave ticker (no reescribe si no cambió)."""
+    if model_store.save_model(ticker, modelo, metadata=metadata):
+        print(f"[INFO] Modelo para {ticker} guardado en MongoDB.")
+    else:
+        print(f"[INFO] Modelo para {ticker} sin cambios; no se reescribe.")
 
 
 def cargar_modelo_de_mongo(ticker):
-    """Carga un modelo desde MongoDB (o None si no existe)."""
-    db = get_db()
-    doc = db.modelos_binarios.find_one({"ticker": ticker})
-    if doc and "modelo" in doc:
-        buffer = io.BytesIO(doc["modelo"])
-        modelo = joblib.load(buffer)
-        print(f"[INFO] Modelo para {ticker} cargado desde MongoDB.")
-        return modelo
-    return None
+    """Carga un modelo desde MongoDB (o None si no existe).
+
+    Sólo descarga y deserializa el binario si cambió desde la última carga.
+    """
+    return model_store.load_model(ticker)
+
+
+def cargar_modelos_de_mongo(tickers):
+    """Carga varios modelos en una sola consulta. Retorna {ticker: modelo} (sólo los existentes)."""
+    return model_store.load_models(tickers)
+
+
+def cargar_metadatos_de_mongo(tickers):
+    """Metadatos de los modelos guardados ({ticker: metadata}), sin descargar los binarios."""
+    return model_store.load_metadata(tickers)
@@ -1,6 +1,201 @@
-from pymongo import MongoClient
-
-def get_db():
-    client = MongoClient("mongodb://localhost:27017/")
-    db = client["acciones_ml"]
-    return db
+"""Conexión a MongoDB compartida por todo el proceso.
+
+Se crea un único `MongoClient` de forma perezosa (al primer uso) y se reutiliza
+en todos los módulos y scripts. Configurable por variables de entorno:
+
+- MONGO_URI (por defecto mongodb://localhost:27017/)
+- MONGO_DB (por defecto acciones_ml)
+- MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE
+- MONGO_SERVER_SELECTION_TIMEOUT_MS, MONGO_CONNECT_TIMEOUT_MS, MONGO_SOCKET_TIMEOUT_MS
+
+Tras un `fork()` el proceso hijo descarta el cliente heredado y crea uno propio.
+`use_database()` permite reemplazar la base por otra (p. ej. config.memory_db.MemoryDB).
+"""
+
+import os
+import threading
+
+from pymongo import MongoClient
+from pymongo import monitoring
+
+
+DEFAULT_URI = "mongodb://localhost:27017/"
+DEFAULT_DB = "acciones_ml"
+
+_lock = threading.Lock()
+_client = None
+_client_pid = None
+_settings = {}
+_override = None
+
+
+def _env_int(name: str, default):
+    value = os.environ.get(name)
+    if value is None or value == "":
+        return default
+    return int(value)
+
+
+def _default_settings() -> dict:
+    return {
+        "uri": os.environ.get("MONGO_URI", DEFAULT_URI),
+        "db_name": os.environ.get("MONGO_DB", DEFAULT_DB),
+        "maxPoolSize": _env_int("MONGO_MAX_POOL_SIZE", 50),
+        "minPoolSize": _env_int("MONGO_MIN_POOL_SIZE", 0),
+        "serverSelectionTimeoutMS": _env_int("MONGO_SERVER_SELECTION_TIMEOUT_MS", 3000),
+        "connectTimeoutMS": _env_int("MONGO_CONNECT_TIMEOUT_MS", 5000),
+        "socketTimeoutMS": _env_int("MONGO_SOCKET_TIMEOUT_MS", None),
+    }
+
+
+class _PoolStats(monitoring.ConnectionPoolListener):
+    """Contadores del pool de conexiones (vía eventos de monitoreo de pymongo)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counts = {
+                "pools_created": 0,
+                "connections_created": 0,
+                "connections_closed": 0,
+                "checked_out": 0,
+                "checked_in": 0,
+                "checkout_failed": 0,
+            }
+
+    def _inc(self, key):
+        with self._lock:
+            self.counts[key] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            data = dict(self.counts)
+        data["in_use"] = data["checked_out"] - data["checked_in"]
+        data["open_connections"] = data["connections_created"] - data["connections_closed"]
+        return data
+
+    def pool_created(self, event):
+        self._inc("pools_created")
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._inc("connections_created")
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._inc("connections_closed")
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._inc("checkout_failed")
+
+    def connection_checked_out(self, event):
+        self._inc("checked_out")
+
+    def connection_checked_in(self, event):
+        self._inc("checked_in")
+
+
+_pool_stats = _PoolStats()
+
+
+def configure(**settings) -> None:
+    """Ajusta URI, nombre de DB, tamaño de pool o timeouts antes del primer uso.
+
+    Claves aceptadas: uri, db_name, maxPoolSize, minPoolSize,
+    serverSelectionTimeoutMS, connectTimeoutMS, socketTimeoutMS.
+    Si ya existía un cliente, se cierra y el próximo acceso crea uno nuevo.
+    """
+    unknown = set(settings) - set(_default_settings())
+    if unknown:
+        raise ValueError(f"Opciones de conexión no soportadas: {sorted(unknown)}")
+    close_client()
+    with _lock:
+        _settings.update(settings)
+
+
+def connection_settings() -> dict:
+    """Configuración efectiva (entorno + `configure`)."""
+    merged = _default_settings()
+    merged.update(_settings)
+    return merged
+
+
+def get_client() -> MongoClient:
+    """Devuelve el `MongoClient` del proceso, creándolo la primera vez."""
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+    with _lock:
+        if _client is None or _client_pid != pid:
+            cfg = connection_settings()
+            kwargs = {k: v for k, v in cfg.items() if k not in ("uri", "db_name") and v is not None}
+            # connect=False: no abre sockets ni hilos hasta la primera operación
+            _client = MongoClient(cfg["uri"], connect=False, event_listeners=[_pool_stats], **kwargs)
+            _client_pid = pid
+        return _client
+
+
+def get_db():
+    """Base de datos de la aplicación sobre el cliente compartido."""
+    if _override is not None:
+        return _override
+    return get_client()[connection_settings()["db_name"]]
+
+
+def use_database(db) -> None:
+    """Hace que `get_db()` devuelva `db` (None vuelve a MongoDB)."""
+    global _override
+    _override = db
+
+
+def close_client() -> None:
+    """Cierra el cliente compartido (si existe); el próximo acceso crea otro."""
+    global _client, _client_pid
+    with _lock:
+        client, _client, _client_pid = _client, None, None
+    if client is not None:
+        try:
+            client.close()
+        except Exception:
+            pass
+
+
+def pool_stats() -> dict:
+    """Estadísticas del pool: conexiones creadas/cerradas, en uso, checkouts, etc."""
+    data = _pool_stats.snapshot()
+    cfg = connection_settings()
+    data["maxPoolSize"] = cfg["maxPoolSize"]
+    data["client_active"] = _client is not None and _client_pid == os.getpid()
+    return data
+
+
+def _after_fork_in_child() -> None:
+    # El cliente heredado no es seguro tras fork: se descarta sin cerrarlo
+    # (cerrarlo afectaría sockets compartidos con el proceso padre).
+    global _client, _client_pid, _lock
+    _client = None
+    _client_pid = None
+    _lock = threading.Lock()
+    _pool_stats._lock = threading.Lock()
+    _pool_stats.reset()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
@@ -0,0 +1,396 @@
+"""Sustituto en memoria de MongoDB para benchmarks y ejecución local sin servidor.
+
+Implementa el subconjunto de la API de pymongo que usa el proyecto: find/find_one
+con filtros simples ($exists, $in, $nin, $gt, $gte, $lt, $lte, $ne) y
+proyecciones, sort/limit/batch_size, insert_one/insert_many, update_one
+($set, $inc, $setOnInsert, upsert), replace_one, find_one_and_replace,
+delete_many, bulk_write y
+count_documents, más create_collection/list_collections/collMod/rename para la
+administración de colecciones (las opciones time series y TTL se guardan pero
+no se aplican: nada vence). Se activa con `config.db.use_database(MemoryDB())`.
+"""
+
+from __future__ import annotations
+
+import copy
+import threading
+from typing import Any, Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateMany, UpdateOne
+
+
+_MISSING = object()
+
+
+def _get_path(doc: dict, path: str):
+    cur: Any = doc
+    for part in path.split("."):
+        if isinstance(cur, dict) and part in cur:
+            cur = cur[part]
+        else:
+            return _MISSING
+    return cur
+
+
+def _set_path(doc: dict, path: str, value) -> None:
+    parts = path.split(".")
+    cur = doc
+    for part in parts[:-1]:
+        cur = cur.setdefault(part, {})
+    cur[parts[-1]] = value
+
+
+def _compare(value, op: str, arg) -> bool:
+    if op == "$exists":
+        return (value is not _MISSING) == bool(arg)
+    if op == "$in":
+        return value is not _MISSING and value in arg
+    if op == "$nin":
+        return value is _MISSING or value not in arg
+    if op == "$ne":
+        # como en MongoDB, un campo ausente cuenta como null
+        if arg is None:
+            return value is not _MISSING and value is not None
+        return value is _MISSING or value != arg
+    if op == "$eq":
+        if arg is None:
+            return value is _MISSING or value is None
+        return value is not _MISSING and value == arg
+    if value is _MISSING or value is None:
+        return False
+    try:
+        if op == "$gt":
+            return value > arg
+        if op == "$gte":
+            return value >= arg
+        if op == "$lt":
+            return value < arg
+        if op == "$lte":
+            return value <= arg
+    except TypeError:
+        return False
+    raise NotImplementedError(f"Operador no soportado en MemoryDB: {op}")
+
+
+def _matches(doc: dict, flt: Optional[dict]) -> bool:
+    for key, cond in (flt or {}).items():
+        if key == "$and":
+            if not all(_matches(doc, sub) for sub in cond):
+                return False
+            continue
+        if key == "$or":
+            if not any(_matches(doc, sub) for sub in cond):
+                return False
+            continue
+        value = _get_path(doc, key)
+        if isinstance(cond, dict) and cond and all(k.startswith("$") for k in cond):
+            if not all(_compare(value, op, arg) for op, arg in cond.items()):
+                return False
+        elif cond is None:
+            if value is not _MISSING and value is not None:
+                return False
+        elif value is _MISSING or value != cond:
+            return False
+    return True
+
+
+def _project(doc: dict, projection) -> dict:
+    if not projection:
+        return copy.deepcopy(doc)
+    if isinstance(projection, (list, tuple)):
+        projection = {k: 1 for k in projection}
+    include_id = projection.get("_id", 1)
+    fields = {k: v for k, v in projection.items() if k != "_id"}
+    if not fields or all(not v for v in fields.values()):
+        out = copy.deepcopy(doc)
+        for k in fields:
+            out.pop(k, None)
+        if not include_id:
+            out.pop("_id", None)
+        return out
+    out: Dict[str, Any] = {}
+    if include_id and "_id" in doc:
+        out["_id"] = doc["_id"]
+    for path in fields:
+        value = _get_path(doc, path)
+        if value is not _MISSING:
+            _set_path(out, path, copy.deepcopy(value) if isinstance(value, (dict, list)) else value)
+    return out
+
+
+def _sort_key(value):
+    # None/ausentes primero, como en MongoDB
+    if value is _MISSING or value is None:
+        return (0, 0)
+    return (1, value)
+
+
+class MemoryCursor:
+    def __init__(self, docs: List[dict], projection=None):
+        self._docs = docs
+        self._projection = projection
+        self._sort = []
+        self._limit = 0
+        self._skip = 0
+
+    def sort(self, key, direction=1):
+        if isinstance(key, (list, tuple)):
+            self._sort.extend(key)
+        else:
+            self._sort.append((key, direction))
+        return self
+
+    def limit(self, n: int):
+        self._limit = int(n)
+        return self
+
+    def skip(self, n: int):
+        self._skip = int(n)
+        return self
+
+    def batch_size(self, n: int):
+        return self
+
+    def _selected(self) -> List[dict]:
+        docs = list(self._docs)
+        for key, direction in reversed(self._sort):
+            docs.sort(key=lambda d: _sort_key(_get_path(d, key)), reverse=direction < 0)
+        docs = docs[self._skip:]
+        if self._limit:
+            docs = docs[: self._limit]
+        return docs
+
+    def __iter__(self):
+        # proyección perezosa: como un cursor real, no copia todos los documentos de una vez
+        return (_project(d, self._projection) for d in self._selected())
+
+
+class _Result:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class MemoryCollection:
+    def __init__(self, name: str, database: Optional["MemoryDB"] = None):
+        self.name = name
+        self.database = database
+        self.options: Optional[dict] = None  # None: creada implícitamente al primer acceso
+        self._docs: List[dict] = []
+        self._indexes: Dict[str, dict] = {}
+        self._lock = threading.RLock()
+
+    # ---- lectura --------------------------------------------------------
+    def find(self, filter=None, projection=None, **kwargs):
+        with self._lock:
+            docs = [d for d in self._docs if _matches(d, filter)]
+        cursor = MemoryCursor(docs, projection)
+        if kwargs.get("sort"):
+            cursor.sort(kwargs["sort"])
+        if kwargs.get("limit"):
+            cursor.limit(kwargs["limit"])
+        return cursor
+
+    def find_one(self, filter=None, projection=None, **kwargs):
+        for doc in self.find(filter, projection, **kwargs).limit(1):
+            return doc
+        return None
+
+    def count_documents(self, filter=None, limit: int = 0) -> int:
+        with self._lock:
+            n = sum(1 for d in self._docs if _matches(d, filter))
+        return min(n, limit) if limit else n
+
+    # ---- escritura ------------------------------------------------------
+    def insert_one(self, doc: dict):
+        with self._lock:
+            stored = copy.deepcopy(doc)
+            stored.setdefault("_id", ObjectId())
+            doc.setdefault("_id", stored["_id"])
+            self._docs.append(stored)
+        return _Result(inserted_id=stored["_id"], acknowledged=True)
+
+    def insert_many(self, docs, ordered: bool = True):
+        ids = [self.insert_one(d).inserted_id for d in docs]
+        return _Result(inserted_ids=ids, acknowledged=True)
+
+    def _apply_update(self, doc: dict, update: dict, inserting: bool) -> None:
+        for op, fields in update.items():
+            if op == "$set":
+                for k, v in fields.items():
+                    _set_path(doc, k, copy.deepcopy(v))
+            elif op == "$setOnInsert":
+                if inserting:
+                    for k, v in fields.items():
+                        _set_path(doc, k, copy.deepcopy(v))
+            elif op == "$inc":
+                for k, v in fields.items():
+                    cur = _get_path(doc, k)
+                    _set_path(doc, k, (0 if cur is _MISSING else cur) + v)
+            elif op == "$unset":
+                for k in fields:
+                    parent = doc
+                    parts = k.split(".")
+                    for p in parts[:-1]:
+                        parent = parent.get(p, {})
+                    parent.pop(parts[-1], None)
+            else:
+                raise NotImplementedError(f"Operador de actualización no soportado en MemoryDB: {op}")
+
+    def _update(self, filter, update, upsert: bool, many: bool):
+        with self._lock:
+            matched = [d for d in self._docs if _matches(d, filter)]
+            if not many:
+                matched = matched[:1]
+            for d in matched:
+                self._apply_update(d, update, inserting=False)
+            upserted_id = None
+            if not matched and upsert:
+                new = {k: v for k, v in (filter or {}).items() if not k.startswith("$") and not isinstance(v, dict)}
+                self._apply_update(new, update, inserting=True)
+                upserted_id = self.insert_one(new).inserted_id
+        return _Result(matched_count=len(matched), modified_count=len(matched), upserted_id=upserted_id)
+
+    def update_one(self, filter, update, upsert: bool = False):
+        return self._update(filter, update, upsert, many=False)
+
+    def update_many(self, filter, update, upsert: bool = False):
+        return self._update(filter, update, upsert, many=True)
+
+    def replace_one(self, filter, replacement, upsert: bool = False):
+        with self._lock:
+            for i, d in enumerate(self._docs):
+                if _matches(d, filter):
+                    new = copy.deepcopy(replacement)
+                    new["_id"] = d["_id"]
+                    self._docs[i] = new
+                    return _Result(matched_count=1, modified_count=1, upserted_id=None)
+            if upsert:
+                return _Result(matched_count=0, modified_count=0, upserted_id=self.insert_one(dict(replacement)).inserted_id)
+        return _Result(matched_count=0, modified_count=0, upserted_id=None)
+
+    def find_one_and_replace(self, filter, replacement, upsert: bool = False):
+        """Reemplaza y devuelve el documento anterior (None si no existía)."""
+        with self._lock:
+            previo = self.find_one(filter)
+            self.replace_one(filter, replacement, upsert=upsert)
+        return previo
+
+    def delete_many(self, filter):
+        with self._lock:
+            keep = [d for d in self._docs if not _matches(d, filter)]
+            deleted = len(self._docs) - len(keep)
+            self._docs = keep
+        return _Result(deleted_count=deleted)
+
+    def delete_one(self, filter):
+        with self._lock:
+            for i, d in enumerate(self._docs):
+                if _matches(d, filter):
+                    del self._docs[i]
+                    return _Result(deleted_count=1)
+        return _Result(deleted_count=0)
+
+    def bulk_write(self, requests, ordered: bool = True):
+        counts = {"inserted_count": 0, "matched_count": 0, "modified_count": 0, "upserted_count": 0, "deleted_count": 0}
+        for req in requests:
+            if isinstance(req, InsertOne):
+                self.insert_one(req._doc)
+                counts["inserted_count"] += 1
+            elif isinstance(req, (UpdateOne, UpdateMany)):
+                res = self._update(req._filter, req._doc, bool(req._upsert), many=isinstance(req, UpdateMany))
+                counts["matched_count"] += res.matched_count
+                counts["modified_count"] += res.modified_count
+                counts["upserted_count"] += int(res.upserted_id is not None)
+            elif isinstance(req, ReplaceOne):
+                res = self.replace_one(req._filter, req._doc, upsert=bool(req._upsert))
+                counts["matched_count"] += res.matched_count
+                counts["modified_count"] += res.modified_count
+                counts["upserted_count"] += int(res.upserted_id is not None)
+            elif isinstance(req, (DeleteOne, DeleteMany)):
+                res = (self.delete_one if isinstance(req, DeleteOne) else self.delete_many)(req._filter)
+                counts["deleted_count"] += res.deleted_count
+            else:
+                raise NotImplementedError(f"Operación no soportada en MemoryDB: {type(req).__name__}")
+        return _Result(acknowledged=True, **counts)
+
+    def create_index(self, keys, **kwargs):
+        name = kwargs.get("name", "idx")
+        with self._lock:
+            self._indexes[name] = {"key": list(keys), **{k: v for k, v in kwargs.items() if k != "name"}}
+        return name
+
+    def index_information(self) -> Dict[str, dict]:
+        with self._lock:
+            return {name: dict(info) for name, info in self._indexes.items()}
+
+    def rename(self, new_name: str) -> None:
+        self.database._rename(self.name, new_name)
+
+    def drop(self):
+        with self._lock:
+            self._docs = []
+
+
+class MemoryDB:
+    """Base de datos en memoria: colecciones creadas al primer acceso."""
+
+    def __init__(self, name: str = "acciones_ml"):
+        self.name = name
+        self._collections: Dict[str, MemoryCollection] = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        with self._lock:
+            if name not in self._collections:
+                self._collections[name] = MemoryCollection(name, self)
+            return self._collections[name]
+
+    def __getattr__(self, name: str) -> MemoryCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def _existing(self) -> Dict[str, MemoryCollection]:
+        with self._lock:
+            return {n: c for n, c in self._collections.items() if c._docs or c.options is not None}
+
+    def list_collection_names(self) -> List[str]:
+        return list(self._existing())
+
+    def list_collections(self, filter=None):
+        for name, coll in self._existing().items():
+            if filter and filter.get("name") not in (None, name):
+                continue
+            options = dict(coll.options or {})
+            yield {"name": name, "type": "timeseries" if "timeseries" in options else "collection", "options": options}
+
+    def create_collection(self, name: str, **options) -> MemoryCollection:
+        from pymongo.errors import CollectionInvalid
+
+        if name in self._existing():
+            raise CollectionInvalid(f"collection {name} already exists")
+        coll = self[name]
+        coll.options = options
+        return coll
+
+    def command(self, command: str, value=None, **kwargs) -> dict:
+        if command != "collMod":
+            raise NotImplementedError(f"Comando no soportado en MemoryDB: {command}")
+        coll = self[value]
+        coll.options = {**(coll.options or {}), **kwargs}
+        return {"ok": 1.0}
+
+    def _rename(self, old: str, new: str) -> None:
+        from pymongo.errors import OperationFailure
+
+        with self._lock:
+            if new in self._collections and (self._collections[new]._docs or self._collections[new].options is not None):
+                raise OperationFailure(f"target namespace exists: {new}")
+            coll = self._collections.pop(old)
+            coll.name = new
+            self._collections[new] = coll
+
+    def drop_collection(self, name: str) -> None:
+        with self._lock:
+            self._collections.pop(name, None)
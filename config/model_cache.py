@@ -0,0 +1,121 @@
+"""Caché LRU en memoria de modelos ya deserializados.
+
+Cada entrada guarda el modelo junto con un token de versión barato de obtener
+(hash de contenido / `ultima_actualizacion` en MongoDB, mtime+tamaño en disco).
+Si el token coincide se reutiliza el objeto sin transferir ni deserializar el
+binario; si cambió, se recarga. Tamaño máximo configurable con MODEL_CACHE_SIZE.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional, Tuple
+
+
+class ModelCache:
+    """LRU thread-safe: key → (versión, modelo), con contadores de hits/misses/evictions."""
+
+    def __init__(self, maxsize: int = 16):
+        self.maxsize = max(1, int(maxsize))
+        self._data: "OrderedDict[Hashable, Tuple[object, object]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable, version) -> Optional[object]:
+        """Modelo cacheado si su versión coincide; None en otro caso (cuenta como miss)."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] == version:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                # versión vieja: se descarta
+                del self._data[key]
+                self.invalidations += 1
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, version, model) -> None:
+        with self._lock:
+            self._data[key] = (version, model)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_load(self, key: Hashable, version, loader: Callable[[], Tuple[object, object]]):
+        """Devuelve el modelo para (key, version) o lo carga con `loader` una sola vez.
+
+        `loader` retorna (versión_real, modelo); llamadas concurrentes para la misma
+        key esperan a la primera en vez de deserializar en paralelo.
+        """
+        model = self.get(key, version)
+        if model is not None:
+            return model
+        with self._lock:
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+        with load_lock:
+            with self._lock:
+                entry = self._data.get(key)
+                if entry is not None and entry[0] == version:
+                    self._data.move_to_end(key)
+                    return entry[1]
+            loaded_version, model = loader()
+            if model is not None:
+                self.put(key, loaded_version, model)
+            return model
+
+    def invalidate(self, key: Optional[Hashable] = None) -> None:
+        with self._lock:
+            if key is None:
+                self.invalidations += len(self._data)
+                self._data.clear()
+            elif self._data.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / total, 4) if total else None,
+            }
+
+
+model_cache = ModelCache(maxsize=int(os.environ.get("MODEL_CACHE_SIZE", "16")))
+
+
+def file_version(path: str):
+    """Token de versión de un archivo: (mtime_ns, tamaño); None si no existe."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def load_file_cached(path: str, loader: Callable[[str], object]):
+    """Carga `path` con `loader` reutilizando la instancia mientras el archivo no cambie."""
+    version = file_version(path)
+    if version is None:
+        return None
+
+    def _load():
+        return file_version(path), loader(path)
+
+    return model_cache.get_or_load(("fs", os.path.abspath(path)), version, _load)
+
+
+def cache_stats() -> dict:
+    """Contadores del caché compartido."""
+    return model_cache.stats()
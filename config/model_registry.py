@@ -0,0 +1,296 @@
+"""Registro versionado de modelos con promoción atómica y recarga en caliente.
+
+Estructura en disco (MODEL_REGISTRY_DIR, por defecto models/registry):
+
+    <NOMBRE>/versions/<version>/model.bin      artefacto (formato de config.model_store)
+    <NOMBRE>/versions/<version>/metadata.json  ventana de entrenamiento, tickers, métricas, esquema
+    <NOMBRE>/CURRENT.json                      puntero a la versión activa + historial
+
+Las versiones son inmutables: se escriben en un directorio temporal y se
+publican con un rename. El puntero se reemplaza con `os.replace`, así que un
+lector ve la versión anterior o la nueva, nunca un archivo a medio escribir.
+Los publicadores concurrentes (scripts/update_models.py y el auto-entrenamiento)
+se serializan con un lock de archivo.
+
+`get_current(nombre)` mantiene el modelo activo en memoria y detecta cambios del
+puntero con un `stat`; el primer hilo que ve una versión nueva la carga mientras
+los demás siguen respondiendo con la anterior.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from datetime import datetime
+from typing import List, Optional
+
+from config.model_store import deserialize, serialize
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin lock entre procesos
+    fcntl = None
+
+REGISTRY_DIR = os.environ.get("MODEL_REGISTRY_DIR", os.path.join("models", "registry"))
+
+
+def _name_dir(name: str) -> str:
+    return os.path.join(REGISTRY_DIR, name)
+
+
+def _pointer_path(name: str) -> str:
+    return os.path.join(_name_dir(name), "CURRENT.json")
+
+
+def _version_dir(name: str, version: str) -> str:
+    return os.path.join(_name_dir(name), "versions", version)
+
+
+@contextlib.contextmanager
+def _writer_lock(name: str):
+    os.makedirs(_name_dir(name), exist_ok=True)
+    with open(os.path.join(_name_dir(name), ".lock"), "a+") as fh:
+        if fcntl is not None:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+
+
+def _write_json_atomic(path: str, data: dict) -> None:
+    fd, tmp = tempfile.mkstemp(prefix=".tmp_", dir=os.path.dirname(path))
+    with os.fdopen(fd, "w", encoding="utf-8") as fh:
+        json.dump(data, fh, indent=2, default=str)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, path)
+
+
+def _read_pointer(name: str) -> dict:
+    try:
+        with open(_pointer_path(name), "r", encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def current_version(name: str) -> Optional[str]:
+    """Versión activa de `name` (None si nunca se promovió ninguna)."""
+    return _read_pointer(name).get("version")
+
+
+def list_versions(name: str) -> List[dict]:
+    """Metadatos de todas las versiones, de la más vieja a la más nueva."""
+    root = os.path.join(_name_dir(name), "versions")
+    if not os.path.isdir(root):
+        return []
+    out = []
+    for version in sorted(os.listdir(root)):
+        if version.startswith("."):
+            continue
+        meta = get_metadata(name, version)
+        if meta:
+            out.append(meta)
+    return out
+
+
+def get_metadata(name: str, version: Optional[str] = None) -> Optional[dict]:
+    version = version or current_version(name)
+    if not version:
+        return None
+    try:
+        with open(os.path.join(_version_dir(name, version), "metadata.json"), "r", encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def _set_pointer(name: str, version: str, reason: str) -> None:
+    pointer = _read_pointer(name)
+    history = pointer.get("history", [])
+    if pointer.get("version") and pointer["version"] != version:
+        history = (history + [pointer["version"]])[-50:]
+    _write_json_atomic(_pointer_path(name), {
+        "version": version,
+        "history": history,
+        "updated_at": datetime.now().isoformat(timespec="seconds"),
+        "reason": reason,
+    })
+
+
+def publish(name: str, model, metadata: Optional[dict] = None, promote: bool = True) -> str:
+    """Guarda `model` como versión nueva e inmutable de `name`; opcionalmente la promueve.
+
+    `metadata` suele incluir: training_window, tickers, metrics, feature_columns.
+    Retorna el identificador de versión.
+    """
+    formato, blob, digest = serialize(model)
+    created = datetime.now()
+    version = f"{created:%Y%m%dT%H%M%S%f}-{digest[:10]}"
+    with _writer_lock(name):
+        versions_root = os.path.join(_name_dir(name), "versions")
+        os.makedirs(versions_root, exist_ok=True)
+        tmp = tempfile.mkdtemp(prefix=".tmp_", dir=versions_root)
+        try:
+            with open(os.path.join(tmp, "model.bin"), "wb") as fh:
+                fh.write(blob)
+                fh.flush()
+                os.fsync(fh.fileno())
+            meta = dict(metadata or {})
+            meta.update({
+                "name": name,
+                "version": version,
+                "formato": formato,
+                "hash": digest,
+                "size": len(blob),
+                "created_at": created.isoformat(timespec="seconds"),
+            })
+            _write_json_atomic(os.path.join(tmp, "metadata.json"), meta)
+            os.rename(tmp, _version_dir(name, version))
+        except Exception:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        if promote:
+            _set_pointer(name, version, reason="publish")
+    return version
+
+
+def promote(name: str, version: str) -> None:
+    """Activa una versión existente (atómico)."""
+    if not os.path.isdir(_version_dir(name, version)):
+        raise ValueError(f"La versión {version} de {name} no existe.")
+    with _writer_lock(name):
+        _set_pointer(name, version, reason="promote")
+
+
+def rollback(name: str, steps: int = 1) -> str:
+    """Vuelve a la versión activa anterior (según el historial del puntero)."""
+    with _writer_lock(name):
+        pointer = _read_pointer(name)
+        history = pointer.get("history", [])
+        if len(history) < steps:
+            raise ValueError(f"No hay {steps} versión(es) anterior(es) de {name} para volver.")
+        target = history[-steps]
+        _write_json_atomic(_pointer_path(name), {
+            "version": target,
+            "history": history[:-steps],
+            "updated_at": datetime.now().isoformat(timespec="seconds"),
+            "reason": f"rollback desde {pointer.get('version')}",
+        })
+    return target
+
+
+def load(name: str, version: Optional[str] = None):
+    """Carga una versión concreta (por defecto la activa). None si no hay."""
+    version = version or current_version(name)
+    if not version:
+        return None
+    meta = get_metadata(name, version) or {}
+    with open(os.path.join(_version_dir(name, version), "model.bin"), "rb") as fh:
+        blob = fh.read()
+    if meta.get("hash") and meta.get("formato") == "joblib":
+        # verificación barata de integridad para el formato genérico
+        if hashlib.sha256(blob).hexdigest() != meta["hash"]:
+            raise ValueError(f"Artefacto corrupto: {name}@{version}")
+    return deserialize(meta.get("formato", "joblib"), blob)
+
+
+# ---- recarga en caliente -----------------------------------------------------
+
+_live = {}
+_live_lock = threading.Lock()
+
+
+def _pointer_stamp(name: str):
+    try:
+        st = os.stat(_pointer_path(name))
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def get_current(name: str):
+    """Modelo activo de `name`, recargado automáticamente cuando cambia el puntero.
+
+    No bloquea a los lectores mientras se carga una versión nueva: siguen usando
+    la anterior hasta que la nueva está lista. Retorna None si no hay versiones.
+    """
+    stamp = _pointer_stamp(name)
+    if stamp is None:
+        return None
+    with _live_lock:
+        entry = _live.setdefault(name, {"stamp": None, "version": None, "model": None, "loading": False})
+        if entry["stamp"] == stamp and entry["model"] is not None:
+            return entry["model"]
+        if entry["loading"] and entry["model"] is not None:
+            return entry["model"]
+        entry["loading"] = True
+        waiting_for_first = entry["model"] is None
+
+    try:
+        version = current_version(name)
+        model = entry["model"]
+        if version and version != entry["version"]:
+            model = load(name, version)
+        with _live_lock:
+            entry.update(stamp=stamp, version=version, model=model)
+        return model
+    except Exception as e:
+        print(f"[WARN] No se pudo recargar {name} desde el registro: {e}")
+        return entry["model"] if not waiting_for_first else None
+    finally:
+        with _live_lock:
+            entry["loading"] = False
+
+
+def live_versions() -> dict:
+    """Versión cargada en memoria por nombre (para diagnóstico)."""
+    with _live_lock:
+        return {name: e["version"] for name, e in _live.items()}
+
+
+# ---- compatibilidad con models/*.pkl --------------------------------------------
+
+
+def dump_atomic(model, path: str) -> None:
+    """joblib.dump a un temporal + os.replace: nadie lee un .pkl a medio escribir."""
+    import joblib
+
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=".tmp_", suffix=".pkl", dir=directory)
+    os.close(fd)
+    try:
+        joblib.dump(model, tmp)
+        os.replace(tmp, path)
+    except Exception:
+        with contextlib.suppress(OSError):
+            os.remove(tmp)
+        raise
+
+
+def load_for_training(name: str, legacy_path: Optional[str] = None):
+    """Copia nueva (no compartida) del modelo activo, para continuar entrenándolo.
+
+    Si el registro aún no tiene versiones, usa el .pkl heredado si existe.
+    """
+    try:
+        model = load(name)
+    except Exception as e:
+        print(f"[WARN] No se pudo cargar {name} desde el registro: {e}")
+        model = None
+    if model is None and legacy_path and os.path.exists(legacy_path):
+        import joblib
+
+        try:
+            model = joblib.load(legacy_path)
+        except Exception:
+            model = None
+    return model
@@ -0,0 +1,405 @@
+"""Almacenamiento compacto de modelos en MongoDB (y copias locales).
+
+Formatos:
+- "xgb_ubj": modelos XGBoost en el formato binario nativo del booster (UBJSON).
+- "mlp_npz": pipelines StandardScaler + MLPClassifier como arreglos NumPy
+  comprimidos (pesos, sesgos y estadísticas del scaler) más metadatos JSON.
+- "joblib": cualquier otro modelo, serializado con joblib comprimido.
+
+Cada artefacto lleva un hash de contenido: si el modelo no cambió no se vuelve a
+escribir. Los artefactos que superan MODEL_GRIDFS_THRESHOLD (bytes, 8 MB por
+defecto) se guardan en GridFS (bucket `modelos_fs`) en lugar de dentro del
+documento, evitando el límite de 16 MB.
+
+Al cargar, se guarda una copia local en MODEL_LOCAL_DIR (models/cache) en un
+formato que puede abrirse con memory-map (arreglos .npy), de modo que cargas
+posteriores no transfieren el binario desde MongoDB.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+from bson.binary import Binary
+
+from config.db import get_db
+from config.model_cache import model_cache
+from config.profiling import span
+
+GRIDFS_THRESHOLD = int(os.environ.get("MODEL_GRIDFS_THRESHOLD", str(8 * 1024 * 1024)))
+LOCAL_DIR = os.environ.get("MODEL_LOCAL_DIR", os.path.join("models", "cache"))
+GRIDFS_BUCKET = "modelos_fs"
+
+_XGB_MAGIC = b"XGBP"
+
+_META_FIELDS = {"_id": 0, "ticker": 1, "hash": 1, "formato": 1, "ultima_actualizacion": 1}
+
+
+# ---- serialización ------------------------------------------------------------
+
+
+def _is_xgb(model) -> bool:
+    try:
+        from xgboost import XGBModel
+    except Exception:
+        return False
+    return isinstance(model, XGBModel)
+
+
+def _is_mlp_pipeline(model) -> bool:
+    steps = getattr(model, "named_steps", None)
+    if not steps or set(steps) != {"scaler", "mlp"}:
+        return False
+    from sklearn.neural_network import MLPClassifier
+    from sklearn.preprocessing import StandardScaler
+
+    return isinstance(steps["scaler"], StandardScaler) and isinstance(steps["mlp"], MLPClassifier) and hasattr(steps["mlp"], "coefs_")
+
+
+def _mlp_arrays(pipe) -> Tuple[Dict[str, np.ndarray], dict]:
+    scaler = pipe.named_steps["scaler"]
+    mlp = pipe.named_steps["mlp"]
+    arrays = {
+        "scaler_mean": np.asarray(scaler.mean_),
+        "scaler_scale": np.asarray(scaler.scale_),
+        "scaler_var": np.asarray(scaler.var_),
+        "scaler_n_samples_seen": np.asarray(scaler.n_samples_seen_),
+        "classes": np.asarray(mlp.classes_),
+    }
+    for i, (w, b) in enumerate(zip(mlp.coefs_, mlp.intercepts_)):
+        arrays[f"coef_{i}"] = np.asarray(w)
+        arrays[f"intercept_{i}"] = np.asarray(b)
+    params = {k: v for k, v in mlp.get_params().items() if isinstance(v, (int, float, str, bool, type(None), tuple, list))}
+    meta = {
+        "n_layers": len(mlp.coefs_),
+        "mlp_params": params,
+        "scaler_params": scaler.get_params(),
+        "n_iter": int(getattr(mlp, "n_iter_", 0)),
+        "t": int(getattr(mlp, "t_", 0)),
+        "loss": float(getattr(mlp, "loss_", 0.0) or 0.0),
+        "best_loss": None if getattr(mlp, "best_loss_", None) is None else float(mlp.best_loss_),
+        "out_activation": mlp.out_activation_,
+        "feature_names": [str(c) for c in getattr(scaler, "feature_names_in_", [])],
+    }
+    return arrays, meta
+
+
+def _build_mlp(arrays, meta):
+    from sklearn.neural_network import MLPClassifier
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import LabelBinarizer, StandardScaler
+
+    scaler = StandardScaler(**meta["scaler_params"])
+    scaler.mean_ = arrays["scaler_mean"]
+    scaler.scale_ = arrays["scaler_scale"]
+    scaler.var_ = arrays["scaler_var"]
+    scaler.n_samples_seen_ = arrays["scaler_n_samples_seen"]
+    scaler.n_features_in_ = len(scaler.mean_)
+    if meta.get("feature_names"):
+        scaler.feature_names_in_ = np.asarray(meta["feature_names"], dtype=object)
+
+    params = dict(meta["mlp_params"])
+    if isinstance(params.get("hidden_layer_sizes"), list):
+        params["hidden_layer_sizes"] = tuple(params["hidden_layer_sizes"])
+    mlp = MLPClassifier(**params)
+    n = meta["n_layers"]
+    mlp.coefs_ = [arrays[f"coef_{i}"] for i in range(n)]
+    mlp.intercepts_ = [arrays[f"intercept_{i}"] for i in range(n)]
+    mlp.classes_ = np.asarray(arrays["classes"])
+    mlp._label_binarizer = LabelBinarizer().fit(mlp.classes_)
+    mlp.n_features_in_ = mlp.coefs_[0].shape[0]
+    mlp.n_layers_ = n + 1
+    mlp.n_outputs_ = mlp.coefs_[-1].shape[1]
+    mlp.out_activation_ = meta["out_activation"]
+    mlp.n_iter_ = meta["n_iter"]
+    mlp.t_ = meta["t"]
+    mlp.loss_ = meta["loss"]
+    mlp.best_loss_ = meta["best_loss"] if meta["best_loss"] is not None else np.inf
+    # estado mínimo para continuar entrenando con warm_start / partial_fit
+    mlp.loss_curve_ = []
+    mlp._no_improvement_count = 0
+    if mlp.early_stopping:
+        mlp.validation_scores_ = []
+        mlp.best_validation_score_ = -np.inf
+        mlp.best_loss_ = None
+    return Pipeline([("scaler", scaler), ("mlp", mlp)])
+
+
+def _content_hash(parts: Iterable[bytes]) -> str:
+    h = hashlib.sha256()
+    for p in parts:
+        h.update(p)
+    return h.hexdigest()
+
+
+def serialize(model) -> Tuple[str, bytes, str]:
+    """Retorna (formato, bytes, hash de contenido)."""
+    if _is_xgb(model):
+        # booster en formato nativo (UBJSON) precedido por un encabezado JSON corto
+        # con los hiperparámetros del wrapper, para reconstruirlo igual al cargar
+        params = {k: v for k, v in model.get_params().items() if isinstance(v, (int, float, str, bool, type(None)))}
+        header = json.dumps(params, sort_keys=True).encode()
+        raw = bytes(model.get_booster().save_raw("ubj"))
+        blob = _XGB_MAGIC + len(header).to_bytes(4, "little") + header + raw
+        # el hash cubre sólo el booster: el mismo modelo ajustado no se reescribe
+        return "xgb_ubj", blob, _content_hash([raw])
+    if _is_mlp_pipeline(model):
+        arrays, meta = _mlp_arrays(model)
+        meta_json = json.dumps(meta, sort_keys=True).encode()
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, __meta__=np.frombuffer(meta_json, dtype=np.uint8), **arrays)
+        digest = _content_hash([meta_json] + [k.encode() + np.ascontiguousarray(v).tobytes() for k, v in sorted(arrays.items())])
+        return "mlp_npz", buffer.getvalue(), digest
+    import joblib
+
+    buffer = io.BytesIO()
+    joblib.dump(model, buffer, compress=3)
+    blob = buffer.getvalue()
+    return "joblib", blob, _content_hash([blob])
+
+
+def _load_xgb(blob: bytes):
+    from xgboost import XGBClassifier
+
+    params = {}
+    if blob[:4] == _XGB_MAGIC:
+        size = int.from_bytes(blob[4:8], "little")
+        params = json.loads(blob[8:8 + size].decode())
+        blob = blob[8 + size:]
+    model = XGBClassifier(**params)
+    model.load_model(bytearray(blob))
+    return model
+
+
+def deserialize(formato: str, blob: bytes):
+    """Inversa de `serialize`."""
+    if formato == "xgb_ubj":
+        return _load_xgb(bytearray(blob))
+    if formato == "mlp_npz":
+        with np.load(io.BytesIO(blob)) as data:
+            arrays = {k: data[k] for k in data.files if k != "__meta__"}
+            meta = json.loads(bytes(data["__meta__"]).decode())
+        return _build_mlp(arrays, meta)
+    import joblib
+
+    return joblib.load(io.BytesIO(blob))
+
+
+# ---- copias locales -------------------------------------------------------------
+
+
+def _local_path(key: str, digest: str) -> str:
+    safe = "".join(ch if ch.isalnum() or ch in "-_." else "_" for ch in key)
+    return os.path.join(LOCAL_DIR, safe, digest)
+
+
+def _write_local(key: str, digest: str, formato: str, blob: bytes, model) -> None:
+    """Guarda una copia local apta para memory-map (escritura atómica por directorio)."""
+    final = _local_path(key, digest)
+    if os.path.isdir(final):
+        return
+    parent = os.path.dirname(final)
+    os.makedirs(parent, exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix=".tmp_", dir=parent)
+    try:
+        if formato == "mlp_npz":
+            arrays, meta = _mlp_arrays(model)
+            for name, arr in arrays.items():
+                np.save(os.path.join(tmp, name + ".npy"), arr)
+            with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as fh:
+                json.dump(meta, fh)
+        else:
+            with open(os.path.join(tmp, "model.bin"), "wb") as fh:
+                fh.write(blob)
+        with open(os.path.join(tmp, "formato"), "w", encoding="utf-8") as fh:
+            fh.write(formato)
+        os.replace(tmp, final)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+    # limpia versiones anteriores del mismo modelo
+    for other in os.listdir(parent):
+        path = os.path.join(parent, other)
+        if path != final and not other.startswith(".tmp_"):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def _read_local(key: str, digest: str):
+    path = _local_path(key, digest)
+    with span("copia_local"):
+        try:
+            with open(os.path.join(path, "formato"), "r", encoding="utf-8") as fh:
+                formato = fh.read().strip()
+            if formato == "mlp_npz":
+                with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as fh:
+                    meta = json.load(fh)
+                arrays = {
+                    f[:-4]: np.load(os.path.join(path, f), mmap_mode="c")
+                    for f in os.listdir(path)
+                    if f.endswith(".npy")
+                }
+                return _build_mlp(arrays, meta)
+            with open(os.path.join(path, "model.bin"), "rb") as fh:
+                return deserialize(formato, fh.read())
+        except (OSError, ValueError, KeyError):
+            return None
+
+
+# ---- MongoDB / GridFS ---------------------------------------------------------
+
+
+def _bucket(db):
+    """GridFSBucket si `db` es una base pymongo real (None con sustitutos en memoria)."""
+    try:
+        from gridfs import GridFSBucket
+        from pymongo.database import Database
+    except Exception:
+        return None
+    return GridFSBucket(db, bucket_name=GRIDFS_BUCKET) if isinstance(db, Database) else None
+
+
+def save_model(key: str, model, metadata: Optional[dict] = None) -> bool:
+    """Guarda `model` bajo `key` en modelos_binarios. Retorna False si no cambió (no escribe)."""
+    db = get_db()
+    formato, blob, digest = serialize(model)
+    actual = db.modelos_binarios.find_one({"ticker": key}, _META_FIELDS)
+    if actual and actual.get("hash") == digest:
+        model_cache.put(("mongo", key), digest, model)
+        if metadata:
+            db.modelos_binarios.update_one({"ticker": key}, {"$set": {"metadata": metadata}})
+        return False
+
+    doc = {
+        "ticker": key,
+        "formato": formato,
+        "hash": digest,
+        "tamano": len(blob),
+        "ultima_actualizacion": datetime.now(),
+    }
+    if metadata:
+        doc["metadata"] = metadata
+    bucket = _bucket(db) if len(blob) > GRIDFS_THRESHOLD else None
+    if bucket is not None:
+        doc["gridfs_id"] = bucket.upload_from_stream(f"{key}-{digest}", blob, metadata={"ticker": key, "hash": digest})
+    else:
+        doc["modelo"] = Binary(blob)
+
+    previo = db.modelos_binarios.find_one_and_replace({"ticker": key}, doc, upsert=True)
+    # el archivo GridFS anterior se borra después de publicar el nuevo documento
+    if previo and previo.get("gridfs_id") is not None:
+        old_bucket = _bucket(db)
+        if old_bucket is not None:
+            try:
+                old_bucket.delete(previo["gridfs_id"])
+            except Exception:
+                pass
+    model_cache.put(("mongo", key), digest, model)
+    _write_local(key, digest, formato, blob, model)
+    return True
+
+
+def _blob_from_doc(db, doc) -> Optional[bytes]:
+    if doc.get("modelo") is not None:
+        return bytes(doc["modelo"])
+    if doc.get("gridfs_id") is not None:
+        bucket = _bucket(db)
+        if bucket is not None:
+            return bucket.open_download_stream(doc["gridfs_id"]).read()
+    return None
+
+
+def _load_from_doc(db, doc):
+    key = doc["ticker"]
+    digest = doc.get("hash")
+    formato = doc.get("formato", "joblib")
+    if digest:
+        model = _read_local(key, digest)
+        if model is not None:
+            return model
+    with span("descarga"):
+        blob = _blob_from_doc(db, doc)
+    if blob is None:
+        return None
+    with span("deserializar", formato=formato):
+        model = deserialize(formato, blob)
+    if digest:
+        _write_local(key, digest, formato, blob, model)
+    return model
+
+
+def _version(meta) -> object:
+    return meta.get("hash") or meta.get("ultima_actualizacion")
+
+
+def load_model(key: str):
+    """Carga el modelo `key` (None si no existe).
+
+    Orden: caché en memoria → copia local por hash → binario en MongoDB/GridFS.
+    """
+    db = get_db()
+    meta = db.modelos_binarios.find_one({"ticker": key}, _META_FIELDS)
+    if not meta:
+        return None
+    if meta.get("hash"):
+        # la copia local hace innecesario descargar el binario
+        def _load():
+            model = _read_local(key, meta["hash"])
+            if model is None:
+                doc = db.modelos_binarios.find_one({"ticker": key})
+                if not doc:
+                    return None, None
+                return _version(doc), _load_from_doc(db, doc)
+            return meta["hash"], model
+    else:
+        def _load():
+            doc = db.modelos_binarios.find_one({"ticker": key})
+            if not doc:
+                return None, None
+            return _version(doc), _load_from_doc(db, doc)
+
+    return model_cache.get_or_load(("mongo", key), _version(meta), _load)
+
+
+def load_models(keys) -> Dict[str, object]:
+    """Carga varios modelos con una consulta de versiones y una de binarios (sólo los que faltan)."""
+    db = get_db()
+    keys = list(keys)
+    modelos, pendientes = {}, []
+    for meta in db.modelos_binarios.find({"ticker": {"$in": keys}}, _META_FIELDS):
+        key = meta["ticker"]
+        model = model_cache.get(("mongo", key), _version(meta))
+        if model is None and meta.get("hash"):
+            model = _read_local(key, meta["hash"])
+            if model is not None:
+                model_cache.put(("mongo", key), meta["hash"], model)
+        if model is not None:
+            modelos[key] = model
+        else:
+            pendientes.append(key)
+    if pendientes:
+        for doc in db.modelos_binarios.find({"ticker": {"$in": pendientes}}):
+            model = _load_from_doc(db, doc)
+            if model is not None:
+                model_cache.put(("mongo", doc["ticker"]), _version(doc), model)
+                modelos[doc["ticker"]] = model
+    return modelos
+
+
+def load_metadata(keys) -> Dict[str, dict]:
+    """Metadatos guardados con cada modelo ({key: metadata}), sin descargar binarios."""
+    db = get_db()
+    out = {}
+    for doc in db.modelos_binarios.find(
+        {"ticker": {"$in": list(keys)}}, {"_id": 0, "ticker": 1, "metadata": 1, "ultima_actualizacion": 1}
+    ):
+        meta = dict(doc.get("metadata") or {})
+        meta.setdefault("ultima_actualizacion", doc.get("ultima_actualizacion"))
+        out[doc["ticker"]] = meta
+    return out
@@ -0,0 +1,167 @@
+"""Medición liviana de tiempos por etapa (spans) y modo `--profile` de las CLIs.
+
+- `span("etapa")` (context manager) y `@timed("etapa")` miden con
+  `perf_counter` y acumulan en un registro en memoria: cantidad, total y máximo
+  por etapa. Los spans anidados se nombran con la ruta completa
+  ("smart_recommendation/modelo"), por hilo.
+- Con `PROFILE_LOG=1` cada span cerrado se emite además como una línea JSON en
+  stderr: {"span", "ms", "ok", ...atributos}.
+- `add_profile_args(parser)` + `profiling_session(args)` dan a las CLIs un
+  `--profile` que imprime el desglose al terminar y un `--cprofile ARCHIVO` que
+  guarda la salida de cProfile (se lee con `python -m pstats ARCHIVO`).
+"""
+
+from __future__ import annotations
+
+import contextlib
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from typing import Dict, Optional
+
+JSON_LOG = os.environ.get("PROFILE_LOG", "0").lower() in ("1", "true", "yes")
+
+_stats: Dict[str, list] = {}  # ruta → [cantidad, total_s, max_s, errores]
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def _stack() -> list:
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def _record(path: str, seconds: float, ok: bool) -> None:
+    with _lock:
+        entry = _stats.setdefault(path, [0, 0.0, 0.0, 0])
+        entry[0] += 1
+        entry[1] += seconds
+        if seconds > entry[2]:
+            entry[2] = seconds
+        if not ok:
+            entry[3] += 1
+
+
+@contextlib.contextmanager
+def span(name: str, **attrs):
+    """Mide el bloque como la etapa `name` (anidada bajo el span abierto del hilo, si hay)."""
+    stack = _stack()
+    path = f"{stack[-1]}/{name}" if stack else name
+    stack.append(path)
+    if path not in _stats:
+        # se registra al abrir, así el desglose sigue el orden de aparición
+        with _lock:
+            _stats.setdefault(path, [0, 0.0, 0.0, 0])
+    ok = True
+    t0 = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        ok = False
+        raise
+    finally:
+        seconds = time.perf_counter() - t0
+        stack.pop()
+        _record(path, seconds, ok)
+        if JSON_LOG:
+            line = {"span": path, "ms": round(seconds * 1000, 3), "ok": ok, **attrs}
+            print(json.dumps(line, default=str), file=sys.stderr)
+
+
+def timed(name: Optional[str] = None):
+    """Decorador: cada llamada a la función es un span (por defecto con su nombre)."""
+    def deco(fn):
+        etapa = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(etapa):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+def snapshot() -> Dict[str, dict]:
+    """Copia del registro: {ruta: {"count", "total_ms", "mean_ms", "max_ms", "errors"}}."""
+    with _lock:
+        items = [(path, list(entry)) for path, entry in _stats.items()]
+    return {
+        path: {
+            "count": count,
+            "total_ms": round(total * 1000, 3),
+            "mean_ms": round(total / count * 1000, 3),
+            "max_ms": round(peak * 1000, 3),
+            "errors": errors,
+        }
+        for path, (count, total, peak, errors) in items
+        if count
+    }
+
+
+def reset() -> None:
+    with _lock:
+        _stats.clear()
+
+
+def report(file=None) -> None:
+    """Imprime el desglose por etapa; el % es respecto del span raíz de cada árbol."""
+    file = file or sys.stdout
+    datos = snapshot()
+    if not datos:
+        print("[INFO] Sin spans registrados.", file=file)
+        return
+    # cada etapa debajo de su padre; hermanos en orden de aparición
+    posicion = {path: i for i, path in enumerate(datos)}
+    partes = {path: path.split("/") for path in datos}
+    orden = sorted(datos, key=lambda p: [posicion.get("/".join(partes[p][:k + 1]), -1) for k in range(len(partes[p]))])
+    ancho = max(len("  " * p.count("/") + p.rsplit("/", 1)[-1]) for p in orden)
+    print(f"{'etapa':<{ancho}}  {'n':>6}  {'total ms':>11}  {'media ms':>10}  {'max ms':>10}  {'%':>6}", file=file)
+    for path in orden:
+        d = datos[path]
+        raiz = datos.get(path.split("/", 1)[0])
+        pct = f"{100.0 * d['total_ms'] / raiz['total_ms']:>5.1f}%" if raiz and raiz["total_ms"] else f"{'-':>6}"
+        etiqueta = "  " * path.count("/") + path.rsplit("/", 1)[-1]
+        errores = f"  ({d['errors']} con error)" if d["errors"] else ""
+        print(
+            f"{etiqueta:<{ancho}}  {d['count']:>6}  {d['total_ms']:>11.1f}  {d['mean_ms']:>10.2f}"
+            f"  {d['max_ms']:>10.2f}  {pct}{errores}",
+            file=file,
+        )
+
+
+def add_profile_args(parser) -> None:
+    """Agrega `--profile` y `--cprofile ARCHIVO` a un argparse.ArgumentParser."""
+    parser.add_argument("--profile", action="store_true", help="Imprime el tiempo por etapa al terminar")
+    parser.add_argument("--cprofile", metavar="ARCHIVO", default=None, help="Guarda la salida de cProfile en ARCHIVO")
+
+
+@contextlib.contextmanager
+def profiling_session(args, name: Optional[str] = "total"):
+    """Envuelve la ejecución de una CLI según `--profile`/`--cprofile`.
+
+    `name` es el span raíz de toda la ejecución (None: sin span raíz).
+    """
+    profile = getattr(args, "profile", False)
+    cprofile_path = getattr(args, "cprofile", None)
+    profiler = None
+    if cprofile_path:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        with span(name) if name else contextlib.nullcontext():
+            yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(cprofile_path)
+            print(f"[INFO] cProfile guardado en {cprofile_path} (python -m pstats {cprofile_path})")
+        if profile and snapshot():
+            print()
+            report()
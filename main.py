@@ -2,16 +2,33 @@
 
 Permite consultar un ticker, ver datos básicos y usar modelos ML
 (locales o globales) para obtener una recomendación.
+
+Con `--profile` imprime, después de cada ticker, cuánto tardó cada etapa
+(descarga, carga de modelo, features, predicción, escrituras); con
+`--cprofile ARCHIVO` guarda además la salida de cProfile de toda la sesión.
+
+Las dependencias pesadas (pandas, yfinance, pymongo, xgboost, scikit-learn) se
+importan recién cuando la acción elegida las necesita, así el primer prompt
+aparece enseguida.
 """
 
-from services.stocks import get_stock_info, get_price_history
-from ml.recomendacion import basic_recommendation, smart_recommendation
-from config.db import get_db
+import argparse
+
+from config import profiling
 
 
 def main():
     """Bucle principal de interacción por consola."""
+    parser = argparse.ArgumentParser(description="Asesor de inversiones por consola")
+    profiling.add_profile_args(parser)
+    args = parser.parse_args()
+
     print("=== ASESOR DE INVERSIONES ===")
+    with profiling.profiling_session(args, name=None):
+        _loop(args.profile)
+
+
+def _loop(profile: bool):
     while True:
         ticker = input("\nIngresa el símbolo de una acción (o 'salir'): ").strip()
         if not ticker:
@@ -21,6 +38,8 @@ def main():
         ticker = ticker.upper()
 
         try:
+            from services.stocks import get_stock_info
+
             info = get_stock_info(ticker)
             if not info:
                 print(f"No se pudo obtener información para el ticker: {ticker}")
@@ -34,6 +53,8 @@ def main():
 
             ver_grafico = input("\n¿Ver gráfico de últimos 30 días? (s/n): ").strip().lower()
             if ver_grafico == "s":
+                from services.stocks import get_price_history
+
                 serie = get_price_history(ticker, period="30d")
                 if serie is not None and not serie.empty:
                     try:
@@ -46,6 +67,8 @@ def main():
                     except Exception as e:
                         print(f"No se pudo mostrar el gráfico: {e}")
 
+            from ml.recomendacion import basic_recommendation, smart_recommendation
+
             recomendacion = basic_recommendation(info.get("change"))
             print(f"\nRecomendación básica: {recomendacion}")
 
@@ -79,6 +102,8 @@ def main():
 
                 decision = input("¿Qué hiciste? (compré / no compré / skip): ").strip().lower()
                 if decision in ["compré", "no compré"]:
+                    from config.db import get_db
+
                     db = get_db()
                     db.acciones_usuario.update_one(
                         {"ticker": ticker, "decision_usuario": None},
@@ -87,6 +112,11 @@ def main():
         except Exception as e:
             print(f"Ocurrió un error al procesar el ticker {ticker}: {e}")
             continue
+        finally:
+            if profile:
+                print(f"\n--- Tiempos por etapa ({ticker}) ---")
+                profiling.report()
+                profiling.reset()
 
 
 if __name__ == "__main__":
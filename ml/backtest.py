@@ -0,0 +1,331 @@
+"""Backtest walk-forward de los modelos (local_xgb, global_xgb, global_mlp).
+
+- Features con ml/features.py (las mismas que en entrenamiento y predicción).
+- Los modelos se reentrenan cada `retrain_every` barras con todo el pasado
+  disponible y puntúan el tramo siguiente con un único `predict_proba`.
+- Todos los umbrales se evalúan a la vez con NumPy: tasa de acierto, precisión,
+  retorno medio por operación y curva de capital por umbral.
+- Los modelos locales se calculan en paralelo por ticker (pool de procesos).
+- Los puntajes se guardan en caché (`data/backtests/`) con una clave que incluye
+  la última barra de cada ticker, los parámetros y el esquema de features, así
+  que repetir el backtest o cambiar umbrales no vuelve a entrenar nada.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import multiprocessing as mp
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+from config.profiling import span, timed
+from ml.features import FEATURE_COLUMNS, add_basic_features, make_supervised, supervised_panel_from_frames
+from services.bar_store import get_history_many
+
+CACHE_DIR = os.environ.get("BACKTEST_CACHE_DIR", os.path.join("data", "backtests"))
+# se incrementa cuando cambia la lógica de puntaje, para invalidar cachés viejos
+CACHE_VERSION = 1
+
+MODEL_TYPES = ("local_xgb", "global_xgb", "global_mlp")
+DEFAULT_THRESHOLDS = np.round(np.arange(0.30, 0.801, 0.01), 2)
+
+XGB_PARAMS = dict(
+    n_estimators=1000,
+    learning_rate=0.05,
+    max_depth=5,
+    subsample=0.8,
+    colsample_bytree=0.8,
+    reg_lambda=1.0,
+    gamma=0.0,
+    objective="binary:logistic",
+    eval_metric="auc",
+    early_stopping_rounds=50,
+    random_state=42,
+)
+
+
+class BacktestResult(NamedTuple):
+    """scores: una fila por (Date, ticker) con score, y, ret.
+    metrics: una fila por umbral. curves: capital acumulado (fechas × umbrales)."""
+
+    scores: pd.DataFrame
+    metrics: pd.DataFrame
+    curves: pd.DataFrame
+
+
+# ---- datos ----------------------------------------------------------------------
+
+
+def _labeled_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Features + Target + retorno de la barra siguiente; sin la última barra (etiqueta desconocida)."""
+    out = make_supervised(add_basic_features(df), up_pct=0.01)
+    out["ret"] = out["Close"].shift(-1) / out["Close"] - 1.0
+    return out.iloc[:-1]
+
+
+def _schedule(n: int, min_train: int, retrain_every: int) -> List[int]:
+    """Posiciones donde se reentrena (cada modelo puntúa hasta la siguiente)."""
+    return list(range(min_train, n, retrain_every))
+
+
+def _scale_pos_weight(y) -> float:
+    pos = int((np.asarray(y) == 1).sum())
+    neg = int((np.asarray(y) == 0).sum())
+    return 1.0 if pos == 0 else max(1.0, neg / max(1, pos))
+
+
+def _fit_xgb(X: pd.DataFrame, y: pd.Series, nthread: int):
+    """Mismo esquema que ml/trainer.py: 80/20 temporal y early stopping."""
+    from xgboost import XGBClassifier
+
+    split = int(len(X) * 0.8)
+    model = XGBClassifier(**XGB_PARAMS, scale_pos_weight=_scale_pos_weight(y.iloc[:split]), n_jobs=nthread)
+    with warnings.catch_warnings():
+        # ventanas cortas pueden tener una validación con una sola clase (AUC indefinida)
+        warnings.simplefilter("ignore", UserWarning)
+        model.fit(X.iloc[:split], y.iloc[:split], eval_set=[(X.iloc[split:], y.iloc[split:])], verbose=False)
+    return model
+
+
+def _fit_mlp(X: pd.DataFrame, y: pd.Series):
+    from sklearn.exceptions import ConvergenceWarning
+    from sklearn.neural_network import MLPClassifier
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import StandardScaler
+
+    pipe = Pipeline([
+        ("scaler", StandardScaler()),
+        ("mlp", MLPClassifier(hidden_layer_sizes=(64, 32), activation="relu", solver="adam", alpha=1e-4,
+                              batch_size=128, learning_rate_init=1e-3, max_iter=50, random_state=42)),
+    ])
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", ConvergenceWarning)
+        pipe.fit(X, y)
+    return pipe
+
+
+# ---- caché ----------------------------------------------------------------------
+
+
+def _cache_key(parts: dict) -> str:
+    payload = json.dumps({**parts, "v": CACHE_VERSION, "features": FEATURE_COLUMNS}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:24]
+
+
+def _cache_path(kind: str, key: str) -> str:
+    return os.path.join(CACHE_DIR, kind, f"{key}.pkl")
+
+
+def _cache_get(kind: str, key: str) -> Optional[pd.DataFrame]:
+    path = _cache_path(kind, key)
+    if not os.path.exists(path):
+        return None
+    try:
+        return pd.read_pickle(path)
+    except Exception:
+        return None
+
+
+def _cache_put(kind: str, key: str, df: pd.DataFrame) -> None:
+    path = _cache_path(kind, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp{os.getpid()}"
+    df.to_pickle(tmp)
+    os.replace(tmp, path)
+
+
+# ---- puntajes walk-forward --------------------------------------------------------
+
+
+def _score_local(ticker: str, df: pd.DataFrame, min_train: int, retrain_every: int, nthread: int) -> pd.DataFrame:
+    """Walk-forward de un modelo local: un ajuste y un predict_proba por tramo."""
+    data = _labeled_frame(df)
+    X, y = data[FEATURE_COLUMNS], data["Target"]
+    parts = []
+    cuts = _schedule(len(data), min_train, retrain_every)
+    for start, end in zip(cuts, cuts[1:] + [len(data)]):
+        if y.iloc[:start].nunique() < 2:
+            continue
+        model = _fit_xgb(X.iloc[:start], y.iloc[:start], nthread)
+        parts.append(pd.DataFrame({
+            "Date": data.index[start:end],
+            "ticker": ticker,
+            "score": model.predict_proba(X.iloc[start:end])[:, 1],
+            "y": y.iloc[start:end].to_numpy(),
+            "ret": data["ret"].iloc[start:end].to_numpy(),
+        }))
+    if not parts:
+        return pd.DataFrame(columns=["Date", "ticker", "score", "y", "ret"])
+    return pd.concat(parts, ignore_index=True)
+
+
+def _score_local_task(args) -> pd.DataFrame:
+    return _score_local(*args)
+
+
+def _scores_local(frames: Dict[str, pd.DataFrame], min_train: int, retrain_every: int, n_jobs: Optional[int]):
+    cpus = os.cpu_count() or 1
+    results, pendientes = {}, []
+    for t, df in frames.items():
+        key = _cache_key({"t": t, "last": df.index[-1], "n": len(df), "m": min_train, "r": retrain_every,
+                          "p": XGB_PARAMS})
+        cached = _cache_get("local_xgb", key)
+        if cached is not None:
+            results[t] = cached
+        else:
+            pendientes.append((t, key))
+
+    n_jobs = max(1, min(n_jobs or cpus, len(pendientes) or 1, cpus))
+    nthread = max(1, cpus // n_jobs)
+    tasks = [(t, frames[t], min_train, retrain_every, nthread) for t, _ in pendientes]
+    if n_jobs == 1:
+        computed = map(_score_local_task, tasks)
+        pool = None
+    else:
+        # spawn: fork después de inicializar OpenMP (XGBoost) puede colgar al hijo
+        pool = ProcessPoolExecutor(max_workers=n_jobs, mp_context=mp.get_context("spawn"))
+        computed = pool.map(_score_local_task, tasks)
+    try:
+        for (t, key), scores in zip(pendientes, computed):
+            _cache_put("local_xgb", key, scores)
+            results[t] = scores
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return pd.concat([results[t] for t in frames if t in results], ignore_index=True)
+
+
+def _scores_global(model_type: str, frames: Dict[str, pd.DataFrame], min_train: int, retrain_every: int):
+    """Walk-forward de un modelo global: cortes por fecha sobre el panel de todos los tickers."""
+    key = _cache_key({"model": model_type, "frames": sorted((t, df.index[-1], len(df)) for t, df in frames.items()),
+                      "m": min_train, "r": retrain_every, "p": XGB_PARAMS if model_type == "global_xgb" else "mlp"})
+    cached = _cache_get(model_type, key)
+    if cached is not None:
+        return cached
+
+    panel = supervised_panel_from_frames(frames, up_pct=0.01)
+    close = panel["Close"]
+    panel = panel.assign(ret=close.groupby(level="ticker").shift(-1) / close - 1.0)
+    # sin la última barra de cada ticker (etiqueta desconocida)
+    panel = panel[panel["ret"].notna()].reset_index().sort_values(["Date", "ticker"], kind="stable")
+    dates = np.sort(panel["Date"].unique())
+    date_pos = np.searchsorted(dates, panel["Date"].to_numpy())
+    X, y = panel[FEATURE_COLUMNS], panel["Target"].astype(int)
+
+    parts = []
+    cuts = _schedule(len(dates), min_train, retrain_every)
+    for start, end in zip(cuts, cuts[1:] + [len(dates)]):
+        train = date_pos < start
+        test = (date_pos >= start) & (date_pos < end)
+        if y[train].nunique() < 2 or not test.any():
+            continue
+        if model_type == "global_xgb":
+            model = _fit_xgb(X[train], y[train], os.cpu_count() or 1)
+        else:
+            model = _fit_mlp(X[train], y[train])
+        parts.append(pd.DataFrame({
+            "Date": panel["Date"].to_numpy()[test],
+            "ticker": panel["ticker"].to_numpy()[test],
+            "score": model.predict_proba(X[test])[:, 1],
+            "y": y.to_numpy()[test],
+            "ret": panel["ret"].to_numpy()[test],
+        }))
+    scores = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(
+        columns=["Date", "ticker", "score", "y", "ret"])
+    _cache_put(model_type, key, scores)
+    return scores
+
+
+# ---- evaluación por umbral (vectorizada) -----------------------------------------------
+
+
+def evaluate_thresholds(scores: pd.DataFrame, thresholds=DEFAULT_THRESHOLDS):
+    """Métricas y curvas de capital para todos los umbrales a la vez.
+
+    Estrategia: cada fecha se compra (igual ponderación) cada ticker con score >= umbral
+    y se vende en la barra siguiente. Retorna (metrics, curves).
+    """
+    thresholds = np.asarray(thresholds, dtype=float)
+    s = scores["score"].to_numpy(dtype=float)
+    y = scores["y"].to_numpy(dtype=bool)
+    ret = scores["ret"].to_numpy(dtype=float)
+    dates, date_codes = np.unique(scores["Date"].to_numpy(), return_inverse=True)
+
+    signals = s[None, :] >= thresholds[:, None]  # (umbrales × filas)
+    trades = signals.sum(axis=1)
+    positives = max(int(y.sum()), 1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        precision = (signals & y).sum(axis=1) / trades
+        hit_rate = (signals & (ret > 0)).sum(axis=1) / trades
+        mean_ret = (signals * ret).sum(axis=1) / trades
+    recall = (signals & y).sum(axis=1) / positives
+
+    # retorno diario del portafolio por umbral: promedio de los tickers con señal en cada fecha
+    n_dates = len(dates)
+    offsets = (np.arange(len(thresholds)) * n_dates)[:, None] + date_codes[None, :]
+    size = len(thresholds) * n_dates
+    sum_ret = np.bincount(offsets.ravel(), weights=(signals * ret).ravel(), minlength=size).reshape(-1, n_dates)
+    count = np.bincount(offsets.ravel(), weights=signals.ravel(), minlength=size).reshape(-1, n_dates)
+    daily = np.divide(sum_ret, count, out=np.zeros_like(sum_ret), where=count > 0)
+    equity = np.cumprod(1.0 + daily, axis=1)
+    drawdown = equity / np.maximum.accumulate(equity, axis=1) - 1.0
+    std = daily.std(axis=1)
+    sharpe = np.divide(daily.mean(axis=1) * np.sqrt(252), std, out=np.zeros_like(std), where=std > 0)
+
+    metrics = pd.DataFrame({
+        "umbral": thresholds,
+        "operaciones": trades,
+        "precision": precision,
+        "tasa_acierto": hit_rate,
+        "recall": recall,
+        "retorno_medio": mean_ret,
+        "retorno_total": equity[:, -1] - 1.0 if n_dates else np.zeros(len(thresholds)),
+        "sharpe": sharpe,
+        "max_drawdown": drawdown.min(axis=1) if n_dates else np.zeros(len(thresholds)),
+    }).set_index("umbral")
+    curves = pd.DataFrame(equity.T, index=pd.DatetimeIndex(dates, name="Date"), columns=thresholds)
+    return metrics, curves
+
+
+@timed("backtest")
+def backtest(
+    tickers: List[str],
+    model_type: str = "local_xgb",
+    period: str = "5y",
+    retrain_every: int = 63,
+    min_train: int = 252,
+    thresholds=DEFAULT_THRESHOLDS,
+    n_jobs: Optional[int] = None,
+) -> BacktestResult:
+    """Backtest walk-forward de `model_type` sobre `tickers`.
+
+    - retrain_every: barras (o fechas, en modelos globales) entre reentrenamientos.
+    - min_train: barras mínimas antes del primer modelo.
+    """
+    if model_type not in MODEL_TYPES:
+        raise ValueError(f"Tipo de modelo no soportado: {model_type}")
+    with span("historial"):
+        historias = get_history_many([t.upper() for t in tickers], period=period)
+    frames = {t: df for t, df in historias.items() if df is not None and len(df) > min_train + 20}
+    for t in historias:
+        if t not in frames:
+            print(f"[WARN] {t}: historial insuficiente para el backtest")
+    if not frames:
+        raise ValueError("Ningún ticker tiene historial suficiente para el backtest.")
+
+    with span("puntajes", modelo=model_type, tickers=len(frames)):
+        if model_type == "local_xgb":
+            scores = _scores_local(frames, min_train, retrain_every, n_jobs)
+        else:
+            scores = _scores_global(model_type, frames, min_train, retrain_every)
+    if scores.empty:
+        raise ValueError("El backtest no generó predicciones (¿muy pocas barras?).")
+    with span("umbrales"):
+        metrics, curves = evaluate_thresholds(scores, thresholds)
+    return BacktestResult(scores=scores, metrics=metrics, curves=curves)
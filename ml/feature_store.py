@@ -0,0 +1,355 @@
+"""Almacén persistente de features por (ticker, fecha) y versión del esquema.
+
+Las filas de ml/features.py se calculan una vez y se guardan en disco, un
+archivo por ticker (Parquet si hay motor, igual que services/bar_store.py) en
+`<FEATURE_STORE_DIR>/<esquema>/`. El esquema es un hash de `FEATURE_COLUMNS`,
+`FEATURE_LOOKBACK` y el código de las funciones de features (su árbol
+sintáctico: comentarios, espacios y docstrings no cuentan): si cualquiera
+cambia, el directorio es otro y las filas viejas dejan de usarse. Los
+directorios de esquemas anteriores no se borran solos, porque otro proceso
+puede seguir usándolos; se eliminan con `python -m scripts.features cleanup`.
+
+Al pedir features para unas barras sólo se recalcula desde la primera barra
+nueva o distinta de la guardada (p. ej. la barra del día todavía abierta),
+con `FEATURE_LOOKBACK` barras de contexto. Como las ventanas se calculan de
+forma independiente (add_panel_features), el resultado es idéntico al de
+recalcular todo el historial.
+
+Lo usan el entrenamiento local y global, la recomendación en lote y el
+auto-entrenamiento, que resuelve las referencias (`feature_ref`) guardadas
+en `acciones_usuario` en lugar de copias de las features y descarta las que ya
+no reproducen el vector puntuado (`feature_hash`).
+"""
+
+from __future__ import annotations
+
+import ast
+import hashlib
+import inspect
+import json
+import os
+import re
+import shutil
+import textwrap
+import threading
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+from config.profiling import span
+from ml import features as _features
+from ml.features import (
+    FEATURE_COLUMNS,
+    FEATURE_LOOKBACK,
+    add_panel_features,
+    make_supervised_panel,
+    to_panel,
+)
+from services.bar_store import OHLCV_COLUMNS, _normalize, _parquet_available
+
+DEFAULT_ROOT = os.environ.get("FEATURE_STORE_DIR", os.path.join("data", "features"))
+# funciones cuyo código define los valores guardados
+_SCHEMA_CODE = ("add_basic_features", "to_panel", "_group_positions", "_rolling", "add_panel_features")
+# posición de cada columna OHLCV dentro de FEATURE_COLUMNS (seleccionar columnas en pandas es caro)
+_OHLCV_POS = [FEATURE_COLUMNS.index(c) for c in OHLCV_COLUMNS]
+
+
+def _normalized_source(source: str) -> str:
+    """Árbol sintáctico del código sin comentarios, espacios ni docstrings."""
+    tree = ast.parse(textwrap.dedent(source))
+    for node in ast.walk(tree):
+        body = getattr(node, "body", None)
+        if (
+            isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Module))
+            and body
+            and isinstance(body[0], ast.Expr)
+            and isinstance(body[0].value, ast.Constant)
+            and isinstance(body[0].value.value, str)
+        ):
+            node.body = body[1:] or [ast.Pass()]
+    return ast.dump(tree)
+
+
+def _code_fingerprint(code) -> str:
+    """Bytecode y constantes (recursivo) cuando no hay fuentes, sin números de línea."""
+    consts = [_code_fingerprint(c) if hasattr(c, "co_code") else repr(c) for c in code.co_consts]
+    return code.co_code.hex() + repr(consts) + repr(code.co_names)
+
+
+def _schema_hash() -> str:
+    parts = [json.dumps({"columns": FEATURE_COLUMNS, "lookback": FEATURE_LOOKBACK})]
+    for name in _SCHEMA_CODE:
+        fn = getattr(_features, name)
+        try:
+            parts.append(_normalized_source(inspect.getsource(fn)))
+        except (OSError, TypeError, SyntaxError):
+            # sin fuentes disponibles (p. ej. sólo .pyc)
+            parts.append(_code_fingerprint(fn.__code__))
+    return hashlib.sha1("\n".join(parts).encode("utf-8")).hexdigest()[:12]
+
+
+SCHEMA_HASH = _schema_hash()
+
+
+def feature_hash(values) -> str:
+    """Huella de un vector de features (orden de FEATURE_COLUMNS) para verificar `feature_ref`.
+
+    Redondea a 8 cifras significativas: el cálculo incremental
+    (ml/streaming_features.py) y el del almacén difieren en los últimos bits.
+    """
+    text = ",".join(f"{v:.8g}" for v in np.asarray(values, dtype=float))
+    return hashlib.sha1(text.encode("ascii")).hexdigest()[:16]
+
+
+def _empty() -> pd.DataFrame:
+    return pd.DataFrame(columns=FEATURE_COLUMNS, index=pd.DatetimeIndex([], name="Date"), dtype=float)
+
+
+class FeatureStore:
+    """Features guardadas por ticker, fecha y esquema.
+
+    - `features_many({ticker: barras})` sincroniza lo guardado con las barras y
+      devuelve las features de esas mismas fechas.
+    - `read(ticker, start, end)` es una lectura por rango sin recalcular nada.
+    - `lookup(ticker, fechas)` resuelve fechas sueltas; si faltan, las calcula
+      desde el almacén de barras.
+    """
+
+    def __init__(self, root: str = DEFAULT_ROOT, schema: str = SCHEMA_HASH):
+        self.root = root
+        self.schema = schema
+        self.directory = os.path.join(root, schema)
+        self._ext = ".parquet" if _parquet_available() else ".pkl"
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._prepared = False
+        # ticker → ((mtime_ns, tamaño), filas): evita releer un archivo que no cambió
+        self._cache: Dict[str, tuple] = {}
+
+    # ---- persistencia -------------------------------------------------
+    def _lock(self, ticker: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(ticker, threading.Lock())
+
+    def _path(self, ticker: str) -> str:
+        safe = re.sub(r"[^A-Za-z0-9._^=-]", "_", ticker.upper())
+        return os.path.join(self.directory, safe + self._ext)
+
+    def _load(self, ticker: str) -> pd.DataFrame:
+        """Filas guardadas del ticker (no modificar: pueden ser las del caché en memoria)."""
+        path = self._path(ticker)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return _empty()
+        stamp = (st.st_mtime_ns, st.st_size)
+        cached = self._cache.get(ticker.upper())
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        try:
+            df = pd.read_parquet(path) if self._ext == ".parquet" else pd.read_pickle(path)
+        except Exception:
+            # archivo corrupto o incompleto: se recalcula desde las barras
+            return _empty()
+        self._cache[ticker.upper()] = (stamp, df)
+        return df
+
+    def _save(self, ticker: str, df: pd.DataFrame) -> None:
+        if not self._prepared:
+            self._prepare_directory()
+        path = self._path(ticker)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        if self._ext == ".parquet":
+            df.to_parquet(tmp)
+        else:
+            df.to_pickle(tmp)
+        os.replace(tmp, path)
+        st = os.stat(path)
+        self._cache[ticker.upper()] = ((st.st_mtime_ns, st.st_size), df)
+
+    def _prepare_directory(self) -> None:
+        """Crea el directorio del esquema (los de esquemas anteriores quedan; ver `purge_old_schemas`)."""
+        os.makedirs(self.directory, exist_ok=True)
+        schema_file = os.path.join(self.directory, "schema.json")
+        if not os.path.exists(schema_file):
+            with open(schema_file, "w", encoding="utf-8") as fh:
+                json.dump({"schema": self.schema, "columns": FEATURE_COLUMNS, "lookback": FEATURE_LOOKBACK}, fh)
+            if self.old_schemas():
+                print("[INFO] Hay features de esquemas anteriores; borralas con `python -m scripts.features cleanup`.")
+        self._prepared = True
+
+    def old_schemas(self) -> list:
+        """Directorios de esquemas distintos del actual dentro de `root`."""
+        try:
+            names = os.listdir(self.root)
+        except OSError:
+            return []
+        return sorted(
+            name for name in names
+            if name != self.schema and os.path.exists(os.path.join(self.root, name, "schema.json"))
+        )
+
+    def purge_old_schemas(self) -> list:
+        """Borra los directorios de esquemas anteriores. Retorna sus nombres.
+
+        Sólo debe ejecutarse cuando ningún proceso con el código anterior sigue
+        corriendo (servidor, worker, scripts): sus lecturas y escrituras fallarían.
+        """
+        removed = self.old_schemas()
+        for name in removed:
+            shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+        return removed
+
+    # ---- API ------------------------------------------------------------
+    def read(self, ticker: str, start=None, end=None) -> pd.DataFrame:
+        """Features guardadas de `ticker` en [start, end), sin recalcular."""
+        df = self._load(ticker.upper())
+        if start is not None:
+            df = df[df.index >= pd.Timestamp(start).normalize()]
+        if end is not None:
+            df = df[df.index < pd.Timestamp(end)]
+        return df
+
+    def features(self, ticker: str, bars: pd.DataFrame) -> pd.DataFrame:
+        """Features (FEATURE_COLUMNS) de cada barra de `bars`; ver `features_many`."""
+        return self.features_many({ticker: bars})[ticker]
+
+    def features_many(self, frames: Dict[str, pd.DataFrame]) -> Dict[str, pd.DataFrame]:
+        """Features de cada barra de cada ticker, calculando sólo lo que no está guardado.
+
+        Las filas que faltan (o cuyas barras cambiaron) de todos los tickers se
+        calculan en una sola pasada de add_panel_features. Las primeras
+        FEATURE_LOOKBACK - 1 barras sin historia previa quedan con NaN, como en
+        add_basic_features.
+        """
+        frames = {t: _as_bars(df) for t, df in frames.items()}
+        locks = [self._lock(t) for t in sorted({t.upper() for t in frames})]
+        for lock in locks:
+            lock.acquire()
+        try:
+            stored, ohlcv, starts, windows = {}, {}, {}, {}
+            for t, bars in frames.items():
+                if bars.empty:
+                    continue
+                stored[t] = self._load(t)
+                start = _first_change(stored[t], bars)
+                if start is None:
+                    continue
+                merged = pd.concat([stored[t].loc[stored[t].index < bars.index[0], OHLCV_COLUMNS], bars])
+                ohlcv[t], starts[t] = merged, start
+                windows[t] = merged.iloc[max(0, start - FEATURE_LOOKBACK + 1):]
+
+            if windows:
+                with span("calculo", tickers=len(windows)):
+                    panel = add_panel_features(to_panel(windows))
+                for t, start in starts.items():
+                    first = ohlcv[t].index[start]
+                    fresh = panel.loc[t][FEATURE_COLUMNS]
+                    fresh = fresh[fresh.index >= first].astype(float)
+                    keep = stored[t][stored[t].index < first]
+                    stored[t] = pd.concat([keep, fresh]) if not keep.empty else fresh
+                    self._save(t, stored[t])
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+        out = {}
+        for t, bars in frames.items():
+            if bars.empty:
+                out[t] = _empty()
+            else:
+                out[t] = stored[t].reindex(bars.index)
+        return out
+
+    def lookup(self, ticker: str, dates: Iterable) -> pd.DataFrame:
+        """Features de `ticker` en fechas puntuales (filas NaN si no se pudieron calcular).
+
+        Lo que no esté guardado (p. ej. otra máquina registró la interacción) se
+        calcula desde el almacén de barras y queda guardado.
+        """
+        from services.bar_store import get_history
+
+        ticker = ticker.upper()
+        index = pd.DatetimeIndex(pd.to_datetime(list(dates))).normalize()
+        df = self._load(ticker)
+        faltan = index.difference(df.index)
+        if len(faltan):
+            # con margen de calendario para tener FEATURE_LOOKBACK barras antes de la primera fecha
+            desde = faltan.min() - pd.Timedelta(days=FEATURE_LOOKBACK * 3)
+            try:
+                bars = get_history(ticker, start=desde.to_pydatetime())
+            except Exception as e:
+                print(f"[WARN] No se pudieron calcular features de {ticker}: {e}")
+                bars = None
+            if bars is not None and not bars.empty:
+                self.features(ticker, bars)
+                df = self._load(ticker)
+        return df.reindex(index)
+
+
+def _as_bars(df: Optional[pd.DataFrame]) -> pd.DataFrame:
+    """Barras OHLCV normalizadas; las del almacén de barras ya lo están y no se copian."""
+    if (
+        df is not None
+        and list(df.columns) == OHLCV_COLUMNS
+        and isinstance(df.index, pd.DatetimeIndex)
+        and df.index.tz is None
+        and df.index.is_monotonic_increasing
+        and df.index.is_unique
+    ):
+        return df
+    return _normalize(df)
+
+
+def _first_change(stored: pd.DataFrame, bars: pd.DataFrame) -> Optional[int]:
+    """Posición (en historia guardada anterior + `bars`) de la primera barra a recalcular, o None."""
+    if stored.empty:
+        return 0
+    older = int(stored.index.searchsorted(bars.index[0]))
+    pos = stored.index.get_indexer(bars.index)
+    prev = stored.to_numpy(dtype=float)[pos][:, _OHLCV_POS]
+    prev[pos < 0] = np.nan
+    new = bars.to_numpy(dtype=float)
+    same = ((prev == new) | (np.isnan(prev) & np.isnan(new))).all(axis=1)
+    diff = np.flatnonzero(~same)
+    return older + int(diff[0]) if len(diff) else None
+
+
+_store: Optional[FeatureStore] = None
+_store_guard = threading.Lock()
+
+
+def get_feature_store() -> FeatureStore:
+    """Instancia compartida del almacén de features (creada de forma perezosa)."""
+    global _store
+    with _store_guard:
+        if _store is None:
+            _store = FeatureStore()
+        return _store
+
+
+def set_feature_store(store: FeatureStore) -> None:
+    """Reemplaza el almacén compartido (p. ej. otro directorio en benchmarks)."""
+    global _store
+    with _store_guard:
+        _store = store
+
+
+def features_for(ticker: str, bars: pd.DataFrame) -> pd.DataFrame:
+    """Atajo sobre el almacén compartido; reemplaza a `add_basic_features(bars)`."""
+    return get_feature_store().features(ticker, bars)
+
+
+def supervised_panel_from_store(
+    frames: Dict[str, pd.DataFrame],
+    up_pct: float = 0.01,
+    root: Optional[str] = None,
+) -> pd.DataFrame:
+    """Como features.supervised_panel_from_frames, pero leyendo las features del almacén.
+
+    Con `root` usa ese directorio (procesos worker, que no comparten la instancia).
+    """
+    store = FeatureStore(root) if root else get_feature_store()
+    feats = store.features_many(frames)
+    return make_supervised_panel(to_panel(feats), up_pct=up_pct)
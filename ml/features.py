@@ -1,6 +1,10 @@
 """Funciones utilitarias para ingeniería de variables y dataset supervisado."""
 
+from typing import Dict
+
+import numpy as np
 import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
 
 
 FEATURE_COLUMNS = [
@@ -15,6 +19,10 @@ FEATURE_COLUMNS = [
     "Volatility",
 ]
 
+# barras (incluida la actual) que necesita la feature de ventana más larga (MA10):
+# con ese contexto se recalcula una fila cualquiera sin releer todo el historial
+FEATURE_LOOKBACK = 10
+
 
 def add_basic_features(df: pd.DataFrame) -> pd.DataFrame:
     """Agrega retornos, medias móviles y volatilidad a un OHLCV DataFrame."""
@@ -39,3 +47,102 @@ def get_X_y(df: pd.DataFrame):
     X = df[FEATURE_COLUMNS]
     y = df["Target"]
     return X, y
+
+
+# ---- Versiones panel (muchos tickers a la vez) -------------------------------
+#
+# Un "panel" es un DataFrame en formato largo indexado por (ticker, Date) con
+# columnas OHLCV. Las funciones de abajo calculan lo mismo que add_basic_features
+# y make_supervised, pero para todos los tickers en una sola pasada NumPy, sin
+# bucles ni copias por ticker.
+
+
+def to_panel(frames: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+    """Une {ticker: OHLCV DataFrame} en un panel largo indexado por (ticker, Date)."""
+    frames = {t: df for t, df in frames.items() if df is not None and not df.empty}
+    if not frames:
+        index = pd.MultiIndex.from_arrays([[], pd.DatetimeIndex([])], names=["ticker", "Date"])
+        return pd.DataFrame(columns=["Open", "High", "Low", "Close", "Volume"], index=index)
+    panel = pd.concat(frames, names=["ticker", "Date"])
+    return panel.sort_index(kind="stable")
+
+
+def _group_positions(panel: pd.DataFrame) -> np.ndarray:
+    """Posición de cada fila dentro de su ticker (0, 1, 2, ...), asumiendo panel ordenado."""
+    codes = pd.factorize(panel.index.get_level_values(0))[0]
+    n = len(codes)
+    starts = np.r_[True, codes[1:] != codes[:-1]] if n else np.zeros(0, dtype=bool)
+    idx = np.arange(n)
+    start_idx = np.maximum.accumulate(np.where(starts, idx, 0)) if n else idx
+    return idx - start_idx
+
+
+def _rolling(values: np.ndarray, pos: np.ndarray, window: int, how: str) -> np.ndarray:
+    out = np.full(len(values), np.nan)
+    if len(values) < window:
+        return out
+    win = sliding_window_view(values, window)
+    stat = win.mean(axis=1) if how == "mean" else win.std(axis=1, ddof=1)
+    out[window - 1:] = stat
+    out[pos < window - 1] = np.nan  # ventanas que cruzan de un ticker a otro
+    return out
+
+
+def add_panel_features(panel: pd.DataFrame, dtype=None) -> pd.DataFrame:
+    """Versión panel de add_basic_features: Return, MA5, MA10 y Volatility por ticker.
+
+    `panel` debe estar indexado por (ticker, Date). Con `dtype=np.float32` la salida
+    ocupa la mitad de memoria (los cálculos internos siguen en float64).
+    """
+    if not panel.index.is_monotonic_increasing:
+        panel = panel.sort_index(kind="stable")
+    out = panel.copy()
+    close = out["Close"].to_numpy(dtype=float)
+    pos = _group_positions(out)
+
+    ret = np.full(len(close), np.nan)
+    if len(close) > 1:
+        ret[1:] = close[1:] / close[:-1] - 1.0
+    ret[pos == 0] = np.nan
+
+    out["Return"] = ret
+    out["MA5"] = _rolling(close, pos, 5, "mean")
+    out["MA10"] = _rolling(close, pos, 10, "mean")
+    out["Volatility"] = _rolling(close, pos, 5, "std")
+    if dtype is not None:
+        out = out.astype({c: dtype for c in FEATURE_COLUMNS})
+    return out
+
+
+def make_supervised_panel(panel: pd.DataFrame, up_pct: float = 0.01) -> pd.DataFrame:
+    """Versión panel de make_supervised (Target = sube más de up_pct en la barra siguiente del mismo ticker).
+
+    Igual que make_supervised, la última barra de cada ticker queda con Target 0.
+    """
+    close = panel["Close"].to_numpy(dtype=float)
+    pos = _group_positions(panel)
+    nxt = np.full(len(close), np.nan)
+    if len(close) > 1:
+        nxt[:-1] = close[1:]
+    # la siguiente fila pertenece a otro ticker cuando su posición es 0
+    last_in_group = np.r_[pos[1:] == 0, True] if len(pos) else pos.astype(bool)
+    nxt[last_in_group] = np.nan
+    with np.errstate(invalid="ignore"):
+        target = (nxt > close * (1.0 + up_pct)).astype(np.int8)
+    out = panel.assign(Target=target)
+    return out.dropna()
+
+
+def panel_arrays(panel: pd.DataFrame, dtype=np.float32):
+    """X (matriz C-contigua de FEATURE_COLUMNS) e y (int8) listos para XGBoost/sklearn."""
+    X = np.ascontiguousarray(panel[FEATURE_COLUMNS].to_numpy(dtype=dtype))
+    y = panel["Target"].to_numpy(dtype=np.int8) if "Target" in panel.columns else None
+    return X, y
+
+
+def supervised_panel_from_frames(frames: Dict[str, pd.DataFrame], up_pct: float = 0.01, dtype=None) -> pd.DataFrame:
+    """to_panel + add_panel_features + make_supervised_panel en un paso.
+
+    Vive en este módulo (liviano) para poder ejecutarse en procesos worker.
+    """
+    return make_supervised_panel(add_panel_features(to_panel(frames), dtype=dtype), up_pct=up_pct)
@@ -4,58 +4,154 @@ Pensado para actualizarse de forma incremental sin bloquear la CLI:
 se ejecuta mediante scripts/update_models.py.
 """
 
+import multiprocessing as mp
 import os
-from typing import List, Tuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Tuple
 
-import joblib
-import yfinance as yf
 import pandas as pd
+from sklearn.metrics import roc_auc_score
 from sklearn.pipeline import Pipeline
 from sklearn.preprocessing import StandardScaler
 from sklearn.neural_network import MLPClassifier
 from xgboost import XGBClassifier
 
-from ml.features import add_basic_features, make_supervised, get_X_y
+from ml.feature_store import get_feature_store, supervised_panel_from_store
+from ml.features import FEATURE_COLUMNS
+from config import model_registry
+from config.profiling import span, timed
 from config.alman_model import guardar_modelo_en_mongo
 from config.db import get_db
+from services.bar_store import get_history
 
 
-def build_dataset_for_tickers(tickers: List[str], period: str = "2y") -> Tuple[pd.DataFrame, pd.Series]:
-    """Concatena datasets de varios tickers en un único X, y."""
-    frames = []
-    for t in tickers:
-        try:
-            df = yf.Ticker(t).history(period=period)
-            if df is None or df.empty:
-                continue
-            df = add_basic_features(df)
-            df = make_supervised(df, up_pct=0.01)
-            if df.empty:
-                continue
-            X, y = get_X_y(df)
-            X = X.copy()
-            X["ticker"] = t
-            X["y"] = y.values
-            frames.append(X)
-        except Exception:
-            continue
-    if not frames:
+class GlobalDataset(NamedTuple):
+    """Dataset global ordenado por fecha (y ticker dentro de cada fecha), sólo barras etiquetadas."""
+
+    X: pd.DataFrame
+    y: pd.Series
+    dates: pd.Series
+    tickers: pd.Series
+    failures: Dict[str, str]
+
+
+def _fetch_one(ticker: str, period: str):
+    try:
+        df = get_history(ticker, period=period)
+    except Exception as e:
+        return ticker, None, f"{type(e).__name__}: {e}"
+    if df is None or df.empty:
+        return ticker, None, "sin datos"
+    return ticker, df, None
+
+
+def build_global_dataset(
+    tickers: List[str],
+    period: str = "2y",
+    fetch_workers: int = 8,
+    feature_workers: Optional[int] = None,
+    min_tickers_per_process: int = 8,
+) -> GlobalDataset:
+    """Construye el dataset global en paralelo y ordenado en el tiempo.
+
+    - Descarga/lee el historial de cada ticker con un pool de hilos (I/O).
+    - Lee las features del almacén (ml/feature_store.py), que sólo calcula las
+      barras nuevas; con muchos tickers lo reparte en un pool de procesos por
+      bloques (con pocos lo hace en el proceso actual).
+    - Une todo ordenado por fecha, lo que permite un split temporal real.
+    - Sólo incluye barras con etiqueta conocida: descarta la última de cada
+      ticker, así `dates.max()` es la marca de agua de barras aprendidas.
+    - `failures` indica qué tickers se descartaron y por qué.
+    """
+    tickers = list(dict.fromkeys(tickers))
+    failures: Dict[str, str] = {}
+    frames: Dict[str, pd.DataFrame] = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(fetch_workers, len(tickers) or 1))) as pool:
+        for t, df, error in pool.map(lambda t: _fetch_one(t, period), tickers):
+            if error is not None:
+                failures[t] = error
+            else:
+                frames[t] = df
+
+    names = list(frames)
+    if feature_workers is None:
+        feature_workers = os.cpu_count() or 1
+    n_chunks = max(1, min(feature_workers, len(names) // max(1, min_tickers_per_process)))
+    if n_chunks <= 1:
+        panels = [supervised_panel_from_store(frames, up_pct=0.01)]
+    else:
+        chunks = [{t: frames[t] for t in names[i::n_chunks]} for i in range(n_chunks)]
+        root = get_feature_store().root
+        # spawn: este proceso ya importó XGBoost (OpenMP) y un fork puede colgar al hijo
+        with ProcessPoolExecutor(max_workers=n_chunks, mp_context=mp.get_context("spawn")) as pool:
+            panels = list(pool.map(supervised_panel_from_store, chunks, [0.01] * n_chunks, [root] * n_chunks))
+
+    panel = pd.concat(panels) if panels else pd.DataFrame()
+    for t in names:
+        if panel.empty or t not in panel.index.get_level_values("ticker"):
+            failures[t] = "historial insuficiente para calcular features"
+    if failures:
+        for t, motivo in failures.items():
+            print(f"[WARN] Ticker descartado {t}: {motivo}")
+    if panel.empty:
         raise ValueError("No se pudo construir dataset con los tickers indicados.")
-    data = pd.concat(frames, axis=0, ignore_index=True)
-    y = data.pop("y")
-    data.drop(columns=["ticker"], inplace=True)
-    return data, y
 
+    panel = panel.reset_index()
+    # la última barra de cada ticker todavía no tiene etiqueta (make_supervised_panel le pone 0):
+    # si se aprendiera, ese 0 quedaría detrás de la marca de agua y nunca se corregiría
+    panel = panel[panel["Date"] < panel.groupby("ticker")["Date"].transform("max")]
+    panel = panel.sort_values(["Date", "ticker"], kind="stable").reset_index(drop=True)
+    return GlobalDataset(
+        X=panel[FEATURE_COLUMNS],
+        y=panel["Target"].astype(int).rename("y"),
+        dates=panel["Date"],
+        tickers=panel["ticker"],
+        failures=failures,
+    )
+
+
+def build_dataset_for_tickers(tickers: List[str], period: str = "2y") -> Tuple[pd.DataFrame, pd.Series]:
+    """Concatena datasets de varios tickers en un único X, y (ordenado por fecha)."""
+    ds = build_global_dataset(tickers, period=period)
+    return ds.X, ds.y
+
+
+def _time_split(ds: GlobalDataset, val_size: float = 0.2):
+    """Split temporal por fecha: las últimas fechas (≈val_size de las filas) van a validación.
+
+    Ninguna fecha queda repartida entre train y validación.
+    """
+    cutoff = ds.dates.quantile(1 - val_size, interpolation="higher")
+    train = (ds.dates < cutoff).to_numpy()
+    if train.all() or not train.any():
+        split = int(len(ds.X) * (1 - val_size))
+        train = pd.RangeIndex(len(ds.X)) < split
+    return ds.X[train], ds.X[~train], ds.y[train], ds.y[~train]
 
+
+def _training_metadata(ds: GlobalDataset, period: str, metrics: dict) -> dict:
+    """Metadatos de versión para el registro de modelos."""
+    return {
+        "training_window": {
+            "start": str(ds.dates.min().date()) if len(ds.dates) else None,
+            "end": str(ds.dates.max().date()) if len(ds.dates) else None,
+            "period": period,
+        },
+        "tickers": sorted(ds.tickers.unique().tolist()),
+        "n_samples": int(len(ds.X)),
+        "metrics": metrics,
+        "feature_columns": list(FEATURE_COLUMNS),
+    }
+
+
+@timed("train_xgb_global")
 def train_or_update_xgb_global(tickers: List[str], period: str = "2y", model_path: str = "models/global_xgb.pkl"):
     """Entrena o continúa entrenando un XGBoost global, y lo guarda en FS+Mongo."""
-    X, y = build_dataset_for_tickers(tickers, period=period)
+    with span("dataset", tickers=len(tickers)):
+        ds = build_global_dataset(tickers, period=period)
 
-    # Split temporal simple
-    n = len(X)
-    split = int(n * 0.8)
-    X_train, X_val = X.iloc[:split], X.iloc[split:]
-    y_train, y_val = y.iloc[:split], y.iloc[split:]
+    # Split temporal por fecha (no por ticker)
+    X_train, X_val, y_train, y_val = _time_split(ds, val_size=0.2)
 
     pos = int((y_train == 1).sum())
     neg = int((y_train == 0).sum())
@@ -71,48 +167,99 @@ def train_or_update_xgb_global(tickers: List[str], period: str = "2y", model_pat
         objective="binary:logistic",
         eval_metric="auc",
         scale_pos_weight=spw,
+        early_stopping_rounds=50,
         random_state=42,
     )
 
     xgb = XGBClassifier(**params)
 
-    # Warm-start desde modelo previo si existe
+    # Warm-start desde la versión activa del registro (o el .pkl heredado)
     prev_booster = None
-    if os.path.exists(model_path):
+    with span("modelo_previo"):
+        prev_model = model_registry.load_for_training("GLOBAL_XGB", legacy_path=model_path)
+    if prev_model is not None:
         try:
-            prev_model = joblib.load(model_path)
             prev_booster = prev_model.get_booster()
         except Exception:
             prev_booster = None
 
-    xgb.fit(
-        X_train,
-        y_train,
-        eval_set=[(X_val, y_val)],
-        early_stopping_rounds=50,
-        verbose=False,
-        xgb_model=prev_booster,
-    )
+    with span("fit", filas=len(X_train)):
+        xgb.fit(
+            X_train,
+            y_train,
+            eval_set=[(X_val, y_val)],
+            verbose=False,
+            xgb_model=prev_booster,
+        )
 
-    os.makedirs("models", exist_ok=True)
-    joblib.dump(xgb, model_path)
-    guardar_modelo_en_mongo("GLOBAL_XGB", xgb)
+    metrics = {}
+    try:
+        metrics["auc_val"] = float(roc_auc_score(y_val, xgb.predict_proba(X_val)[:, 1]))
+    except Exception:
+        pass
+    with span("guardar"):
+        model_registry.publish("GLOBAL_XGB", xgb, metadata=_training_metadata(ds, period, metrics))
+        model_registry.dump_atomic(xgb, model_path)
+        guardar_modelo_en_mongo("GLOBAL_XGB", xgb)
     return xgb
 
 
-def train_or_update_mlp_global(tickers: List[str], period: str = "2y", model_path: str = "models/global_mlp.pkl"):
-    """Entrena o continúa entrenando un MLP global (pipeline con scaler)."""
-    X, y = build_dataset_for_tickers(tickers, period=period)
+@timed("online")
+def _update_mlp_online(ds: GlobalDataset, period: str, model_path: str):
+    """partial_fit sólo con las barras posteriores a la marca de agua de barras de la versión activa.
+
+    Retorna None (y el llamador reajusta todo) si no hay versión o ninguna
+    versión del registro registró hasta qué barra aprendió.
+    """
+    from ml.online_mlp import BARS_REPLAY_PATH, ReplayBuffer, high_water_marks, load_online_pipeline, partial_update
+
+    marks = high_water_marks("GLOBAL_MLP")
+    fin = marks.get("bars")
+    if not fin:
+        if model_registry.current_version("GLOBAL_MLP"):
+            print("[WARN] MLP global: ninguna versión registró hasta qué barra aprendió; se reajusta completo.")
+        return None
+    nuevas = (ds.dates > pd.Timestamp(fin)).to_numpy()
+    pipe = load_online_pipeline(legacy_path=model_path)
+    if not nuevas.any():
+        print("[INFO] MLP global: no hay barras nuevas desde la última versión.")
+        return pipe
+    buffer = ReplayBuffer.load(BARS_REPLAY_PATH)
+    partial_update(pipe, ds.X[nuevas].to_numpy(dtype="float32"), ds.y[nuevas].to_numpy(), buffer)
+    buffer.save(BARS_REPLAY_PATH)
+    metadata = _training_metadata(ds, period, {})
+    metadata["training_window"]["start"] = str(ds.dates[nuevas].min().date())
+    metadata["hwm"] = {**marks, "bars": metadata["training_window"]["end"]}
+    metadata["online"] = {"n_new": int(nuevas.sum()), "replay": len(buffer)}
+    model_registry.publish("GLOBAL_MLP", pipe, metadata=metadata)
+    model_registry.dump_atomic(pipe, model_path)
+    guardar_modelo_en_mongo("GLOBAL_MLP", pipe)
+    return pipe
 
-    # pipeline con estandarización + MLP warm_start
-    if os.path.exists(model_path):
-        try:
-            pipe = joblib.load(model_path)
-            # continuará entrenamiento al llamar fit, por warm_start=True
-        except Exception:
-            pipe = None
-    else:
-        pipe = None
+
+@timed("train_mlp_global")
+def train_or_update_mlp_global(
+    tickers: List[str],
+    period: str = "2y",
+    model_path: str = "models/global_mlp.pkl",
+    online: bool = False,
+):
+    """Entrena o continúa entrenando un MLP global (pipeline con scaler).
+
+    Con `online=True` y una versión previa con ventana conocida, sólo aplica
+    `partial_fit` a las barras nuevas (ver ml/online_mlp.py) en vez de reajustar todo.
+    """
+    with span("dataset", tickers=len(tickers)):
+        ds = build_global_dataset(tickers, period=period)
+    if online:
+        pipe = _update_mlp_online(ds, period, model_path)
+        if pipe is not None:
+            return pipe
+    X, y = ds.X, ds.y
+
+    # pipeline con estandarización + MLP warm_start (continúa desde la versión activa)
+    with span("modelo_previo"):
+        pipe = model_registry.load_for_training("GLOBAL_MLP", legacy_path=model_path)
 
     if pipe is None:
         mlp = MLPClassifier(hidden_layer_sizes=(64, 32), activation="relu", solver="adam", alpha=1e-4,
@@ -126,11 +273,18 @@ def train_or_update_mlp_global(tickers: List[str], period: str = "2y", model_pat
         if hasattr(pipe.named_steps.get("mlp"), "warm_start"):
             pipe.named_steps["mlp"].warm_start = True
 
-    pipe.fit(X, y)
+    with span("fit", filas=len(X)):
+        pipe.fit(X, y)
 
-    os.makedirs("models", exist_ok=True)
-    joblib.dump(pipe, model_path)
-    guardar_modelo_en_mongo("GLOBAL_MLP", pipe)
+    from ml.online_mlp import high_water_marks
+
+    metadata = _training_metadata(ds, period, {})
+    # warm_start sobre la versión activa: conserva lo aprendido de acciones_usuario
+    metadata["hwm"] = {**high_water_marks("GLOBAL_MLP"), "bars": metadata["training_window"]["end"]}
+    with span("guardar"):
+        model_registry.publish("GLOBAL_MLP", pipe, metadata=metadata)
+        model_registry.dump_atomic(pipe, model_path)
+        guardar_modelo_en_mongo("GLOBAL_MLP", pipe)
     return pipe
 
 
@@ -0,0 +1,423 @@
+"""Motor de indicadores técnicos: registro de indicadores calculados en una pasada NumPy.
+
+Cada indicador es una función sobre un `_Context` que extrae una sola vez los
+arreglos contiguos de Close/High/Low/Volume y guarda lo que comparten los
+indicadores: sumas acumuladas (para medias y desvíos de cualquier ventana),
+retorno, cierre previo, rango verdadero y medias exponenciales. Pedir RSI,
+MACD y ATR juntos no recorre el DataFrame una vez por indicador.
+
+Funciona con un ticker (índice de fechas) o con un panel indexado por
+(ticker, Date) como el de ml/features.py; las ventanas nunca cruzan de un
+ticker a otro y las primeras barras de cada ticker quedan en NaN hasta que
+alcanza la historia (`warmup`).
+
+Indicadores registrados (nombres de columna):
+
+- Return, MA5, MA10, Volatility: los mismos de FEATURE_COLUMNS.
+- ReturnLag1..ReturnLag5: retorno de 1 a 5 barras atrás.
+- RSI14: RSI de Wilder (medias exponenciales con alpha = 1/14).
+- MACD, MACDSignal, MACDHist: EMA12 - EMA26, su EMA9 y la diferencia.
+- BBWidth20: ancho de Bollinger (4 desvíos poblacionales de 20 barras / media).
+- ATR14: rango verdadero promedio de Wilder.
+- VolumeZ20: z-score del volumen contra sus últimas 20 barras.
+
+Los indicadores exponenciales dependen de toda la historia previa: su valor en
+una fecha cambia (poco) según desde dónde arranque la serie.
+
+Los NaN en medio de la serie (yfinance los devuelve) se tratan como en pandas:
+una ventana móvil que contiene un NaN da NaN, pero no contamina las ventanas
+siguientes; las medias exponenciales siguen como `ewm(adjust=False)`, que
+mantiene el último valor y pondera la observación siguiente según el largo
+del hueco.
+"""
+
+from __future__ import annotations
+
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+from ml.features import _group_positions
+
+
+class Indicator(NamedTuple):
+    fn: Callable[["_Context"], np.ndarray]
+    # barras previas del mismo ticker necesarias antes del primer valor
+    warmup: int
+
+
+INDICATORS: Dict[str, Indicator] = {}
+
+# selección por defecto: todo lo que no está ya en FEATURE_COLUMNS
+DEFAULT_INDICATORS = [
+    "ReturnLag1",
+    "ReturnLag2",
+    "ReturnLag3",
+    "ReturnLag4",
+    "ReturnLag5",
+    "RSI14",
+    "MACD",
+    "MACDSignal",
+    "MACDHist",
+    "BBWidth20",
+    "ATR14",
+    "VolumeZ20",
+]
+
+
+def register(name: str, warmup: int):
+    """Decorador que agrega `fn(ctx) -> np.ndarray` al registro bajo `name`."""
+
+    def deco(fn):
+        INDICATORS[name] = Indicator(fn, warmup)
+        return fn
+
+    return deco
+
+
+class _Context:
+    """Arreglos de un ticker o panel y resultados intermedios compartidos entre indicadores."""
+
+    def __init__(self, frame: pd.DataFrame):
+        self.close = np.ascontiguousarray(frame["Close"].to_numpy(dtype=float))
+        self.high = np.ascontiguousarray(frame["High"].to_numpy(dtype=float))
+        self.low = np.ascontiguousarray(frame["Low"].to_numpy(dtype=float))
+        self.volume = np.ascontiguousarray(frame["Volume"].to_numpy(dtype=float))
+        n = len(self.close)
+        if isinstance(frame.index, pd.MultiIndex):
+            self.pos = _group_positions(frame)
+        else:
+            self.pos = np.arange(n)
+        self.starts = np.flatnonzero(self.pos == 0)
+        # índice del ticker de cada fila (0, 0, ..., 1, 1, ...)
+        self.group = np.cumsum(self.pos == 0) - 1 if n else self.pos
+        self.width = int(self.pos.max()) + 1 if n else 0
+        # posición de cada fila en la grilla aplanada (ticker × barra)
+        self._flat = self.group * self.width + self.pos
+        self._cache: Dict[tuple, np.ndarray] = {}
+
+    def to_grid(self, values: np.ndarray, fill: float = np.nan) -> np.ndarray:
+        """Matriz (ticker × barra) con la serie de cada ticker en su fila; el resto es `fill`."""
+        grid = np.full((len(self.starts), self.width), fill)
+        grid.ravel()[self._flat] = values
+        return grid
+
+    def from_grid(self, grid: np.ndarray) -> np.ndarray:
+        return np.ascontiguousarray(grid).ravel().take(self._flat)
+
+    def cached(self, key: tuple, fn: Callable[[], np.ndarray]) -> np.ndarray:
+        if key not in self._cache:
+            self._cache[key] = fn()
+        return self._cache[key]
+
+    def masked(self, values: np.ndarray, warmup: int) -> np.ndarray:
+        """Copia de `values` con NaN en las primeras `warmup` barras de cada ticker."""
+        out = np.array(values, dtype=float)
+        out[self.pos < warmup] = np.nan
+        return out
+
+    # ---- series base ----------------------------------------------------
+    def series(self, name: str) -> np.ndarray:
+        return getattr(self, name) if name in ("close", "high", "low", "volume") else self.cached((name,), getattr(self, f"_{name}"))
+
+    def _prev_close(self) -> np.ndarray:
+        prev = np.empty_like(self.close)
+        prev[1:] = self.close[:-1]
+        prev[self.pos == 0] = np.nan
+        return prev
+
+    def _ret(self) -> np.ndarray:
+        return self.close / self.series("prev_close") - 1.0
+
+    def _true_range(self) -> np.ndarray:
+        prev = self.series("prev_close")
+        tr = np.fmax(self.high - self.low, np.fmax(np.abs(self.high - prev), np.abs(self.low - prev)))
+        return tr  # en la primera barra (sin cierre previo) queda High - Low
+
+    def _gain(self) -> np.ndarray:
+        delta = self.close - self.series("prev_close")
+        return np.where(delta > 0, delta, 0.0) + delta * 0.0  # conserva el NaN inicial
+
+    def _loss(self) -> np.ndarray:
+        delta = self.close - self.series("prev_close")
+        return np.where(delta < 0, -delta, 0.0) + delta * 0.0
+
+    # ---- ventanas móviles por sumas acumuladas ----------------------------
+    def _cumsums(self, name: str):
+        """Sumas acumuladas por ticker de la serie, de su cuadrado y de los valores válidos.
+
+        Son matrices ticker × barra+1. Cada fila arranca en 0 y se centra en el
+        primer valor válido del ticker: así las sumas se mantienen chicas y la
+        diferencia de dos acumulados (suma de una ventana) no pierde precisión,
+        sin importar cuántos tickers haya. Los NaN suman 0 y no cuentan como
+        válidos, así sólo anulan las ventanas que los contienen.
+        """
+
+        def build():
+            grid = self.to_grid(self.series(name))
+            valid = ~np.isnan(grid)
+            first = np.argmax(valid, axis=1)
+            anchor = np.nan_to_num(grid[np.arange(len(grid)), first])[:, None]
+            x = np.where(valid, grid - anchor, 0.0)
+            zeros = np.zeros((len(grid), 1))
+            c1 = np.concatenate((zeros, np.cumsum(x, axis=1)), axis=1)
+            c2 = np.concatenate((zeros, np.cumsum(x * x, axis=1)), axis=1)
+            cn = np.concatenate((zeros, np.cumsum(valid, axis=1)), axis=1)
+            return c1, c2, cn, anchor
+
+        return self.cached(("cumsum", name), build)
+
+    def _window_grid(self, name: str, window: int, stat: Callable[[int], np.ndarray]) -> np.ndarray:
+        """Ubica `stat(window)` (una columna por ventana completa) en la grilla y vuelve al orden de filas.
+
+        Las ventanas con algún NaN de `name` (o incompletas) quedan en NaN.
+        """
+        out = np.full((len(self.starts), self.width), np.nan)
+        if self.width >= window:
+            cn = self._cumsums(name)[2]
+            full = (cn[:, window:] - cn[:, :-window]) == window
+            out[:, window - 1:] = np.where(full, stat(window), np.nan)
+        values = self.from_grid(out)
+        values[self.pos < window - 1] = np.nan
+        return values
+
+    def rolling_mean(self, name: str, window: int) -> np.ndarray:
+        def stat(w):
+            c1, _, _, anchor = self._cumsums(name)
+            return (c1[:, w:] - c1[:, :-w]) / w + anchor
+
+        return self.cached(("mean", name, window), lambda: self._window_grid(name, window, stat))
+
+    def rolling_std(self, name: str, window: int, ddof: int = 1) -> np.ndarray:
+        def stat(w):
+            c1, c2, _, _ = self._cumsums(name)
+            s1 = c1[:, w:] - c1[:, :-w]
+            s2 = c2[:, w:] - c2[:, :-w]
+            return np.sqrt(np.maximum((s2 - s1 * s1 / w) / (w - ddof), 0.0))
+
+        return self.cached(("std", name, window, ddof), lambda: self._window_grid(name, window, stat))
+
+    # ---- medias exponenciales -------------------------------------------
+    def ema(self, name: str, alpha: float, values: Optional[np.ndarray] = None) -> np.ndarray:
+        """EMA (como pandas `ewm(alpha=..., adjust=False)`) por ticker, arrancando en el primer valor no NaN.
+
+        `name` es una serie base o, si se pasa `values`, sólo la clave del caché.
+        Los tickers se ordenan en una matriz (ticker × barra) y la recursión
+        avanza barra a barra para todos los tickers a la vez. Un NaN posterior
+        mantiene el valor anterior (como pandas con `ignore_na=False`).
+        """
+
+        def build():
+            if self.width == 0:
+                return np.empty(0)
+            grid = self.to_grid(self.series(name) if values is None else values)
+            # NaN iniciales: se rellenan con el primer valor válido (la EMA arranca ahí) y se restauran al final
+            first = np.argmax(~np.isnan(grid), axis=1)
+            leading = np.arange(self.width) < first[:, None]
+            grid = np.where(leading, grid[np.arange(len(grid)), first][:, None], grid)
+            out = _ema_rows(grid, alpha) if not np.isnan(grid).any() else _ema_rows_gaps(grid, alpha)
+            out[leading] = np.nan
+            return self.from_grid(out)
+
+        return self.cached(("ema", name, alpha), build)
+
+
+def _ema_rows(grid: np.ndarray, alpha: float) -> np.ndarray:
+    """Recursión EMA sobre cada fila de `grid` (sin NaN iniciales).
+
+    Con pocos tickers un bucle Python sobre floats es más rápido que una
+    operación NumPy por barra; con muchos, cada paso avanza todas las filas.
+    """
+    if len(grid) < _EMA_VECTOR_MIN_ROWS:
+        out = np.empty_like(grid)
+        for r, row in enumerate(grid.tolist()):
+            prev = row[0]
+            acc = [prev]
+            for x in row[1:]:
+                prev += alpha * (x - prev)
+                acc.append(prev)
+            out[r] = acc
+        return out
+    cols = np.ascontiguousarray(grid.T)
+    out = np.empty_like(cols)
+    prev = cols[0].copy()
+    out[0] = prev
+    step = np.empty_like(prev)
+    for j in range(1, len(cols)):
+        np.subtract(cols[j], prev, out=step)
+        step *= alpha
+        prev += step
+        out[j] = prev
+    return out.T
+
+
+def _ema_rows_gaps(grid: np.ndarray, alpha: float) -> np.ndarray:
+    """Como _ema_rows, con NaN en medio de las filas (mismo resultado que pandas `ewm(adjust=False)`).
+
+    En un NaN la EMA conserva el valor previo; en la observación que sigue a un
+    hueco de k barras el valor previo pesa (1 - alpha) ** (k + 1) y la nueva
+    observación alpha (pesos normalizados).
+    """
+    keep = 1.0 - alpha
+    if len(grid) < _EMA_VECTOR_MIN_ROWS:
+        out = np.empty_like(grid)
+        for r, row in enumerate(grid.tolist()):
+            prev = row[0]
+            decay = 1.0
+            acc = [prev]
+            for x in row[1:]:
+                decay *= keep
+                if x == x:  # NaN != NaN
+                    prev += alpha / (decay + alpha) * (x - prev)
+                    decay = 1.0
+                acc.append(prev)
+            out[r] = acc
+        return out
+    cols = np.ascontiguousarray(grid.T)
+    valid = ~np.isnan(cols)
+    out = np.empty_like(cols)
+    prev = cols[0].copy()
+    out[0] = prev
+    decay = np.ones_like(prev)
+    step = np.empty_like(prev)
+    for j in range(1, len(cols)):
+        decay *= keep
+        np.subtract(cols[j], prev, out=step)
+        step *= alpha / (decay + alpha)
+        np.add(prev, step, out=prev, where=valid[j])
+        np.copyto(decay, 1.0, where=valid[j])
+        out[j] = prev
+    return out.T
+
+
+# a partir de cuántos tickers conviene vectorizar la EMA entre tickers
+_EMA_VECTOR_MIN_ROWS = 16
+
+
+# ---- indicadores ------------------------------------------------------------
+
+
+@register("Return", warmup=1)
+def _return(ctx: _Context) -> np.ndarray:
+    return ctx.series("ret")
+
+
+@register("MA5", warmup=4)
+def _ma5(ctx: _Context) -> np.ndarray:
+    return ctx.rolling_mean("close", 5)
+
+
+@register("MA10", warmup=9)
+def _ma10(ctx: _Context) -> np.ndarray:
+    return ctx.rolling_mean("close", 10)
+
+
+@register("Volatility", warmup=4)
+def _volatility(ctx: _Context) -> np.ndarray:
+    return ctx.rolling_std("close", 5)
+
+
+def _lagged_return(lag: int) -> Callable[[_Context], np.ndarray]:
+    def fn(ctx: _Context) -> np.ndarray:
+        ret = ctx.series("ret")
+        out = np.full(len(ret), np.nan)
+        out[lag:] = ret[:-lag] if lag else ret
+        out[ctx.pos < lag + 1] = np.nan
+        return out
+
+    return fn
+
+
+for _lag in range(1, 6):
+    register(f"ReturnLag{_lag}", warmup=_lag + 1)(_lagged_return(_lag))
+
+
+@register("RSI14", warmup=14)
+def _rsi14(ctx: _Context) -> np.ndarray:
+    gain = ctx.ema("gain", 1.0 / 14)
+    loss = ctx.ema("loss", 1.0 / 14)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rsi = np.where(loss == 0, 100.0, 100.0 - 100.0 / (1.0 + gain / loss))
+    return ctx.masked(rsi, 14)
+
+
+def _macd_line(ctx: _Context) -> np.ndarray:
+    return ctx.cached(("macd",), lambda: ctx.ema("close", 2.0 / 13) - ctx.ema("close", 2.0 / 27))
+
+
+def _macd_signal(ctx: _Context) -> np.ndarray:
+    return ctx.cached(("macd_signal",), lambda: ctx.ema("macd", 2.0 / 10, _macd_line(ctx)))
+
+
+@register("MACD", warmup=25)
+def _macd(ctx: _Context) -> np.ndarray:
+    return ctx.masked(_macd_line(ctx), 25)
+
+
+@register("MACDSignal", warmup=33)
+def _macd_sig(ctx: _Context) -> np.ndarray:
+    return ctx.masked(_macd_signal(ctx), 33)
+
+
+@register("MACDHist", warmup=33)
+def _macd_hist(ctx: _Context) -> np.ndarray:
+    return ctx.masked(_macd_line(ctx) - _macd_signal(ctx), 33)
+
+
+@register("BBWidth20", warmup=19)
+def _bb_width20(ctx: _Context) -> np.ndarray:
+    return 4.0 * ctx.rolling_std("close", 20, ddof=0) / ctx.rolling_mean("close", 20)
+
+
+@register("ATR14", warmup=13)
+def _atr14(ctx: _Context) -> np.ndarray:
+    return ctx.masked(ctx.ema("true_range", 1.0 / 14), 13)
+
+
+@register("VolumeZ20", warmup=19)
+def _volume_z20(ctx: _Context) -> np.ndarray:
+    mean = ctx.rolling_mean("volume", 20)
+    std = ctx.rolling_std("volume", 20)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = (ctx.volume - mean) / std
+    # volumen constante en la ventana: sin desvío, z = 0
+    return np.where((std == 0) & ~np.isnan(mean), 0.0, z)
+
+
+# ---- API ------------------------------------------------------------------------
+
+
+def indicator_warmup(names: Optional[Iterable[str]] = None) -> int:
+    """Barras previas que necesita la selección más exigente (0 si está vacía)."""
+    names = DEFAULT_INDICATORS if names is None else list(names)
+    return max((INDICATORS[n].warmup for n in names), default=0)
+
+
+def compute_indicators(frame: pd.DataFrame, names: Optional[Iterable[str]] = None, dtype=None) -> pd.DataFrame:
+    """Indicadores `names` (DEFAULT_INDICATORS si es None) de un ticker o de un panel.
+
+    `frame` necesita columnas Open/High/Low/Close/Volume; un panel debe estar
+    indexado por (ticker, Date). Retorna sólo las columnas pedidas, con el
+    mismo índice (ordenado). Los intermedios compartidos se calculan una vez.
+    """
+    names: List[str] = DEFAULT_INDICATORS if names is None else list(names)
+    unknown = [n for n in names if n not in INDICATORS]
+    if unknown:
+        raise KeyError(f"Indicadores no registrados: {unknown}. Disponibles: {sorted(INDICATORS)}")
+    if not frame.index.is_monotonic_increasing:
+        frame = frame.sort_index(kind="stable")
+    ctx = _Context(frame)
+    data = {n: INDICATORS[n].fn(ctx) for n in names}
+    out = pd.DataFrame(data, index=frame.index, columns=names)
+    if dtype is not None:
+        out = out.astype(dtype)
+    return out
+
+
+def add_indicators(frame: pd.DataFrame, names: Optional[Iterable[str]] = None, dtype=None) -> pd.DataFrame:
+    """Copia de `frame` con los indicadores agregados como columnas (ver compute_indicators)."""
+    if not frame.index.is_monotonic_increasing:
+        frame = frame.sort_index(kind="stable")
+    ind = compute_indicators(frame, names, dtype=dtype)
+    return frame.assign(**{c: ind[c].to_numpy() for c in ind.columns})
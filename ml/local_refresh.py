@@ -0,0 +1,233 @@
+"""Actualización incremental de los modelos XGBoost locales (por ticker).
+
+Un modelo local se considera desactualizado cuando supera `LOCAL_MODEL_MAX_AGE_DAYS`
+o cuando hay `LOCAL_MODEL_MAX_NEW_BARS` barras nuevas con etiqueta desde la
+última barra que vio. En ese caso:
+
+- Se puntúan las barras nuevas con el modelo actual, antes de tocarlo. Como
+  son predicciones fuera de muestra, se acumulan en los metadatos y dan una
+  AUC "en producción".
+- Se sigue el boosting desde el booster existente sólo con las barras nuevas
+  (`LOCAL_MODEL_REFRESH_ROUNDS` árboles), con un tope de `LOCAL_MODEL_MAX_TREES`.
+  Si las barras nuevas tienen una sola clase (habitual con pocas barras) no se
+  puede seguir el boosting: el modelo queda igual y sólo se actualizan sus
+  metadatos.
+- Se hace un reentrenamiento completo sólo si esa AUC cae más de
+  `LOCAL_MODEL_AUC_DROP` respecto de la validación original, si se alcanzó el
+  tope de árboles, o si el modelo no tiene metadatos.
+"""
+
+from __future__ import annotations
+
+import os
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from config.alman_model import cargar_metadatos_de_mongo, cargar_modelo_de_mongo, cargar_modelos_de_mongo, guardar_modelo_en_mongo
+from config.model_registry import dump_atomic
+from config.profiling import span, timed
+from ml.feature_store import features_for
+from ml.features import get_X_y, make_supervised
+from ml.trainer import train_buy_model_con_metadata
+from services.bar_store import get_history
+
+MAX_AGE_DAYS = float(os.environ.get("LOCAL_MODEL_MAX_AGE_DAYS", "7"))
+MAX_NEW_BARS = int(os.environ.get("LOCAL_MODEL_MAX_NEW_BARS", "5"))
+MAX_TREES = int(os.environ.get("LOCAL_MODEL_MAX_TREES", "1500"))
+REFRESH_ROUNDS = int(os.environ.get("LOCAL_MODEL_REFRESH_ROUNDS", "20"))
+AUC_DROP = float(os.environ.get("LOCAL_MODEL_AUC_DROP", "0.05"))
+# mínimo de predicciones fuera de muestra para confiar en la AUC, y máximo guardado
+MIN_OOS = 30
+MAX_OOS = 250
+
+
+def _labeled_rows(ticker: str, df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.Series]:
+    """Features (del almacén) y etiquetas de las barras cuya etiqueta ya se conoce (excluye la última)."""
+    X, y = get_X_y(make_supervised(features_for(ticker, df), up_pct=0.01))
+    return X.iloc[:-1], y.iloc[:-1]
+
+
+def stale_reason(metadata: Optional[dict], n_new_bars: int, now: Optional[datetime] = None) -> Optional[str]:
+    """Motivo por el que el modelo está desactualizado, o None si sigue vigente."""
+    if not metadata or not metadata.get("last_bar"):
+        return "sin metadatos"
+    now = now or datetime.now()
+    trained_at = pd.Timestamp(metadata.get("trained_at") or metadata.get("ultima_actualizacion"))
+    age_days = (now - trained_at.to_pydatetime()).total_seconds() / 86400.0
+    if n_new_bars >= MAX_NEW_BARS:
+        return f"{n_new_bars} barras nuevas"
+    if age_days >= MAX_AGE_DAYS and n_new_bars > 0:
+        return f"{age_days:.1f} días desde el entrenamiento"
+    return None
+
+
+def _oos_auc(oos: dict) -> Optional[float]:
+    from sklearn.metrics import roc_auc_score
+
+    labels = np.asarray(oos.get("labels", []), dtype=int)
+    if len(labels) < MIN_OOS or labels.min() == labels.max():
+        return None
+    return float(roc_auc_score(labels, np.asarray(oos["scores"], dtype=float)))
+
+
+@timed("reentrenamiento_completo")
+def _full_refit(ticker: str, periodo: str, motivo: str):
+    print(f"[INFO] Reentrenamiento completo de {ticker}: {motivo}")
+    model, metadata = train_buy_model_con_metadata(ticker, periodo=periodo)
+    metadata["oos"] = {"scores": [], "labels": []}
+    metadata["refresh"] = {"accion": "full", "motivo": motivo}
+    guardar_modelo_en_mongo(ticker, model, metadata=metadata)
+    return model, metadata
+
+
+def _base_booster(model):
+    """Booster de `model` recortado a los árboles que usa al predecir.
+
+    Un modelo entrenado con early stopping guarda `best_iteration` y predice sólo
+    hasta ahí. Si el booster continuado heredara ese atributo, los árboles nuevos
+    nunca se usarían; por eso se descartan los árboles posteriores y se borran
+    best_iteration/best_score.
+    """
+    booster = model.get_booster()
+    best = booster.attr("best_iteration")
+    if best is not None:
+        booster = booster[: int(best) + 1]
+    booster.set_attr(best_iteration=None, best_score=None)
+    return booster
+
+
+def _continue_boosting(model, X_new: pd.DataFrame, y_new: pd.Series, rounds: int):
+    """Nuevo XGBClassifier que continúa el booster de `model` con `rounds` árboles más."""
+    from xgboost import XGBClassifier
+
+    params = model.get_params()
+    # sin conjunto de validación: el early stopping del entrenamiento completo no aplica
+    params.update(n_estimators=rounds, early_stopping_rounds=None)
+    updated = XGBClassifier(**params)
+    updated.fit(X_new, y_new, xgb_model=_base_booster(model), verbose=False)
+    return updated
+
+
+def refresh_local_model(
+    ticker: str,
+    model=None,
+    metadata: Optional[dict] = None,
+    force: bool = False,
+) -> Tuple[object, str]:
+    """Deja vigente el modelo local de `ticker`. Retorna (modelo, acción).
+
+    acción: "vigente", "incremental", "full", "nuevo" o "error" (el refresco
+    falló y se devuelve el modelo existente sin cambios).
+    """
+    if model is None:
+        with span("mongo"):
+            model = cargar_modelo_de_mongo(ticker)
+        metadata = None
+    if model is None:
+        model, _ = _full_refit(ticker, "6m", "modelo inexistente")
+        return model, "nuevo"
+    try:
+        return _refresh(ticker, model, metadata, force)
+    except Exception as e:
+        print(f"[WARN] No se pudo actualizar el modelo de {ticker}; se usa el existente: {e}")
+        return model, "error"
+
+
+def _refresh(ticker: str, model, metadata: Optional[dict], force: bool) -> Tuple[object, str]:
+    if metadata is None:
+        with span("metadatos"):
+            metadata = cargar_metadatos_de_mongo([ticker]).get(ticker)
+
+    periodo = (metadata or {}).get("periodo", "6m")
+    with span("historial"):
+        df = get_history(ticker, period=periodo)
+    # conteo barato sobre el índice; las features sólo se calculan si hay que actualizar
+    n_new = 0
+    if metadata and metadata.get("last_bar") and df is not None and len(df) > 1:
+        n_new = int((df.index[:-1] > pd.Timestamp(metadata["last_bar"])).sum())
+
+    motivo = stale_reason(metadata, n_new)
+    if motivo is None and not force:
+        return model, "vigente"
+    if motivo == "sin metadatos":
+        model, _ = _full_refit(ticker, periodo, motivo)
+        return model, "full"
+    if n_new == 0:
+        return model, "vigente"
+
+    with span("features"):
+        X, y = _labeled_rows(ticker, df)
+    nuevas = X.index > pd.Timestamp(metadata["last_bar"])
+    X_new, y_new = X[nuevas], y[nuevas]
+
+    # 1) predicciones fuera de muestra del modelo actual → AUC reciente
+    oos = dict(metadata.get("oos") or {"scores": [], "labels": []})
+    with span("prediccion_oos"):
+        scores = model.predict_proba(X_new)[:, 1]
+    oos["scores"] = (list(oos.get("scores", [])) + [float(s) for s in scores])[-MAX_OOS:]
+    oos["labels"] = (list(oos.get("labels", [])) + [int(v) for v in y_new])[-MAX_OOS:]
+    auc_reciente = _oos_auc(oos)
+    auc_base = metadata.get("auc_val")
+    if auc_reciente is not None and auc_base is not None and auc_reciente < auc_base - AUC_DROP:
+        model, _ = _full_refit(ticker, periodo, f"AUC reciente {auc_reciente:.3f} < {auc_base:.3f} - {AUC_DROP}")
+        return model, "full"
+
+    metadata = dict(metadata)
+    metadata.update(oos=oos, auc_reciente=auc_reciente)
+    metadata.pop("ultima_actualizacion", None)
+
+    # 2) con una sola clase XGBoost no puede seguir el boosting (falla, o deja un
+    # modelo de una clase): se conserva el modelo y se avanzan los metadatos
+    if y_new.nunique() < 2:
+        metadata.update(
+            trained_at=datetime.now().isoformat(timespec="seconds"),
+            last_bar=str(X_new.index[-1].date()),
+            refresh={"accion": "sin_cambios", "motivo": f"{motivo}; barras nuevas con una sola clase", "barras": n_new},
+        )
+        with span("guardar"):
+            guardar_modelo_en_mongo(ticker, model, metadata=metadata)
+        print(f"[INFO] Modelo de {ticker} sin cambios: las {n_new} barras nuevas tienen una sola clase.")
+        return model, "vigente"
+
+    # 3) continuar el boosting sólo con las barras nuevas
+    # sólo cuentan los árboles que se conservan (hasta best_iteration)
+    n_trees = int(_base_booster(model).num_boosted_rounds())
+    rounds = min(REFRESH_ROUNDS, MAX_TREES - n_trees)
+    if rounds <= 0:
+        model, _ = _full_refit(ticker, periodo, f"tope de {MAX_TREES} árboles alcanzado")
+        return model, "full"
+    with span("boosting_incremental", barras=n_new):
+        model = _continue_boosting(model, X_new, y_new, rounds)
+
+    metadata.update(
+        trained_at=datetime.now().isoformat(timespec="seconds"),
+        last_bar=str(X_new.index[-1].date()),
+        n_trees=int(model.get_booster().num_boosted_rounds()),
+        refresh={"accion": "incremental", "motivo": motivo, "barras": n_new},
+    )
+    with span("guardar"):
+        guardar_modelo_en_mongo(ticker, model, metadata=metadata)
+        dump_atomic(model, f"models/{ticker}_buy_model_optimizado.pkl")
+    print(f"[INFO] Modelo de {ticker} actualizado con {n_new} barras nuevas ({motivo}).")
+    return model, "incremental"
+
+
+def refresh_local_models(tickers: List[str], force: bool = False) -> Dict[str, Tuple[object, str]]:
+    """refresh_local_model para varios tickers con una consulta de modelos y una de metadatos.
+
+    Los tickers cuyo refresco falla quedan fuera del resultado (con un [WARN]).
+    """
+    tickers = list(tickers)
+    with span("mongo"):
+        modelos = cargar_modelos_de_mongo(tickers)
+        metadatos = cargar_metadatos_de_mongo(list(modelos))
+    out = {}
+    for t in tickers:
+        try:
+            out[t] = refresh_local_model(t, modelos.get(t), metadatos.get(t), force=force)
+        except Exception as e:
+            print(f"[WARN] No se pudo actualizar el modelo de {t}: {e}")
+    return out
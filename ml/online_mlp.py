@@ -0,0 +1,252 @@
+"""Aprendizaje en línea del MLP global (GLOBAL_MLP) con `partial_fit`.
+
+En lugar de reajustar scaler y red sobre toda la ventana en cada actualización:
+
+- El `StandardScaler` se actualiza con `partial_fit` (media/varianza acumuladas).
+- El `MLPClassifier` recibe `partial_fit` sólo con los registros de
+  acciones_usuario posteriores a la marca de agua, que se guarda en los
+  metadatos de la versión publicada en el registro de modelos. Si se hace
+  rollback de una versión, su marca de agua vuelve con ella.
+- Un buffer de repaso acotado (muestreo reservorio sobre todo lo visto) se
+  mezcla con lo nuevo para que la red no olvide el pasado.
+
+El MLP global también se actualiza desde barras (ml/global_models.py), con
+otra definición de etiqueta. Por eso cada versión guarda dos marcas de agua
+(`hwm`: "bars" e "interactions", ver `high_water_marks`), y cada camino
+conserva la del otro al publicar. Los buffers de repaso también están
+separados (`REPLAY_PATH` y `BARS_REPLAY_PATH`).
+
+El costo de cada actualización es proporcional a las muestras nuevas (más el
+repaso, que es como mucho `REPLAY_RATIO` veces eso), no al tamaño de la ventana.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import os
+import tempfile
+import warnings
+from datetime import datetime
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sklearn.exceptions import ConvergenceWarning
+from sklearn.neural_network import MLPClassifier
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+from config import model_registry
+from config.alman_model import guardar_modelo_en_mongo
+from config.profiling import span, timed
+from ml.features import FEATURE_COLUMNS
+
+MODEL_NAME = "GLOBAL_MLP"
+CHUNK_SIZE = int(os.environ.get("SELF_TRAIN_ONLINE_CHUNK", "5000"))
+REPLAY_SIZE = int(os.environ.get("SELF_TRAIN_REPLAY_SIZE", "5000"))
+REPLAY_RATIO = float(os.environ.get("SELF_TRAIN_REPLAY_RATIO", "1.0"))
+ONLINE_EPOCHS = int(os.environ.get("SELF_TRAIN_ONLINE_EPOCHS", "2"))
+# un buffer por origen de muestras: no se mezclan etiquetas de barras con las de acciones_usuario
+REPLAY_PATH = os.path.join("models", "online", f"{MODEL_NAME}_replay_interacciones.npz")
+BARS_REPLAY_PATH = os.path.join("models", "online", f"{MODEL_NAME}_replay_barras.npz")
+
+
+class ReplayBuffer:
+    """Muestra uniforme y acotada de todo lo visto (algoritmo de reservorio)."""
+
+    def __init__(self, capacity: int = REPLAY_SIZE, n_features: int = len(FEATURE_COLUMNS), seed: int = 0):
+        self.capacity = int(capacity)
+        self.X = np.empty((0, n_features), dtype=np.float32)
+        self.y = np.empty(0, dtype=np.int8)
+        self.n_seen = 0
+        self._rng = np.random.default_rng(seed)
+
+    def __len__(self) -> int:
+        return len(self.y)
+
+    def add(self, X: np.ndarray, y: np.ndarray) -> None:
+        X = np.asarray(X, dtype=np.float32)
+        y = np.asarray(y, dtype=np.int8)
+        libre = max(0, self.capacity - len(self))
+        if libre:
+            self.X = np.concatenate([self.X, X[:libre]])
+            self.y = np.concatenate([self.y, y[:libre]])
+        resto = np.arange(libre, len(y))
+        if len(resto):
+            # el elemento k-ésimo visto entra con probabilidad capacity / k
+            slots = self._rng.integers(0, self.n_seen + resto + 1)
+            entra = slots < self.capacity
+            self.X[slots[entra]] = X[resto[entra]]
+            self.y[slots[entra]] = y[resto[entra]]
+        self.n_seen += len(y)
+
+    def sample(self, n: int) -> Tuple[np.ndarray, np.ndarray]:
+        n = min(int(n), len(self))
+        if n <= 0:
+            return self.X[:0], self.y[:0]
+        idx = self._rng.choice(len(self), size=n, replace=False)
+        return self.X[idx], self.y[idx]
+
+    def save(self, path: str = REPLAY_PATH) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix=".tmp_", suffix=".npz", dir=os.path.dirname(path))
+        os.close(fd)
+        try:
+            np.savez(tmp, X=self.X, y=self.y, n_seen=np.int64(self.n_seen), capacity=np.int64(self.capacity))
+            os.replace(tmp, path)
+        except Exception:
+            with contextlib.suppress(OSError):
+                os.remove(tmp)
+            raise
+
+    @classmethod
+    def load(cls, path: str = REPLAY_PATH, capacity: int = REPLAY_SIZE) -> "ReplayBuffer":
+        buf = cls(capacity)
+        if os.path.exists(path):
+            try:
+                with np.load(path) as data:
+                    buf.X = data["X"][:capacity].astype(np.float32)
+                    buf.y = data["y"][:capacity].astype(np.int8)
+                    buf.n_seen = int(data["n_seen"])
+            except Exception as e:
+                print(f"[WARN] Buffer de repaso ilegible ({e}); se empieza vacío.")
+        return buf
+
+
+def new_online_pipeline() -> Pipeline:
+    mlp = MLPClassifier(
+        hidden_layer_sizes=(64, 32),
+        activation="relu",
+        solver="adam",
+        alpha=1e-4,
+        batch_size=128,
+        learning_rate_init=1e-3,
+        random_state=42,
+    )
+    return Pipeline([("scaler", StandardScaler()), ("mlp", mlp)])
+
+
+def load_online_pipeline(legacy_path: Optional[str] = "models/global_mlp.pkl") -> Pipeline:
+    """Versión activa del registro (o .pkl heredado) lista para `partial_fit`; nueva si no hay."""
+    pipe = model_registry.load_for_training(MODEL_NAME, legacy_path=legacy_path)
+    if pipe is None or not hasattr(pipe, "named_steps"):
+        return new_online_pipeline()
+    # partial_fit no admite early_stopping (sklearn)
+    pipe.named_steps["mlp"].early_stopping = False
+    return pipe
+
+
+def partial_update(pipe: Pipeline, X: np.ndarray, y: np.ndarray, buffer: ReplayBuffer,
+                   epochs: int = ONLINE_EPOCHS, replay_ratio: float = REPLAY_RATIO) -> None:
+    """Un paso en línea: scaler y MLP con las muestras nuevas más un repaso del buffer."""
+    scaler = pipe.named_steps["scaler"]
+    mlp = pipe.named_steps["mlp"]
+    X = np.asarray(X, dtype=np.float32)
+    y = np.asarray(y, dtype=np.int8)
+    # con nombres de columnas, igual que en predicción (DataFrame con FEATURE_COLUMNS)
+    scaler.partial_fit(pd.DataFrame(X, columns=FEATURE_COLUMNS, copy=False))
+
+    Xr, yr = buffer.sample(int(len(y) * replay_ratio))
+    Xb = np.concatenate([X, Xr])
+    yb = np.concatenate([y, yr]).astype(int)
+    Xb = scaler.transform(pd.DataFrame(Xb, columns=FEATURE_COLUMNS, copy=False))
+    rng = np.random.default_rng(buffer.n_seen)
+    mlp.batch_size = max(1, min(128, len(yb)))
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", ConvergenceWarning)
+        for _ in range(max(1, epochs)):
+            orden = rng.permutation(len(yb))
+            mlp.partial_fit(Xb[orden], yb[orden], classes=np.array([0, 1]))
+    buffer.add(X, y)
+
+
+def _legacy_marks(meta: dict) -> dict:
+    """Marcas de una versión publicada antes de que existiera `hwm`."""
+    marks = {"bars": (meta.get("training_window") or {}).get("end"), "interactions": None}
+    online = meta.get("online") or {}
+    if online.get("hwm"):
+        marks["interactions"] = online["hwm"]
+    elif meta.get("source") == "acciones_usuario":
+        # ajuste por ventana: aprendió lo registrado hasta que se publicó
+        marks["interactions"] = meta.get("created_at")
+    return marks
+
+
+def high_water_marks(name: str = MODEL_NAME) -> dict:
+    """{"bars", "interactions"}: hasta dónde aprendió la versión activa de cada origen (ISO o None).
+
+    Se leen del campo `hwm` de la versión activa. Si falta alguna (versiones
+    anteriores a ese campo), se toma la más reciente del historial del registro
+    hasta la versión activa inclusive.
+    """
+    meta = model_registry.get_metadata(name)
+    if not meta:
+        return {"bars": None, "interactions": None}
+    marks = dict(meta.get("hwm") or {})
+    if all(marks.get(k) for k in ("bars", "interactions")):
+        return marks
+    activa = meta.get("version")
+    historial = [m for m in model_registry.list_versions(name) if not activa or m.get("version", "") <= activa]
+    for previa in reversed(historial or [meta]):
+        heredadas = dict(previa.get("hwm") or {})
+        for k, v in _legacy_marks(previa).items():
+            heredadas.setdefault(k, v)
+        for k in ("bars", "interactions"):
+            if not marks.get(k) and heredadas.get(k):
+                marks[k] = heredadas[k]
+        if all(marks.get(k) for k in ("bars", "interactions")):
+            break
+    return {"bars": marks.get("bars"), "interactions": marks.get("interactions")}
+
+
+def _high_water_mark(marks: dict):
+    """Fecha del último registro ya aprendido (None: desde el principio)."""
+    hwm = marks.get("interactions")
+    return pd.Timestamp(hwm).to_pydatetime() if hwm else None
+
+
+@timed("train_mlp_online")
+def train_mlp_online(max_new: Optional[int] = None, model_path: str = "models/global_mlp.pkl"):
+    """Aplica al MLP global sólo los registros nuevos desde la marca de agua.
+
+    Retorna (pipeline, cantidad de muestras nuevas). Si no hay nada nuevo no publica.
+    """
+    from ml.self_training import iter_dataset_chunks
+
+    meta = model_registry.get_metadata(MODEL_NAME)
+    marks = high_water_marks()
+    hwm = _high_water_mark(marks)
+    pipe = load_online_pipeline(legacy_path=model_path)
+    buffer = ReplayBuffer.load()
+
+    n_new = 0
+    ultima = hwm
+    for X, y, fechas in iter_dataset_chunks(chunk_size=CHUNK_SIZE, limit=max_new, newest_first=False, since=hwm):
+        with span("partial_fit", filas=len(y)):
+            partial_update(pipe, X, y, buffer)
+        n_new += len(y)
+        ultima = fechas[-1]
+    if n_new == 0:
+        print("[INFO] MLP en línea: no hay registros nuevos.")
+        return pipe, 0
+
+    previo = ((meta or {}).get("online") or {}).get("n_seen", 0)
+    with span("guardar"):
+        model_registry.publish(MODEL_NAME, pipe, metadata={
+            "source": "acciones_usuario",
+            "labels": {"y_true": "real", "y_pred": "pseudo"},
+            "feature_columns": list(FEATURE_COLUMNS),
+            "hwm": {**marks, "interactions": pd.Timestamp(ultima).isoformat() if ultima is not None else None},
+            "online": {
+                "hwm": pd.Timestamp(ultima).isoformat() if ultima is not None else None,
+                "n_new": n_new,
+                "n_seen": int(previo) + n_new,
+                "replay": len(buffer),
+                "updated_at": datetime.now().isoformat(timespec="seconds"),
+            },
+        })
+        buffer.save()
+        model_registry.dump_atomic(pipe, model_path)
+        guardar_modelo_en_mongo(MODEL_NAME, pipe)
+    print(f"[OK] MLP en línea actualizado con {n_new} muestras nuevas.")
+    return pipe, n_new
@@ -3,20 +3,29 @@
 Este módulo expone:
 - basic_recommendation: regla simple basada en variación diaria.
 - smart_recommendation: predicción ML con soporte a modelos locales y globales.
+- smart_recommendation_many: la misma predicción para una lista de tickers en lote.
 
 Alinea la ingeniería de variables entre entrenamiento y predicción para evitar
 desajustes, y limpia los textos con acentos correctos.
+
+xgboost/scikit-learn no se importan acá: los trae el modelo que se carga
+(o ml.local_refresh, sólo para "local_xgb").
 """
 
 from datetime import datetime
-import joblib
-import yfinance as yf
+from typing import Dict, List, Optional
 import pandas as pd
 
+from config import model_registry
 from config.db import get_db
-from config.alman_model import guardar_modelo_en_mongo, cargar_modelo_de_mongo
-from ml.trainer import train_buy_model_optimizado
-from ml.features import add_basic_features, make_supervised, get_X_y, FEATURE_COLUMNS
+from config.profiling import span, timed
+from config.model_cache import load_file_cached
+from config.alman_model import cargar_modelo_de_mongo
+from ml.training_worker import submit_training
+from ml.feature_store import SCHEMA_HASH, feature_hash, get_feature_store
+from ml.features import FEATURE_COLUMNS, FEATURE_LOOKBACK
+from ml.streaming_features import latest_features
+from services.bar_store import get_history_many
 
 
 def basic_recommendation(change: float | None) -> str:
@@ -38,92 +47,84 @@ def basic_recommendation(change: float | None) -> str:
 
 
 def _load_global_model(kind: str):
-    """Carga el modelo global desde MongoDB (preferente) o filesystem.
+    """Carga el modelo global: versión activa del registro, luego MongoDB, luego filesystem.
 
-    kind: "GLOBAL_XGB" o "GLOBAL_MLP"
+    kind: "GLOBAL_XGB" o "GLOBAL_MLP". El registro se recarga solo cuando cambia
+    la versión activa; las otras rutas usan el caché de modelos, así que un
+    modelo sin cambios no se vuelve a deserializar.
     """
-    model = cargar_modelo_de_mongo(kind)
+    with span("registro_modelos"):
+        model = model_registry.get_current(kind)
+    if model is not None:
+        return model
+    with span("mongo"):
+        model = cargar_modelo_de_mongo(kind)
     if model is not None:
         return model
     try:
+        import joblib
+
         path = "models/global_xgb.pkl" if kind == "GLOBAL_XGB" else "models/global_mlp.pkl"
-        return joblib.load(path)
+        with span("archivo"):
+            return load_file_cached(path, joblib.load)
     except Exception:
         return None
 
 
-def smart_recommendation(
-    ticker: str = "AAPL",
-    registrar: bool = False,
-    model_type: str = "local_xgb",
-    prob_threshold: float = 0.5,
-) -> str:
-    """Genera una recomendación usando ML.
-
-    Parámetros:
-      - ticker: símbolo a evaluar.
-      - registrar: si True, guarda la recomendación en MongoDB.
-      - model_type:
-          * "local_xgb": modelo específico por ticker (entrena si no existe).
-          * "global_xgb": modelo XGBoost global (varios tickers).
-          * "global_mlp": red neuronal MLP global (varios tickers).
-      - prob_threshold: umbral de probabilidad para recomendar "comprar".
-    """
-    db = get_db()
-    model = None
-    accuracy = None
-
-    # Selección/carga de modelo
+@timed("modelo")
+def resolve_model(ticker: Optional[str], model_type: str):
+    """Selecciona/carga el modelo para `model_type`. Retorna (modelo, None) o (None, mensaje de error)."""
     if model_type == "local_xgb":
-        model = cargar_modelo_de_mongo(ticker)
-        if model is None:
-            try:
-                model, accuracy = train_buy_model_optimizado(ticker)
-            except Exception as e:
-                return f"No se pudo entrenar el modelo para {ticker}. Error: {e}"
-            guardar_modelo_en_mongo(ticker, model)
-    elif model_type == "global_xgb":
+        from ml.local_refresh import refresh_local_model
+
+        # carga el modelo y lo actualiza si está desactualizado (entrena si no existe)
+        try:
+            model, _ = refresh_local_model(ticker)
+        except Exception as e:
+            return None, f"No se pudo entrenar el modelo para {ticker}. Error: {e}"
+        return model, None
+    if model_type == "global_xgb":
         model = _load_global_model("GLOBAL_XGB")
         if model is None:
-            return "No hay modelo global XGB disponible. Ejecuta scripts/update_models.py."
-    elif model_type == "global_mlp":
+            return None, "No hay modelo global XGB disponible. Ejecuta scripts/update_models.py."
+        return model, None
+    if model_type == "global_mlp":
         model = _load_global_model("GLOBAL_MLP")
         if model is None:
-            return "No hay modelo global MLP disponible. Ejecuta scripts/update_models.py."
-    else:
-        return f"Tipo de modelo no soportado: {model_type}"
+            return None, "No hay modelo global MLP disponible. Ejecuta scripts/update_models.py."
+        return model, None
+    return None, f"Tipo de modelo no soportado: {model_type}"
 
-    # Datos → features alineadas
-    stock = yf.Ticker(ticker)
-    data = stock.history(period="2y")
-    if data.empty or len(data) < 20:
-        return "No hay suficientes datos para predecir."
 
-    df = add_basic_features(data.copy())
-    df = make_supervised(df, up_pct=0.01)
-    df.dropna(inplace=True)
-    if df.empty:
-        return "No hay suficientes datos válidos después del procesamiento."
+def predict_scores(model, X: pd.DataFrame):
+    """Probabilidad de "comprar" por fila, o la clase predicha si el modelo no da probabilidades.
 
-    row = df.iloc[-1]
-    row_df = pd.DataFrame([row[FEATURE_COLUMNS]])
+    Retorna (valores, es_probabilidad).
+    """
+    if hasattr(model, "predict_proba"):
+        return model.predict_proba(X)[:, 1], True
+    return model.predict(X).astype(int), False
 
-    # Predicción (probabilidad si es posible)
-    try:
-        if hasattr(model, "predict_proba"):
-            prob = float(model.predict_proba(row_df)[:, 1][0])
-            pred = 1 if prob >= prob_threshold else 0
-        else:
-            pred = int(model.predict(row_df)[0])
-            prob = None
-    except Exception as e:
-        return f"Error al predecir: {e}"
 
+@timed("registro_db")
+def registrar_recomendacion(
+    ticker: str,
+    row: pd.Series,
+    prob,
+    pred: int,
+    registrar: bool,
+    model_type: str,
+    prob_threshold: float,
+) -> None:
+    """Persiste la recomendación (si `registrar`) y el uso del modelo.
+
+    `row` es la fila de features usada; su `name` es la fecha de la barra.
+    """
+    db = get_db()
     recomendacion = "comprar" if pred == 1 else "no_comprar"
 
     if registrar:
-        # persistimos también el vector de features usado para permitir auto-entrenamiento
-        feature_values = {col: float(row[col]) for col in FEATURE_COLUMNS}
+        # referencia a las features usadas (almacén de features) para permitir auto-entrenamiento
         db.acciones_usuario.insert_one({
             "ticker": ticker,
             "fecha": datetime.now(),
@@ -131,19 +132,18 @@ def smart_recommendation(
             "recomendacion_ml": recomendacion,
             "probabilidad": prob,
             "y_pred": int(pred),
-            "features": feature_values,
+            "feature_ref": _feature_ref(row.name, row[FEATURE_COLUMNS]),
             "decision_usuario": None,
             "modelo_usado": model_type,
             "umbral": prob_threshold,
         })
 
-        # entrenamiento incremental del MLP global a partir de la BD (pseudo-etiquetas si no hay y_true)
+        # entrenamiento incremental del MLP global: se encola al worker en segundo plano
         try:
-            from ml.self_training import train_mlp_from_db_recent
-            train_mlp_from_db_recent(limit=500)
-        except Exception:
-            # si falla, no interrumpir la CLI
-            pass
+            submit_training(1)
+        except Exception as e:
+            # si falla, no interrumpir la CLI (p. ej. SELF_TRAIN_MODE inválido)
+            print(f"[WARN] No se pudo encolar el auto-entrenamiento: {e}")
 
     # Registrar uso del modelo (por ticker consultado)
     db.modelos_uso.update_one(
@@ -152,7 +152,207 @@ def smart_recommendation(
         upsert=True,
     )
 
+
+@timed("smart_recommendation")
+def smart_recommendation(
+    ticker: str = "AAPL",
+    registrar: bool = False,
+    model_type: str = "local_xgb",
+    prob_threshold: float = 0.5,
+) -> str:
+    """Genera una recomendación usando ML.
+
+    Parámetros:
+      - ticker: símbolo a evaluar.
+      - registrar: si True, guarda la recomendación en MongoDB.
+      - model_type:
+          * "local_xgb": modelo específico por ticker (entrena si no existe).
+          * "global_xgb": modelo XGBoost global (varios tickers).
+          * "global_mlp": red neuronal MLP global (varios tickers).
+      - prob_threshold: umbral de probabilidad para recomendar "comprar".
+    """
+    # Selección/carga de modelo
+    model, error = resolve_model(ticker, model_type)
+    if model is None:
+        return error
+
+    # Datos → features de la última barra (estado incremental, mismas features que ml/features.py)
+    with span("features"):
+        ultima = latest_features(ticker)
+    if ultima is None:
+        return "No hay suficientes datos para predecir."
+    _, row_df = ultima
+    row = row_df.iloc[0]
+
+    # Predicción (probabilidad si es posible)
+    try:
+        with span("prediccion"):
+            scores, es_prob = predict_scores(model, row_df)
+        if es_prob:
+            prob = float(scores[0])
+            pred = 1 if prob >= prob_threshold else 0
+        else:
+            pred = int(scores[0])
+            prob = None
+    except Exception as e:
+        return f"Error al predecir: {e}"
+
+    registrar_recomendacion(ticker, row, prob, pred, registrar, model_type, prob_threshold)
+    return _mensaje(pred)
+
+
+def _mensaje(pred: int) -> str:
     if pred == 1:
         return "El modelo predice que el precio subirá. Podría ser buen momento para comprar."
     else:
         return "El modelo predice que el precio bajará. Mejor esperar."
+
+
+def _feature_ref(fecha, values) -> dict:
+    """Referencia a la fila del almacén de features (ml/feature_store.py) usada para predecir.
+
+    acciones_usuario guarda esto en lugar de una copia de las features; el
+    auto-entrenamiento la resuelve por (ticker, fecha) y la descarta si el
+    esquema cambió o la fila ya no coincide con `values` (p. ej. la barra del
+    día se puntuó abierta y se guardó cerrada).
+    """
+    return {
+        "date": pd.Timestamp(fecha).normalize().to_pydatetime(),
+        "schema": SCHEMA_HASH,
+        "hash": feature_hash(values),
+    }
+
+
+def _latest_feature_rows(historias: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+    """Última fila válida de features por ticker (índice ticker, columnas Date + FEATURE_COLUMNS).
+
+    Las features salen del almacén: sólo se calculan las barras nuevas de cada
+    ticker, todas en una sola pasada.
+    """
+    # mismo mínimo que latest_features (smart_recommendation): las barras de la ventana más larga
+    frames = {t: df for t, df in historias.items() if df is not None and len(df) >= FEATURE_LOOKBACK}
+    feats = get_feature_store().features_many(frames)
+    filas = {t: df.dropna().tail(1) for t, df in feats.items()}
+    filas = {t: df for t, df in filas.items() if not df.empty}
+    if not filas:
+        return pd.DataFrame(columns=["Date"] + FEATURE_COLUMNS)
+    latest = pd.concat(filas, names=["ticker", "Date"])
+    return latest.reset_index("Date")[["Date"] + FEATURE_COLUMNS]
+
+
+@timed("smart_recommendation_many")
+def smart_recommendation_many(
+    tickers: List[str],
+    registrar: bool = False,
+    model_type: str = "local_xgb",
+    prob_threshold: float = 0.5,
+) -> Dict[str, dict]:
+    """Versión en lote de smart_recommendation para muchos tickers.
+
+    - Una sola descarga multi-ticker (vía almacén de barras).
+    - Features calculadas una vez para todo el panel.
+    - Un `predict_proba` por modelo (uno en total para modelos globales).
+    - Escrituras agrupadas: un `insert_many` y un `bulk_write`.
+
+    Retorna {ticker: {"recomendacion", "probabilidad", "y_pred", "mensaje"}}; si un
+    ticker no pudo evaluarse sólo trae "mensaje" con el motivo.
+    """
+    tickers = list(dict.fromkeys(t.upper() for t in tickers))
+    resultados: Dict[str, dict] = {}
+    if model_type not in ("local_xgb", "global_xgb", "global_mlp"):
+        return {t: {"mensaje": f"Tipo de modelo no soportado: {model_type}"} for t in tickers}
+
+    with span("historial"):
+        historias = get_history_many(tickers, period="2y")
+    with span("features"):
+        filas = _latest_feature_rows(historias)
+    for t in tickers:
+        if t not in filas.index:
+            resultados[t] = {"mensaje": "No hay suficientes datos para predecir."}
+    evaluables = [t for t in tickers if t in filas.index]
+
+    # Selección/carga de modelos: {modelo_key: (modelo, [tickers])}
+    grupos = {}
+    if model_type == "local_xgb":
+        from ml.local_refresh import refresh_local_models
+
+        with span("modelo"):
+            modelos = refresh_local_models(evaluables)
+        for t in evaluables:
+            if t not in modelos:
+                resultados[t] = {"mensaje": f"No se pudo entrenar el modelo para {t}."}
+                continue
+            grupos[t] = (modelos[t][0], [t])
+    else:
+        model, error = resolve_model(None, model_type)
+        if model is None:
+            return {t: resultados.get(t, {"mensaje": error}) for t in tickers}
+        grupos[model_type] = (model, evaluables)
+
+    # Predicción: un predict_proba por modelo sobre todas sus filas
+    for model, grupo in grupos.values():
+        if not grupo:
+            continue
+        X = filas.loc[grupo, FEATURE_COLUMNS]
+        try:
+            with span("prediccion"):
+                scores, es_prob = predict_scores(model, X)
+            if es_prob:
+                probs = scores
+                preds = (probs >= prob_threshold).astype(int)
+            else:
+                preds = scores
+                probs = [None] * len(grupo)
+        except Exception as e:
+            for t in grupo:
+                resultados[t] = {"mensaje": f"Error al predecir: {e}"}
+            continue
+        for t, prob, pred in zip(grupo, probs, preds):
+            resultados[t] = {
+                "recomendacion": "comprar" if pred == 1 else "no_comprar",
+                "probabilidad": None if prob is None else float(prob),
+                "y_pred": int(pred),
+                "mensaje": _mensaje(int(pred)),
+            }
+
+    predichos = [t for t in tickers if "y_pred" in resultados.get(t, {})]
+    if not predichos:
+        return {t: resultados[t] for t in tickers}
+
+    db = get_db()
+    ahora = datetime.now()
+    with span("registro_db"):
+        from pymongo import UpdateOne
+
+        if registrar:
+            db.acciones_usuario.insert_many([
+                {
+                    "ticker": t,
+                    "fecha": ahora,
+                    "precio": float(filas.at[t, "Close"]),
+                    "recomendacion_ml": resultados[t]["recomendacion"],
+                    "probabilidad": resultados[t]["probabilidad"],
+                    "y_pred": resultados[t]["y_pred"],
+                    "feature_ref": _feature_ref(filas.at[t, "Date"], filas.loc[t, FEATURE_COLUMNS]),
+                    "decision_usuario": None,
+                    "modelo_usado": model_type,
+                    "umbral": prob_threshold,
+                }
+                for t in predichos
+            ], ordered=False)
+
+            try:
+                submit_training(len(predichos))
+            except Exception as e:
+                print(f"[WARN] No se pudo encolar el auto-entrenamiento: {e}")
+
+        db.modelos_uso.bulk_write([
+            UpdateOne(
+                {"ticker": t},
+                {"$inc": {"veces_usado": 1}, "$set": {"ultima_vez": ahora}},
+                upsert=True,
+            )
+            for t in predichos
+        ], ordered=False)
+
+    return {t: resultados[t] for t in tickers}
@@ -3,16 +3,21 @@
 Construye un dataset desde la colección acciones_usuario utilizando:
 - y_true (si está disponible) como etiqueta real
 - si no, usa y_pred (pseudolabel) para seguir aprendiendo de forma incremental
+- las features de la barra referida por `feature_ref` (ticker, fecha), leídas del
+  almacén de features (ml/feature_store.py) si siguen siendo las puntuadas
+  (mismo esquema y hash); los registros anteriores traen una copia en
+  `features`, que se usa tal cual
 
-Guarda/actualiza el modelo GLOBAL_MLP en filesystem y MongoDB.
+Publica cada modelo GLOBAL_MLP como versión nueva en el registro
+(config.model_registry) y lo guarda también en filesystem y MongoDB.
 """
 
 from __future__ import annotations
 
 import os
-from typing import List, Tuple
+from datetime import datetime
+from typing import Iterator, Optional, Tuple
 
-import joblib
 import numpy as np
 import pandas as pd
 from sklearn.pipeline import Pipeline
@@ -21,25 +26,30 @@ from sklearn.neural_network import MLPClassifier
 from sklearn.exceptions import ConvergenceWarning
 import warnings
 
+from config import model_registry
 from config.db import get_db
+from config.profiling import span, timed
 from config.alman_model import guardar_modelo_en_mongo
+from ml.feature_store import SCHEMA_HASH, feature_hash, get_feature_store
 from ml.features import FEATURE_COLUMNS
 
 
 def _load_or_init_pipeline(model_path: str = "models/global_mlp.pkl") -> Pipeline:
-    if os.path.exists(model_path):
-        try:
-            pipe = joblib.load(model_path)
-            # asegurar flags deseados si el modelo ya existía
-            if hasattr(pipe, "named_steps") and "mlp" in pipe.named_steps:
-                mlp = pipe.named_steps["mlp"]
-                mlp.warm_start = True
-                mlp.early_stopping = True
-                mlp.validation_fraction = 0.1
-                mlp.n_iter_no_change = 5
-            return pipe
-        except Exception:
-            pass
+    # versión activa del registro; si no hay, el .pkl heredado
+    pipe = model_registry.load_for_training("GLOBAL_MLP", legacy_path=model_path)
+    if pipe is not None:
+        # asegurar flags deseados si el modelo ya existía
+        if hasattr(pipe, "named_steps") and "mlp" in pipe.named_steps:
+            mlp = pipe.named_steps["mlp"]
+            mlp.warm_start = True
+            mlp.early_stopping = True
+            mlp.validation_fraction = 0.1
+            mlp.n_iter_no_change = 5
+            # una versión entrenada en línea (partial_fit) no trae el estado de early stopping
+            if not hasattr(mlp, "validation_scores_"):
+                mlp.validation_scores_ = []
+                mlp.best_validation_score_ = -np.inf
+        return pipe
     mlp = MLPClassifier(
         hidden_layer_sizes=(64, 32),
         activation="relu",
@@ -61,49 +71,163 @@ def _load_or_init_pipeline(model_path: str = "models/global_mlp.pkl") -> Pipelin
     return pipe
 
 
-def _dataset_from_db(limit: int = 1000) -> Tuple[pd.DataFrame, np.ndarray]:
-    db = get_db()
-    cursor = db.acciones_usuario.find({"features": {"$exists": True}}).sort("fecha", -1).limit(limit)
-    X_list: List[List[float]] = []
-    y_list: List[int] = []
-    for doc in cursor:
-        feats = doc.get("features") or {}
-        # ordenar features según FEATURE_COLUMNS
-        row = []
-        valid = True
-        for c in FEATURE_COLUMNS:
-            if c in feats:
-                row.append(float(feats[c]))
-            else:
-                valid = False
-                break
-        if not valid:
+# sólo features (o su referencia), etiquetas y fecha: el resto del documento no viaja por la red
+_PROJECTION = {
+    "_id": 0, "ticker": 1, "fecha": 1, "y_true": 1, "y_pred": 1, "feature_ref": 1,
+    **{f"features.{c}": 1 for c in FEATURE_COLUMNS},
+}
+_FILTER = {"$and": [
+    {"$or": [{"feature_ref": {"$exists": True}}, {"features": {"$exists": True}}]},
+    {"$or": [{"y_true": {"$ne": None}}, {"y_pred": {"$ne": None}}]},
+]}
+# documentos por lote del cursor (cada uno pesa ~200 bytes proyectado)
+BATCH_SIZE = int(os.environ.get("SELF_TRAIN_BATCH_SIZE", "5000"))
+
+
+def _parse_doc(doc: dict, X: np.ndarray, y: np.ndarray, i: int) -> bool:
+    """Escribe el documento en la fila i de X/y. False si le faltan features o etiqueta."""
+    label = doc.get("y_true")
+    if label is None:
+        label = doc.get("y_pred")
+    if label is None:
+        return False
+    # vector ya resuelto desde el almacén, o la copia (dict) de registros anteriores
+    feats = doc.get("features")
+    try:
+        X[i] = feats if isinstance(feats, np.ndarray) else [feats[c] for c in FEATURE_COLUMNS]
+    except (KeyError, TypeError, ValueError):
+        return False
+    y[i] = int(label)
+    return True
+
+
+def _resolve_refs(docs: list) -> list:
+    """Completa `features` de los documentos con `feature_ref`, un acceso al almacén por ticker.
+
+    Descarta las referencias de otro esquema y las cuya fila actual no coincide
+    con el hash del vector puntuado (las anteriores al hash se aceptan).
+    """
+    pendientes = {}
+    descartadas = 0
+    for doc in docs:
+        ref = doc.get("feature_ref")
+        if doc.get("features") or not ref or not doc.get("ticker"):
             continue
-        y_true = doc.get("y_true")
-        y_pred = doc.get("y_pred")
-        if y_true is None and y_pred is None:
+        if ref.get("schema") != SCHEMA_HASH:
+            descartadas += 1
             continue
-        label = int(y_true if y_true is not None else y_pred)
-        X_list.append(row)
-        y_list.append(label)
-    if not X_list:
+        pendientes.setdefault(doc["ticker"], []).append(doc)
+    store = get_feature_store()
+    for ticker, grupo in pendientes.items():
+        filas = store.lookup(ticker, [d["feature_ref"]["date"] for d in grupo])[FEATURE_COLUMNS].to_numpy()
+        validas = ~np.isnan(filas).any(axis=1)
+        for doc, values, ok in zip(grupo, filas, validas):
+            esperado = doc["feature_ref"].get("hash")
+            if ok and esperado is not None and feature_hash(values) != esperado:
+                descartadas += 1
+            elif ok:
+                doc["features"] = values
+    if descartadas:
+        print(f"[INFO] {descartadas} referencias a features descartadas (esquema o vector distinto del puntuado).")
+    return docs
+
+
+def _docs(cursor) -> Iterator[dict]:
+    """Documentos del cursor con las referencias resueltas, por páginas de BATCH_SIZE."""
+    page = []
+    for doc in cursor:
+        page.append(doc)
+        if len(page) >= BATCH_SIZE:
+            yield from _resolve_refs(page)
+            page = []
+    if page:
+        yield from _resolve_refs(page)
+
+
+def _cursor(limit: Optional[int], newest_first: bool, since=None):
+    db = get_db()
+    flt = dict(_FILTER)
+    if since is not None:
+        flt["fecha"] = {"$gt": since}
+    cursor = db.acciones_usuario.find(flt, _PROJECTION).sort("fecha", -1 if newest_first else 1)
+    if limit:
+        cursor = cursor.limit(int(limit))
+    return cursor.batch_size(BATCH_SIZE)
+
+
+def count_new_samples(since=None, limit: int = 0) -> int:
+    """Registros de acciones_usuario utilizables posteriores a `since` (a lo sumo `limit` si > 0)."""
+    flt = dict(_FILTER)
+    if since is not None:
+        flt["fecha"] = {"$gt": since}
+    return int(get_db().acciones_usuario.count_documents(flt, limit=int(limit)))
+
+
+def iter_dataset_chunks(
+    chunk_size: int = 10000,
+    limit: Optional[int] = None,
+    newest_first: bool = True,
+    since=None,
+) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """Recorre acciones_usuario en bloques de `chunk_size` filas válidas.
+
+    Cada bloque es (X float32 [n, len(FEATURE_COLUMNS)], y int8, fechas), en el
+    orden del cursor. La memoria usada es la de un bloque, no la del total.
+    `since` filtra por fecha > since (útil para leer sólo lo nuevo).
+    """
+    X = np.empty((chunk_size, len(FEATURE_COLUMNS)), dtype=np.float32)
+    y = np.empty(chunk_size, dtype=np.int8)
+    fechas = np.empty(chunk_size, dtype=object)
+    n = 0
+    for doc in _docs(_cursor(limit, newest_first, since)):
+        if _parse_doc(doc, X, y, n):
+            fechas[n] = doc.get("fecha")
+            n += 1
+            if n == chunk_size:
+                yield X.copy(), y.copy(), fechas.copy()
+                n = 0
+    if n:
+        yield X[:n].copy(), y[:n].copy(), fechas[:n].copy()
+
+
+def _dataset_from_db(limit: int = 1000) -> Tuple[pd.DataFrame, np.ndarray]:
+    """Las últimas `limit` interacciones con features, en orden temporal ascendente.
+
+    Llena arreglos float32 preasignados desde el final (el cursor viene del más
+    reciente al más antiguo), así no hace falta invertir nada después.
+    """
+    db = get_db()
+    total = db.acciones_usuario.count_documents(_FILTER, limit=int(limit)) if limit else 0
+    X = np.empty((total, len(FEATURE_COLUMNS)), dtype=np.float32)
+    y = np.empty(total, dtype=np.int8)
+    pos = total
+    for doc in _docs(_cursor(total, newest_first=True)):
+        if pos == 0:
+            break
+        if _parse_doc(doc, X, y, pos - 1):
+            pos -= 1
+    if pos == total:
         raise ValueError("No hay suficientes muestras en BD para entrenar el MLP.")
-    X = pd.DataFrame(X_list, columns=FEATURE_COLUMNS)
-    y = np.array(y_list, dtype=int)
-    # invertimos para que el orden temporal vaya ascendente (antiguo → reciente)
-    X = X.iloc[::-1].reset_index(drop=True)
-    y = y[::-1]
-    return X, y
+    X_df = pd.DataFrame(X[pos:], columns=FEATURE_COLUMNS, copy=False)
+    return X_df, y[pos:].astype(int)
 
 
+@timed("train_mlp_from_db")
 def train_mlp_from_db_recent(limit: int = 500, model_path: str = "models/global_mlp.pkl"):
     """Entrena/actualiza el MLP global usando las últimas N muestras de la BD.
 
     Usa y_true cuando está disponible; si no, usa y_pred como pseudo-etiqueta.
     Guarda en filesystem y en MongoDB bajo la clave GLOBAL_MLP.
     """
-    X, y = _dataset_from_db(limit=limit)
-    pipe = _load_or_init_pipeline(model_path)
+    from ml.online_mlp import high_water_marks
+
+    with span("dataset"):
+        X, y = _dataset_from_db(limit=limit)
+    with span("modelo_previo"):
+        pipe = _load_or_init_pipeline(model_path)
+        marks = high_water_marks("GLOBAL_MLP")
+    # todo lo registrado hasta ahora entra en la ventana (o ya lo vio una versión previa)
+    marks["interactions"] = datetime.now().isoformat(timespec="seconds")
 
     # Ajustes dinámicos para evitar warnings y acelerar convergencia
     try:
@@ -117,11 +241,18 @@ def train_mlp_from_db_recent(limit: int = 500, model_path: str = "models/global_
         pass
 
     # Reducir ruido de convergencia en entrenamiento incremental
-    with warnings.catch_warnings():
+    with warnings.catch_warnings(), span("fit", filas=len(X)):
         warnings.simplefilter("ignore", ConvergenceWarning)
         pipe.fit(X, y)
 
-    os.makedirs("models", exist_ok=True)
-    joblib.dump(pipe, model_path)
-    guardar_modelo_en_mongo("GLOBAL_MLP", pipe)
+    with span("guardar"):
+        model_registry.publish("GLOBAL_MLP", pipe, metadata={
+            "source": "acciones_usuario",
+            "n_samples": int(len(X)),
+            "labels": {"y_true": "real", "y_pred": "pseudo"},
+            "feature_columns": list(FEATURE_COLUMNS),
+            "hwm": marks,
+        })
+        model_registry.dump_atomic(pipe, model_path)
+        guardar_modelo_en_mongo("GLOBAL_MLP", pipe)
     return pipe
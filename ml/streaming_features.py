@@ -0,0 +1,194 @@
+"""Features incrementales de la última barra para inferencia.
+
+En vez de recalcular `add_basic_features` sobre 2 años de historial para puntuar
+una sola fila, cada ticker mantiene un estado con las últimas 10 barras y sumas
+móviles. Cada barra nueva actualiza Return, MA5, MA10 y Volatility en O(1) y el
+estado produce el vector de FEATURE_COLUMNS de la barra más reciente, idéntico
+(salvo redondeo de punto flotante) al de ml/features.py.
+
+Antes de avanzar, el estado se compara con las barras leídas: si falta alguna
+de su ventana (hueco) o cambió su cierre (historial revisado, p. ej. ajuste por
+split), se reconstruye desde esas barras.
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import deque
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from ml.features import FEATURE_COLUMNS, FEATURE_LOOKBACK
+
+
+# cada cuántas actualizaciones se recalculan las sumas desde la ventana (acota el drift)
+_RESYNC_EVERY = 512
+
+
+class FeatureState:
+    """Estado de features de un ticker: ventana de 10 cierres y sumas móviles."""
+
+    WINDOW = FEATURE_LOOKBACK
+    SHORT = 5
+
+    def __init__(self):
+        self.closes: deque = deque(maxlen=self.WINDOW)
+        self.dates: deque = deque(maxlen=self.WINDOW)
+        self.last_bar: Optional[dict] = None
+        self.last_date: Optional[pd.Timestamp] = None
+        self.prev_close: Optional[float] = None
+        self._anchor = 0.0  # centra los cuadrados para evitar cancelación numérica
+        self._sum5 = 0.0
+        self._sum10 = 0.0
+        self._sumsq5 = 0.0
+        self._updates = 0
+
+    @property
+    def ready(self) -> bool:
+        """True cuando hay barras suficientes para todas las features (10)."""
+        return len(self.closes) == self.WINDOW and self.prev_close is not None
+
+    def _resync(self) -> None:
+        values = np.asarray(self.closes, dtype=float)
+        self._anchor = float(values[-1]) if len(values) else 0.0
+        centered = values - self._anchor
+        self._sum10 = float(centered.sum())
+        self._sum5 = float(centered[-self.SHORT:].sum())
+        self._sumsq5 = float((centered[-self.SHORT:] ** 2).sum())
+
+    def _push(self, close: float) -> None:
+        if not self.closes:
+            self._anchor = close
+        x = close - self._anchor
+        if len(self.closes) == self.WINDOW:
+            self._sum10 -= self.closes[0] - self._anchor
+        if len(self.closes) >= self.SHORT:
+            out = self.closes[-self.SHORT] - self._anchor
+            self._sum5 -= out
+            self._sumsq5 -= out * out
+        self.closes.append(close)
+        self._sum10 += x
+        self._sum5 += x
+        self._sumsq5 += x * x
+
+    def _replace_last(self, close: float) -> None:
+        old = self.closes[-1] - self._anchor
+        new = close - self._anchor
+        self.closes[-1] = close
+        self._sum10 += new - old
+        self._sum5 += new - old
+        self._sumsq5 += new * new - old * old
+
+    def update(self, date, open_, high, low, close, volume) -> None:
+        """Incorpora una barra. Si la fecha coincide con la última, la reemplaza
+        (barra del día aún abierta); fechas anteriores se ignoran."""
+        date = pd.Timestamp(date)
+        close = float(close)
+        if self.last_date is not None and date < self.last_date:
+            return
+        if self.last_date is not None and date == self.last_date:
+            self._replace_last(close)
+        else:
+            if self.closes:
+                self.prev_close = self.closes[-1]
+            self._push(close)
+            self.dates.append(date)
+            self._updates += 1
+            if self._updates % _RESYNC_EVERY == 0:
+                self._resync()
+        self.last_date = date
+        self.last_bar = {
+            "Open": float(open_),
+            "High": float(high),
+            "Low": float(low),
+            "Close": close,
+            "Volume": float(volume),
+        }
+
+    def matches(self, df: pd.DataFrame) -> bool:
+        """True si `df` tiene las barras de la ventana del estado con los mismos cierres.
+
+        La última barra del estado no se compara: puede ser la del día, que
+        `update` reemplaza.
+        """
+        if self.last_date is None:
+            return True
+        dates = list(self.dates)[:-1]
+        if df.empty or df.index[-1] < self.last_date or (dates and df.index[0] > dates[0]):
+            return False
+        if not dates:
+            return True
+        seen = df["Close"].reindex(dates).to_numpy(dtype=float)
+        return bool(np.allclose(seen, list(self.closes)[:-1], rtol=1e-12, atol=0.0))
+
+    def update_frame(self, df: pd.DataFrame) -> int:
+        """Incorpora las barras de `df` posteriores (o igual) a la última vista. Retorna cuántas.
+
+        Si `df` no coincide con la ventana del estado (ver `matches`), el estado
+        se reinicia y se reconstruye con las últimas barras de `df`.
+        """
+        if not self.matches(df):
+            self.__init__()
+        if self.last_date is not None:
+            df = df[df.index >= self.last_date]
+        else:
+            df = df.iloc[-self.WINDOW:]
+        for date, o, h, l, c, v in zip(df.index, df["Open"], df["High"], df["Low"], df["Close"], df["Volume"]):
+            self.update(date, o, h, l, c, v)
+        return len(df)
+
+    def vector(self) -> Optional[np.ndarray]:
+        """Vector FEATURE_COLUMNS de la última barra (None si faltan barras)."""
+        if not self.ready:
+            return None
+        close = self.closes[-1]
+        n = self.SHORT
+        var5 = max(0.0, (self._sumsq5 - self._sum5 * self._sum5 / n) / (n - 1))
+        values = {
+            **self.last_bar,
+            "Return": close / self.prev_close - 1.0,
+            "MA5": self._sum5 / n + self._anchor,
+            "MA10": self._sum10 / self.WINDOW + self._anchor,
+            "Volatility": float(np.sqrt(var5)),
+        }
+        return np.array([values[c] for c in FEATURE_COLUMNS], dtype=float)
+
+    def row(self) -> Optional[pd.DataFrame]:
+        """Igual que `vector` pero como DataFrame de una fila indexado por fecha."""
+        vec = self.vector()
+        if vec is None:
+            return None
+        return pd.DataFrame([vec], columns=FEATURE_COLUMNS, index=[self.last_date])
+
+
+_states: Dict[str, FeatureState] = {}
+_states_guard = threading.Lock()
+
+
+def get_state(ticker: str) -> FeatureState:
+    """Estado compartido del ticker (se crea vacío la primera vez)."""
+    with _states_guard:
+        return _states.setdefault(ticker.upper(), FeatureState())
+
+
+def latest_features(ticker: str, refresh_ttl: Optional[float] = None) -> Optional[Tuple[pd.Timestamp, pd.DataFrame]]:
+    """(fecha, fila de features) de la barra más reciente de `ticker`, o None sin datos suficientes.
+
+    Lee del almacén de barras sólo un tramo corto y avanza el estado con las
+    barras nuevas desde la última actualización.
+    """
+    from services.bar_store import get_history
+
+    state = get_state(ticker)
+    bars = get_history(ticker, period="2mo", refresh_ttl=refresh_ttl)
+    if bars is None or bars.empty:
+        return None
+    with _states_guard:
+        # con un hueco o un historial revisado, update_frame reconstruye el estado
+        state.update_frame(bars)
+        row = state.row()
+    if row is None:
+        return None
+    return state.last_date, row
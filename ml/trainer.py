@@ -1,14 +1,17 @@
 """Entrenamiento del modelo local por ticker (XGBoost).
 
-Incluye validación temporal, early stopping y manejo de desbalance.
+Incluye validación temporal, early stopping y manejo de desbalance, y un modo
+opcional de búsqueda de hiperparámetros (ml/tuning.py).
+
+xgboost, scikit-learn y joblib se importan al entrenar, no al importar el módulo.
 """
 import os
-import joblib
-import yfinance as yf
-from xgboost import XGBClassifier
-from sklearn.metrics import accuracy_score, roc_auc_score
+from datetime import datetime
 
-from ml.features import add_basic_features, make_supervised, get_X_y
+from config.profiling import span, timed
+from ml.feature_store import features_for
+from ml.features import make_supervised, get_X_y
+from services.bar_store import get_history
 
 
 def _train_val_split_time(X, y, val_size=0.2):
@@ -27,45 +30,61 @@ def _compute_scale_pos_weight(y):
     return max(1.0, neg / max(1, pos))
 
 
-def train_buy_model_optimizado(ticker="AAPL", periodo="6m"):
-    """Entrena/actualiza un modelo XGBoost local para un ticker.
+@timed("train_buy_model")
+def _train(ticker, periodo, tune=False, n_candidates=50, n_jobs=None):
+    import joblib
+    from sklearn.metrics import accuracy_score, roc_auc_score
+    from xgboost import XGBClassifier
 
-    Retorna (modelo, precisión en validación).
-    """
-    stock = yf.Ticker(ticker)
-    df = stock.history(period=periodo)
+    with span("historial"):
+        df = get_history(ticker, period=periodo)
     if df.empty:
         raise ValueError(f"No se pudo obtener datos para el ticker proporcionado. {ticker}")
 
-    df = add_basic_features(df)
-    df = make_supervised(df, up_pct=0.01)
-
-    X, y = get_X_y(df)
+    with span("features"):
+        df = features_for(ticker, df)
+        df = make_supervised(df, up_pct=0.01)
+        X, y = get_X_y(df)
     X_train, X_val, y_train, y_val = _train_val_split_time(X, y, val_size=0.2)
 
     scale_pos_weight = _compute_scale_pos_weight(y_train)
 
-    model = XGBClassifier(
-        n_estimators=1000,
+    params = dict(
         learning_rate=0.05,
         max_depth=5,
         subsample=0.8,
         colsample_bytree=0.8,
         reg_lambda=1.0,
         gamma=0.0,
+    )
+    leaderboard = None
+    if tune:
+        # la búsqueda sólo ve el tramo de entrenamiento; la validación final queda intacta
+        from ml.tuning import tune_xgb_params
+
+        with span("tuning", candidatos=n_candidates):
+            result = tune_xgb_params(X_train, y_train, n_candidates=n_candidates, n_jobs=n_jobs)
+        params = dict(result.best_params)
+        leaderboard = result.leaderboard
+        print(f"[INFO] Mejores parámetros ({ticker}): {params}")
+
+    model = XGBClassifier(
+        n_estimators=1000,
         objective="binary:logistic",
         eval_metric="auc",
         scale_pos_weight=scale_pos_weight,
+        early_stopping_rounds=50,
         random_state=42,
+        **params,
     )
 
-    model.fit(
-        X_train,
-        y_train,
-        eval_set=[(X_val, y_val)],
-        verbose=False,
-        early_stopping_rounds=50,
-    )
+    with span("fit"):
+        model.fit(
+            X_train,
+            y_train,
+            eval_set=[(X_val, y_val)],
+            verbose=False,
+        )
 
     y_pred = model.predict(X_val)
     try:
@@ -77,6 +96,51 @@ def train_buy_model_optimizado(ticker="AAPL", periodo="6m"):
     print(f"Precisión del modelo ({ticker}): {acc:.2f} | AUC: {auc:.3f}")
 
     os.makedirs("models", exist_ok=True)
-    joblib.dump(model, f"models/{ticker}_buy_model_optimizado.pkl")
+    with span("guardar"):
+        joblib.dump(model, f"models/{ticker}_buy_model_optimizado.pkl")
+
+    ahora = datetime.now().isoformat(timespec="seconds")
+    metadata = {
+        "trained_at": ahora,
+        "full_fit_at": ahora,
+        # la última barra no tiene etiqueta real todavía (no se conoce el día siguiente)
+        "last_bar": str(X.index[-2].date()) if len(X) > 1 else None,
+        "n_trees": int(model.get_booster().num_boosted_rounds()),
+        "auc_val": None if auc != auc else float(auc),
+        "acc_val": float(acc),
+        "periodo": periodo,
+        "params": params,
+    }
+    return model, acc, leaderboard, metadata
+
+
+def train_buy_model_optimizado(ticker="AAPL", periodo="6m", tune=False, n_candidates=50, n_jobs=None):
+    """Entrena/actualiza un modelo XGBoost local para un ticker.
 
+    Con `tune=True` elige los hiperparámetros con una búsqueda walk-forward
+    en paralelo (ver ml/tuning.py) en lugar de usar los fijos.
+
+    Retorna (modelo, precisión en validación).
+    """
+    model, acc, _, _ = _train(ticker, periodo, tune=tune, n_candidates=n_candidates, n_jobs=n_jobs)
     return model, acc
+
+
+def tune_buy_model(ticker="AAPL", periodo="2y", n_candidates=50, n_jobs=None):
+    """Búsqueda de hiperparámetros + entrenamiento final del modelo local.
+
+    Retorna (mejor modelo, leaderboard) donde el leaderboard es un DataFrame
+    con AUC promedio walk-forward, folds evaluados y parámetros de cada candidato.
+    """
+    model, _, leaderboard, _ = _train(ticker, periodo, tune=True, n_candidates=n_candidates, n_jobs=n_jobs)
+    return model, leaderboard
+
+
+def train_buy_model_con_metadata(ticker="AAPL", periodo="6m"):
+    """Como train_buy_model_optimizado, pero retorna (modelo, metadatos de entrenamiento).
+
+    Los metadatos (fecha, última barra usada, árboles, AUC de validación) son los
+    que usa ml/local_refresh.py para decidir cuándo actualizar el modelo.
+    """
+    model, _, _, metadata = _train(ticker, periodo)
+    return model, metadata
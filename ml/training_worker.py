@@ -0,0 +1,221 @@
+"""Worker en segundo plano para el auto-entrenamiento del MLP global.
+
+La ruta de predicción sólo encola "hay N muestras nuevas" y retorna. Un hilo
+daemon agrupa las ráfagas de registros y reentrena una sola vez cuando:
+
+- se acumularon al menos `min_new_samples` muestras nuevas, o
+- hay muestras pendientes y pasaron `min_interval_s` segundos desde el último
+  entrenamiento (o desde que arrancó el worker).
+
+Las muestras pendientes no dependen del proceso: al arrancar, el worker cuenta
+en acciones_usuario los registros posteriores a la marca de agua de la versión
+activa (ml/online_mlp.py), así lo que dejó una sesión corta de la CLI suma para
+la siguiente. Al salir se espera hasta SELF_TRAIN_EXIT_WAIT_S segundos a un
+entrenamiento en curso.
+
+Configurable por entorno: SELF_TRAIN_MIN_SAMPLES, SELF_TRAIN_MIN_INTERVAL_S,
+SELF_TRAIN_LIMIT y SELF_TRAIN_MODE ("online", por defecto, aprende sólo los
+registros nuevos con ml/online_mlp.py; "window" reajusta sobre las últimas
+SELF_TRAIN_LIMIT muestras).
+"""
+
+from __future__ import annotations
+
+import atexit
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Optional
+
+MODES = ("online", "window")
+
+
+class SelfTrainingWorker:
+    """Agrupa pedidos de reentrenamiento y los ejecuta en un hilo propio."""
+
+    def __init__(
+        self,
+        train_fn: Optional[Callable[[], object]] = None,
+        min_new_samples: int = 25,
+        min_interval_s: float = 300.0,
+        limit: int = 500,
+        mode: str = "online",
+        backlog_fn: Optional[Callable[[], int]] = None,
+    ):
+        self.train_fn = train_fn or self._default_train
+        # muestras ya registradas y todavía no aprendidas (de este u otros procesos)
+        self.backlog_fn = backlog_fn or self._default_backlog
+        # "online": partial_fit sólo con lo nuevo; "window": fit sobre las últimas `limit` muestras
+        if mode not in MODES:
+            raise ValueError(f"Modo de auto-entrenamiento desconocido: {mode!r} (opciones: {', '.join(MODES)})")
+        self.mode = mode
+        self.min_new_samples = max(1, int(min_new_samples))
+        self.min_interval_s = float(min_interval_s)
+        self.limit = limit
+
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self._pending = 0
+        self._state = "idle"
+        self._last_run_mono = time.monotonic()
+        self._stats = {
+            "submits": 0,
+            "runs": 0,
+            "failures": 0,
+            "samples_consumed": 0,
+            "recovered": 0,
+            "last_started": None,
+            "last_finished": None,
+            "last_duration_s": None,
+            "last_error": None,
+        }
+
+    def _default_train(self):
+        if self.mode == "online":
+            from ml.online_mlp import train_mlp_online
+
+            return train_mlp_online()
+        from ml.self_training import train_mlp_from_db_recent
+
+        return train_mlp_from_db_recent(limit=self.limit)
+
+    def _default_backlog(self) -> int:
+        from ml.online_mlp import high_water_marks
+        from ml.self_training import count_new_samples
+
+        hwm = high_water_marks().get("interactions")
+        since = datetime.fromisoformat(hwm) if hwm else None
+        return count_new_samples(since=since, limit=self.min_new_samples)
+
+    # ---- API ------------------------------------------------------------
+    def submit(self, n_new: int = 1) -> None:
+        """Registra `n_new` muestras nuevas; no bloquea ni entrena en el hilo llamador."""
+        with self._cond:
+            self._pending += max(0, int(n_new))
+            self._stats["submits"] += 1
+            self._ensure_started()
+            self._cond.notify()
+
+    def status(self) -> dict:
+        """Estado actual del worker (pendientes, corridas, último error, etc.)."""
+        with self._cond:
+            data = dict(self._stats)
+            data.update(
+                state=self._state,
+                pending=self._pending,
+                alive=self._thread is not None and self._thread.is_alive(),
+                min_new_samples=self.min_new_samples,
+                min_interval_s=self.min_interval_s,
+                seconds_since_last_run=round(time.monotonic() - self._last_run_mono, 3),
+            )
+        return data
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Detiene el hilo, esperando hasta `timeout` segundos a un entrenamiento en curso.
+
+        Las muestras pendientes no se entrenan acá: siguen en acciones_usuario
+        después de la marca de agua y el worker del próximo proceso las cuenta
+        al arrancar.
+        """
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            thread = self._thread
+            training = self._state == "training"
+        if thread is not None and thread is not threading.current_thread():
+            if training:
+                print("[INFO] Esperando a que termine el auto-entrenamiento en curso...")
+            thread.join(timeout)
+
+    # ---- interno --------------------------------------------------------
+    def _ensure_started(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="self-training-worker", daemon=True)
+            self._thread.start()
+
+    def _wait_until_ready(self) -> Optional[int]:
+        """Bloquea hasta que corresponda entrenar; retorna las muestras tomadas (None = parar)."""
+        with self._cond:
+            while not self._stopping:
+                if self._pending > 0:
+                    elapsed = time.monotonic() - self._last_run_mono
+                    if self._pending >= self.min_new_samples or elapsed >= self.min_interval_s:
+                        taken, self._pending = self._pending, 0
+                        self._state = "training"
+                        return taken
+                    self._state = "waiting"
+                    self._cond.wait(timeout=self.min_interval_s - elapsed)
+                else:
+                    self._state = "idle"
+                    self._cond.wait()
+            return None
+
+    def _recover_backlog(self) -> None:
+        """Suma a las pendientes las muestras registradas que ninguna versión aprendió todavía."""
+        try:
+            backlog = int(self.backlog_fn())
+        except Exception as e:
+            print(f"[WARN] No se pudieron contar las muestras pendientes: {e}")
+            return
+        with self._cond:
+            # lo encolado en este proceso ya está en la base: no se suma dos veces
+            if backlog > self._pending:
+                self._stats["recovered"] = backlog - self._pending
+                self._pending = backlog
+
+    def _run(self) -> None:
+        self._recover_backlog()
+        while True:
+            taken = self._wait_until_ready()
+            if taken is None:
+                return
+            started = time.monotonic()
+            with self._cond:
+                self._stats["last_started"] = datetime.now()
+            error = None
+            try:
+                self.train_fn()
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            with self._cond:
+                self._last_run_mono = time.monotonic()
+                self._stats["runs"] += 1
+                self._stats["samples_consumed"] += taken
+                self._stats["last_finished"] = datetime.now()
+                self._stats["last_duration_s"] = round(self._last_run_mono - started, 3)
+                self._stats["last_error"] = error
+                if error is not None:
+                    self._stats["failures"] += 1
+                self._state = "idle"
+
+
+_worker: Optional[SelfTrainingWorker] = None
+_worker_guard = threading.Lock()
+
+
+def get_worker() -> SelfTrainingWorker:
+    """Worker compartido del proceso (creado al primer uso)."""
+    global _worker
+    with _worker_guard:
+        if _worker is None:
+            _worker = SelfTrainingWorker(
+                min_new_samples=int(os.environ.get("SELF_TRAIN_MIN_SAMPLES", "25")),
+                min_interval_s=float(os.environ.get("SELF_TRAIN_MIN_INTERVAL_S", "300")),
+                limit=int(os.environ.get("SELF_TRAIN_LIMIT", "500")),
+                mode=os.environ.get("SELF_TRAIN_MODE", "online"),
+            )
+            atexit.register(_worker.stop, float(os.environ.get("SELF_TRAIN_EXIT_WAIT_S", "30")))
+        return _worker
+
+
+def submit_training(n_new: int = 1) -> None:
+    """Encola `n_new` muestras nuevas para el auto-entrenamiento y retorna enseguida."""
+    get_worker().submit(n_new)
+
+
+def training_status() -> dict:
+    """Estado del worker compartido."""
+    return get_worker().status()
@@ -0,0 +1,207 @@
+"""Búsqueda de hiperparámetros para el XGBoost local, con validación walk-forward.
+
+- Validación cruzada temporal con ventana creciente (walk-forward): cada fold
+  entrena con el pasado y valida con el tramo siguiente.
+- Poda por rondas (successive halving): todos los candidatos corren el primer
+  fold; sólo el mejor 1/eta según AUC promedio pasa al siguiente.
+- Candidatos en paralelo en un pool de procesos; `nthread` de XGBoost se reparte
+  entre workers para no sobre-suscribir núcleos.
+- Las matrices cuantizadas (QuantileDMatrix) se construyen una vez por worker
+  con cortes comunes, y las reutilizan todos los candidatos.
+"""
+
+from __future__ import annotations
+
+import math
+import multiprocessing as mp
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_PARAMS = dict(
+    learning_rate=0.05,
+    max_depth=5,
+    min_child_weight=1.0,
+    subsample=0.8,
+    colsample_bytree=0.8,
+    reg_lambda=1.0,
+    gamma=0.0,
+)
+
+MAX_BIN = 256
+NUM_BOOST_ROUND = 1000
+EARLY_STOPPING_ROUNDS = 25  # más corto que el entrenamiento final: sólo se compara
+
+
+class TuningResult(NamedTuple):
+    """Parámetros ganadores y tabla de candidatos (una fila por candidato, mejor primero)."""
+
+    best_params: dict
+    best_n_estimators: int
+    leaderboard: pd.DataFrame
+
+
+def sample_candidates(n: int, seed: int = 42) -> List[dict]:
+    """`n` configuraciones aleatorias; la primera es siempre la configuración por defecto."""
+    rng = np.random.default_rng(seed)
+    out = [dict(DEFAULT_PARAMS)]
+    while len(out) < n:
+        out.append(dict(
+            learning_rate=float(np.exp(rng.uniform(np.log(0.01), np.log(0.3)))),
+            max_depth=int(rng.integers(2, 9)),
+            min_child_weight=float(np.exp(rng.uniform(0.0, np.log(10.0)))),
+            subsample=float(rng.uniform(0.5, 1.0)),
+            colsample_bytree=float(rng.uniform(0.5, 1.0)),
+            reg_lambda=float(np.exp(rng.uniform(np.log(0.1), np.log(10.0)))),
+            gamma=float(rng.choice([0.0, 0.0, 0.1, 0.5, 1.0])),
+        ))
+    return out[:n]
+
+
+def walk_forward_folds(n: int, n_splits: int = 4, min_train: float = 0.4) -> List[Tuple[int, int]]:
+    """Folds (fin_train, fin_val) con ventana creciente sobre n filas ordenadas en el tiempo."""
+    start = int(n * min_train)
+    step = (n - start) // n_splits
+    if step < 10:
+        raise ValueError(f"Muy pocas filas ({n}) para {n_splits} folds walk-forward.")
+    return [(start + i * step, start + (i + 1) * step if i < n_splits - 1 else n) for i in range(n_splits)]
+
+
+def _scale_pos_weight(y: np.ndarray) -> float:
+    pos = int((y == 1).sum())
+    neg = int((y == 0).sum())
+    if pos == 0:
+        return 1.0
+    return max(1.0, neg / max(1, pos))
+
+
+# ---- estado por worker --------------------------------------------------------
+
+_worker: Dict[str, object] = {}
+
+
+def _init_worker(X: np.ndarray, y: np.ndarray, folds: List[Tuple[int, int]], nthread: int) -> None:
+    """Construye las matrices cuantizadas de todos los folds una sola vez por proceso."""
+    import xgboost as xgb
+
+    # cortes de cuantización comunes a todos los folds y candidatos
+    ref = xgb.QuantileDMatrix(X, y, max_bin=MAX_BIN, nthread=nthread)
+    mats = []
+    for train_end, val_end in folds:
+        dtrain = xgb.QuantileDMatrix(X[:train_end], y[:train_end], ref=ref, max_bin=MAX_BIN, nthread=nthread)
+        dval = xgb.QuantileDMatrix(X[train_end:val_end], y[train_end:val_end], ref=dtrain, max_bin=MAX_BIN, nthread=nthread)
+        mats.append((dtrain, dval, _scale_pos_weight(y[:train_end])))
+    _worker.update(mats=mats, nthread=nthread)
+
+
+def _eval_fold(task: Tuple[int, dict, int]) -> Tuple[int, int, float, int]:
+    """Entrena un candidato en un fold. Retorna (candidato, fold, auc, mejor_iteración)."""
+    import xgboost as xgb
+
+    cand_id, params, fold = task
+    dtrain, dval, spw = _worker["mats"][fold]
+    booster = xgb.train(
+        {
+            **params,
+            "objective": "binary:logistic",
+            "eval_metric": "auc",
+            "tree_method": "hist",
+            "max_bin": MAX_BIN,
+            "scale_pos_weight": spw,
+            "nthread": _worker["nthread"],
+            "seed": 42,
+        },
+        dtrain,
+        num_boost_round=NUM_BOOST_ROUND,
+        evals=[(dval, "val")],
+        early_stopping_rounds=EARLY_STOPPING_ROUNDS,
+        verbose_eval=False,
+    )
+    auc = float(booster.best_score)
+    if math.isnan(auc):
+        auc = 0.5
+    return cand_id, fold, auc, int(booster.best_iteration) + 1
+
+
+def tune_xgb_params(
+    X: pd.DataFrame,
+    y: pd.Series,
+    n_candidates: int = 50,
+    n_splits: int = 4,
+    eta: int = 3,
+    n_jobs: Optional[int] = None,
+    seed: int = 42,
+) -> TuningResult:
+    """Búsqueda aleatoria con poda por rondas sobre folds walk-forward.
+
+    `X`/`y` deben venir ordenados en el tiempo. Retorna los mejores parámetros,
+    el número de árboles sugerido (promedio de mejores iteraciones) y el leaderboard.
+    """
+    Xv = np.ascontiguousarray(X.to_numpy(dtype=np.float32))
+    yv = np.asarray(y, dtype=np.int32)
+    folds = walk_forward_folds(len(Xv), n_splits=n_splits)
+    candidates = sample_candidates(n_candidates, seed=seed)
+
+    cpus = os.cpu_count() or 1
+    n_jobs = max(1, min(n_jobs or cpus, n_candidates, cpus))
+    nthread = max(1, cpus // n_jobs)
+
+    scores: Dict[int, List[float]] = {i: [] for i in range(len(candidates))}
+    iters: Dict[int, List[int]] = {i: [] for i in range(len(candidates))}
+    alive = list(range(len(candidates)))
+
+    def run_round(pool_map, fold: int) -> None:
+        tasks = [(i, candidates[i], fold) for i in alive]
+        for cand_id, _, auc, best_iter in pool_map(_eval_fold, tasks):
+            scores[cand_id].append(auc)
+            iters[cand_id].append(best_iter)
+
+    def mean_auc(i: int) -> float:
+        return float(np.mean(scores[i])) if scores[i] else float("-inf")
+
+    if n_jobs == 1:
+        _init_worker(Xv, yv, folds, nthread)
+        pool_map, pool = map, None
+    else:
+        # spawn: XGBoost usa OpenMP y hacer fork de un proceso que ya lo inicializó puede colgarse
+        pool = ProcessPoolExecutor(
+            max_workers=n_jobs,
+            mp_context=mp.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(Xv, yv, folds, nthread),
+        )
+        pool_map = pool.map
+    try:
+        for fold in range(len(folds)):
+            run_round(pool_map, fold)
+            if fold < len(folds) - 1:
+                keep = max(1, math.ceil(len(alive) / eta))
+                alive = sorted(alive, key=mean_auc, reverse=True)[:keep]
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    rows = []
+    for i, params in enumerate(candidates):
+        rows.append({
+            "candidato": i,
+            "auc_medio": mean_auc(i) if scores[i] else float("nan"),
+            "folds": len(scores[i]),
+            "podado": len(scores[i]) < len(folds),
+            "n_estimators": int(np.mean(iters[i])) if iters[i] else None,
+            **params,
+        })
+    leaderboard = (
+        pd.DataFrame(rows)
+        .sort_values(["folds", "auc_medio"], ascending=[False, False], kind="stable")
+        .reset_index(drop=True)
+    )
+    best = leaderboard.iloc[0]
+    return TuningResult(
+        best_params=candidates[int(best["candidato"])],
+        best_n_estimators=int(best["n_estimators"]),
+        leaderboard=leaderboard,
+    )
@@ -0,0 +1,54 @@
+"""Backtest walk-forward de los modelos para una lista de tickers y muchos umbrales."""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from config.profiling import add_profile_args, profiling_session
+from ml.backtest import MODEL_TYPES, backtest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtest walk-forward de los modelos ML")
+    parser.add_argument("--tickers", nargs="+", required=True, help="Lista de tickers")
+    parser.add_argument("--model", choices=MODEL_TYPES, default="local_xgb")
+    parser.add_argument("--period", default="5y", help="Historial a usar (ej: 2y, 5y)")
+    parser.add_argument("--retrain-every", type=int, default=63, help="Barras entre reentrenamientos")
+    parser.add_argument("--min-train", type=int, default=252, help="Barras antes del primer modelo")
+    parser.add_argument("--thresholds", default="0.30:0.80:0.01", help="inicio:fin:paso de prob_threshold")
+    parser.add_argument("--jobs", type=int, default=None, help="Procesos en paralelo (modelos locales)")
+    parser.add_argument("--out", default=None, help="Prefijo para guardar <out>_metrics.csv y <out>_curves.csv")
+    add_profile_args(parser)
+    args = parser.parse_args()
+    with profiling_session(args, "scripts.backtest"):
+        _run(args)
+
+
+def _run(args):
+
+    inicio, fin, paso = (float(v) for v in args.thresholds.split(":"))
+    thresholds = np.round(np.arange(inicio, fin + paso / 2, paso), 4)
+
+    res = backtest(
+        args.tickers,
+        model_type=args.model,
+        period=args.period,
+        retrain_every=args.retrain_every,
+        min_train=args.min_train,
+        thresholds=thresholds,
+        n_jobs=args.jobs,
+    )
+    print(f"[INFO] {len(res.scores)} predicciones, {res.scores['ticker'].nunique()} tickers, "
+          f"{res.scores['Date'].min():%Y-%m-%d} → {res.scores['Date'].max():%Y-%m-%d}")
+    with pd.option_context("display.float_format", "{:.4f}".format, "display.width", 140):
+        print(res.metrics[res.metrics["operaciones"] > 0].sort_values("sharpe", ascending=False).head(10))
+
+    if args.out:
+        res.metrics.to_csv(f"{args.out}_metrics.csv")
+        res.curves.to_csv(f"{args.out}_curves.csv")
+        print(f"[OK] Resultados guardados con prefijo {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,24 +4,23 @@ import sys
 from datetime import datetime
 
 try:
-    from pymongo import MongoClient
+    from config.db import get_client, get_db, pool_stats, connection_settings
 except Exception as e:
     print(f"[ERROR] pymongo no está instalado: {e}")
     sys.exit(2)
 
 
 def main():
-    uri = "mongodb://localhost:27017/"
+    uri = connection_settings()["uri"]
     print(f"[INFO] Conectando a MongoDB en {uri} ...")
     try:
-        client = MongoClient(uri, serverSelectionTimeoutMS=3000)
-        client.server_info()  # fuerza la conexión
+        get_client().server_info()  # fuerza la conexión
     except Exception as e:
         print(f"[ERROR] No se pudo conectar a MongoDB: {e}")
         sys.exit(1)
 
-    db = client["acciones_ml"]
-    print("[INFO] Conectado. DB: acciones_ml")
+    db = get_db()
+    print(f"[INFO] Conectado. DB: {db.name}")
 
     try:
         collections = db.list_collection_names()
@@ -64,6 +63,7 @@ def main():
     preview("modelos_binarios", sort_field="ultima_actualizacion")
     preview("modelos_uso", sort_field="ultima_vez")
 
+    print(f"[INFO] Pool de conexiones: {pool_stats()}")
     print("[OK] Revisión completada.")
 
 
@@ -0,0 +1,32 @@
+"""Administra el almacén de features (ml/feature_store.py).
+
+    python -m scripts.features status    # esquema actual y esquemas anteriores
+    python -m scripts.features cleanup   # borra los directorios de esquemas anteriores
+"""
+
+import argparse
+
+from ml.feature_store import DEFAULT_ROOT, FeatureStore
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Almacén de features: esquemas")
+    parser.add_argument("--root", default=DEFAULT_ROOT, help="Directorio del almacén (FEATURE_STORE_DIR)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("status", help="Esquema actual y esquemas anteriores")
+    sub.add_parser("cleanup", help="Borra las features de esquemas anteriores (detené antes los procesos viejos)")
+    args = parser.parse_args()
+
+    store = FeatureStore(args.root)
+    if args.cmd == "status":
+        print(f"  esquema actual:      {store.schema}")
+        print(f"  esquemas anteriores: {', '.join(store.old_schemas()) or '-'}")
+    elif args.cmd == "cleanup":
+        removed = store.purge_old_schemas()
+        for name in removed:
+            print(f"[INFO] Features del esquema {name} eliminadas.")
+        print(f"[OK] {len(removed)} esquemas anteriores eliminados.")
+
+
+if __name__ == "__main__":
+    main()
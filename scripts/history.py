@@ -0,0 +1,123 @@
+"""Administra la colección `history`: time series, migración y resumen diario.
+
+    python -m scripts.history setup      # crea la time series / ajusta el TTL
+    python -m scripts.history migrate    # convierte una colección común existente
+    python -m scripts.history rollup     # resume snapshots nuevos en history_daily (cron)
+    python -m scripts.history status
+"""
+
+import argparse
+from datetime import datetime
+
+from config.db import get_db
+from services.quote_history import (
+    DAILY,
+    HISTORY,
+    LEGACY,
+    RAW_TTL_DAYS,
+    collection_kind,
+    ensure_history_collection,
+    last_rolled_day,
+    raw_cutoff,
+    rollup_daily,
+    rollup_lag_warning,
+)
+
+
+def migrate(db, batch_size: int = 5000, drop_legacy: bool = False) -> None:
+    """Pasa `history` común a time series sin perder el resumen diario de lo que vence.
+
+    1. Renombra la colección común a `history_legacy`.
+    2. Resume todo lo viejo en `history_daily` (antes de que el TTL lo borre).
+    3. Crea la time series y copia los snapshots todavía dentro de la retención.
+    Se puede volver a ejecutar: retoma la copia desde el último snapshot copiado.
+    """
+    kind = collection_kind(db, HISTORY)
+    if kind == "collection":
+        db[HISTORY].rename(LEGACY)
+        print(f"[INFO] '{HISTORY}' renombrada a '{LEGACY}'.")
+    if collection_kind(db, LEGACY) is None:
+        ensure_history_collection(db)
+        print(f"[OK] No hay datos que migrar; '{HISTORY}' lista.")
+        return
+
+    dias = rollup_daily(db, source=LEGACY, full=True)
+    print(f"[INFO] {dias} barras diarias resumidas desde '{LEGACY}'.")
+    ensure_history_collection(db)
+
+    ultimo = db[HISTORY].find_one({}, {"timestamp": 1}, sort=[("timestamp", -1)])
+    query = {}
+    if ultimo is not None:
+        query["timestamp"] = {"$gt": ultimo["timestamp"]}
+    cutoff = raw_cutoff()
+    if cutoff is not None and (ultimo is None or cutoff > ultimo["timestamp"]):
+        query["timestamp"] = {"$gte": cutoff}
+
+    copiados, lote = 0, []
+    cursor = db[LEGACY].find(query, {"_id": 0}).sort("timestamp", 1).batch_size(batch_size)
+    for doc in cursor:
+        if not isinstance(doc.get("timestamp"), datetime) or not doc.get("ticker"):
+            continue
+        lote.append(doc)
+        if len(lote) >= batch_size:
+            db[HISTORY].insert_many(lote, ordered=False)
+            copiados += len(lote)
+            lote = []
+    if lote:
+        db[HISTORY].insert_many(lote, ordered=False)
+        copiados += len(lote)
+    print(f"[INFO] {copiados} snapshots copiados a la time series.")
+
+    if drop_legacy:
+        db.drop_collection(LEGACY)
+        print(f"[INFO] '{LEGACY}' eliminada.")
+    else:
+        print(f"[INFO] '{LEGACY}' se conserva; borrala con --drop-legacy cuando verifiques la migración.")
+    print("[OK] Migración completada.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Colección history: time series, migración y resumen diario")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_setup = sub.add_parser("setup", help="Crea la time series y ajusta el TTL")
+    p_setup.add_argument("--ttl-days", type=float, default=RAW_TTL_DAYS, help="Retención de snapshots crudos (0 = sin vencimiento)")
+
+    p_migrate = sub.add_parser("migrate", help="Convierte una colección history común existente")
+    p_migrate.add_argument("--batch-size", type=int, default=5000)
+    p_migrate.add_argument("--drop-legacy", action="store_true", help=f"Borra '{LEGACY}' al terminar")
+
+    p_rollup = sub.add_parser("rollup", help="Resume snapshots en barras diarias")
+    p_rollup.add_argument("--since", default=None, help="Fecha YYYY-MM-DD desde la cual resumir")
+    p_rollup.add_argument("--full", action="store_true", help="Resume todo lo disponible")
+
+    sub.add_parser("status", help="Tipo de colección, retención y último día resumido")
+    args = parser.parse_args()
+
+    db = get_db()
+    if args.cmd == "setup":
+        kind = ensure_history_collection(db, ttl_days=args.ttl_days)
+        print(f"[OK] '{HISTORY}' es {kind}.")
+    elif args.cmd == "migrate":
+        migrate(db, batch_size=args.batch_size, drop_legacy=args.drop_legacy)
+    elif args.cmd == "rollup":
+        since = datetime.fromisoformat(args.since) if args.since else None
+        n = rollup_daily(db, since=since, full=args.full)
+        print(f"[OK] {n} barras diarias actualizadas en '{DAILY}'.")
+    elif args.cmd == "status":
+        for name in (HISTORY, LEGACY, DAILY):
+            kind = collection_kind(db, name)
+            if kind is None:
+                print(f"  {name:15} (no existe)")
+                continue
+            info = next(iter(db.list_collections(filter={"name": name})), {})
+            ttl = (info.get("options") or {}).get("expireAfterSeconds")
+            print(f"  {name:15} {kind:10} docs={db[name].count_documents({}):>10}  TTL={ttl if ttl else '-'}")
+        print(f"  último día resumido: {last_rolled_day(db) or '-'}")
+        aviso = rollup_lag_warning(db)
+        if aviso:
+            print(f"[WARN] {aviso}")
+
+
+if __name__ == "__main__":
+    main()
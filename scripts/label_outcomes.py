@@ -1,41 +1,111 @@
 """Etiqueta registros de acciones_usuario con el resultado real (y_true).
 
-Para cada documento sin y_true, descarga el cierre del día siguiente y marca
-y_true=1 si Close_{t+1} > Close_t * 1.01, si no y_true=0.
+Para cada documento sin y_true toma el cierre de la primera barra a partir del
+día siguiente (dentro de una ventana de 3 días) y marca y_true=1 si
+Close_{t+1} > Close_t * 1.01, si no y_true=0.
+
+Trabaja en bloques ordenados por _id: por bloque agrupa los documentos por
+ticker, lee un único rango de fechas por ticker, resuelve la barra siguiente
+de forma vectorizada y escribe todo con un `bulk_write` desordenado. Como los
+documentos etiquetados dejan de cumplir el filtro, el proceso es reanudable:
+volver a ejecutarlo continúa con lo pendiente (o usar --after-id).
 """
 
+import argparse
 from datetime import timedelta
 
-import yfinance as yf
-from pymongo import MongoClient
+import numpy as np
+import pandas as pd
+from bson import ObjectId
+from pymongo import UpdateOne
 
+from config.db import get_db
+from config.profiling import add_profile_args, profiling_session, span
+from services.bar_store import get_history
 
-def main():
-    client = MongoClient("mongodb://localhost:27017/", serverSelectionTimeoutMS=3000)
-    db = client["acciones_ml"]
 
-    cur = db.acciones_usuario.find({"y_true": {"$exists": False}}).sort("fecha", 1)
-    updated = 0
-    for doc in cur:
-        ticker = doc.get("ticker")
-        fecha = doc.get("fecha")
-        precio_t = doc.get("precio")
-        if not ticker or not fecha or precio_t is None:
-            continue
-        # ventana pequeña alrededor del día siguiente por zonas horarias/mercados
-        start = fecha + timedelta(days=1)
-        end = start + timedelta(days=3)
+# ventana pequeña alrededor del día siguiente por zonas horarias/mercados
+NEXT_BAR_WINDOW_DAYS = 3
+
+
+def label_chunk(docs) -> list:
+    """Calcula y_true para un bloque de documentos. Retorna operaciones UpdateOne."""
+    df = pd.DataFrame(docs, columns=["_id", "ticker", "fecha", "precio"])
+    df = df.dropna(subset=["ticker", "fecha", "precio"])
+    if df.empty:
+        return []
+    df["desde"] = (pd.to_datetime(df["fecha"]) + timedelta(days=1)).dt.normalize()
+
+    ops = []
+    for ticker, grupo in df.groupby("ticker", sort=False):
+        start = grupo["desde"].min()
+        end = grupo["desde"].max() + timedelta(days=NEXT_BAR_WINDOW_DAYS)
         try:
-            hist = yf.Ticker(ticker).history(start=start.date(), end=end.date(), interval="1d")
-            if hist is None or hist.empty:
-                continue
-            close_next = float(hist["Close"].iloc[0])
-            y_true = 1 if close_next > float(precio_t) * 1.01 else 0
-            db.acciones_usuario.update_one({"_id": doc["_id"]}, {"$set": {"y_true": y_true}})
-            updated += 1
-        except Exception:
+            hist = get_history(ticker, start=start.to_pydatetime(), end=end.to_pydatetime())
+        except Exception as e:
+            print(f"[WARN] No se pudo obtener historial de {ticker}: {e}")
+            continue
+        if hist is None or hist.empty:
+            continue
+
+        fechas = hist.index.values
+        closes = hist["Close"].to_numpy(dtype=float)
+        desde = grupo["desde"].values
+        pos = np.searchsorted(fechas, desde, side="left")
+        ok = pos < len(fechas)
+        limite = desde + np.timedelta64(NEXT_BAR_WINDOW_DAYS, "D")
+        ok[ok] &= fechas[pos[ok]] < limite[ok]
+        if not ok.any():
             continue
 
+        close_next = closes[pos[ok]]
+        precio_t = grupo["precio"].to_numpy(dtype=float)[ok]
+        y_true = (close_next > precio_t * 1.01).astype(int)
+        for _id, y in zip(grupo["_id"].values[ok], y_true):
+            ops.append(UpdateOne({"_id": _id}, {"$set": {"y_true": int(y)}}))
+    return ops
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Etiqueta acciones_usuario con y_true")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="Documentos por bloque")
+    parser.add_argument("--max-chunks", type=int, default=None, help="Cortar tras N bloques")
+    parser.add_argument("--after-id", default=None, help="Reanudar después de este _id")
+    add_profile_args(parser)
+    args = parser.parse_args()
+    with profiling_session(args, "scripts.label_outcomes"):
+        _run(args)
+
+
+def _run(args):
+
+    db = get_db()
+    last_id = ObjectId(args.after_id) if args.after_id else None
+    updated = 0
+    chunks = 0
+    while args.max_chunks is None or chunks < args.max_chunks:
+        query = {"y_true": {"$exists": False}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        with span("lectura"):
+            docs = list(
+                db.acciones_usuario.find(query, {"ticker": 1, "fecha": 1, "precio": 1})
+                .sort("_id", 1)
+                .limit(args.chunk_size)
+            )
+        if not docs:
+            break
+        last_id = docs[-1]["_id"]
+        chunks += 1
+
+        with span("etiquetado"):
+            ops = label_chunk(docs)
+        if ops:
+            with span("escritura"):
+                result = db.acciones_usuario.bulk_write(ops, ordered=False)
+            updated += result.modified_count
+        print(f"[INFO] Bloque {chunks}: {len(docs)} pendientes, {len(ops)} etiquetados (último _id: {last_id})")
+
     print(f"[OK] Registros actualizados con y_true: {updated}")
 
 
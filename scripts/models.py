@@ -0,0 +1,44 @@
+"""Administra el registro de modelos: listar versiones, promover y volver atrás."""
+
+import argparse
+
+from config import model_registry
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Registro versionado de modelos globales")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_list = sub.add_parser("list", help="Lista las versiones de un modelo")
+    p_list.add_argument("name", help="GLOBAL_XGB o GLOBAL_MLP")
+
+    p_promote = sub.add_parser("promote", help="Activa una versión existente")
+    p_promote.add_argument("name")
+    p_promote.add_argument("version")
+
+    p_rollback = sub.add_parser("rollback", help="Vuelve a la versión activa anterior")
+    p_rollback.add_argument("name")
+    p_rollback.add_argument("--steps", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.cmd == "list":
+        actual = model_registry.current_version(args.name)
+        versiones = model_registry.list_versions(args.name)
+        if not versiones:
+            print(f"[INFO] {args.name} no tiene versiones en el registro.")
+        for meta in versiones:
+            marca = "*" if meta["version"] == actual else " "
+            ventana = meta.get("training_window") or {}
+            print(f"{marca} {meta['version']}  {meta.get('formato', '?'):8} "
+                  f"{ventana.get('start', '-')}..{ventana.get('end', '-')}  "
+                  f"métricas={meta.get('metrics', {})}")
+    elif args.cmd == "promote":
+        model_registry.promote(args.name, args.version)
+        print(f"[OK] {args.name} → {args.version}")
+    elif args.cmd == "rollback":
+        version = model_registry.rollback(args.name, steps=args.steps)
+        print(f"[OK] {args.name} volvió a {version}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,19 @@
 """Script de mantenimiento: crea índices y limpia colecciones extra."""
 
-from pymongo import MongoClient, ASCENDING, DESCENDING
+from pymongo import ASCENDING, DESCENDING
+
+from config.db import get_client, get_db
+from services.quote_history import ensure_history_collection
 
 
 def main():
-    client = MongoClient("mongodb://localhost:27017/", serverSelectionTimeoutMS=3000)
-    client.server_info()
-    db = client["acciones_ml"]
+    get_client().server_info()
+    db = get_db()
+
+    # history como time series con retención (+ índices de history_daily)
+    ensure_history_collection(db)
 
     # Crear índices
-    db.history.create_index([("ticker", ASCENDING), ("timestamp", DESCENDING)], name="idx_ticker_timestamp")
     db.acciones_usuario.create_index([("ticker", ASCENDING), ("fecha", DESCENDING)], name="idx_ticker_fecha")
     db.acciones_usuario.create_index([("decision_usuario", ASCENDING)], name="idx_decision_usuario")
     db.modelos_binarios.create_index([("ticker", ASCENDING)], name="uk_ticker", unique=True)
@@ -2,6 +2,7 @@
 
 import argparse
 
+from config.profiling import add_profile_args, profiling_session, span
 from ml.global_models import train_or_update_xgb_global, train_or_update_mlp_global, tickers_from_usage
 
 
@@ -9,16 +10,20 @@ def main():
     parser = argparse.ArgumentParser(description="Actualiza modelos globales con tickers recientes")
     parser.add_argument("--tickers", nargs="*", help="Lista de tickers a usar", default=None)
     parser.add_argument("--period", default="2y", help="Periodo de historial por ticker (ej: 6mo, 1y, 2y)")
+    parser.add_argument("--online", action="store_true", help="MLP: partial_fit sólo con barras nuevas")
+    add_profile_args(parser)
     args = parser.parse_args()
 
-    tickers = args.tickers if args.tickers else tickers_from_usage()
-    print(f"[INFO] Entrenando/actualizando con tickers: {tickers}")
+    with profiling_session(args, "scripts.update_models"):
+        with span("tickers"):
+            tickers = args.tickers if args.tickers else tickers_from_usage()
+        print(f"[INFO] Entrenando/actualizando con tickers: {tickers}")
 
-    xgb = train_or_update_xgb_global(tickers, period=args.period)
-    print("[OK] XGBoost global actualizado.")
+        xgb = train_or_update_xgb_global(tickers, period=args.period)
+        print("[OK] XGBoost global actualizado.")
 
-    mlp = train_or_update_mlp_global(tickers, period=args.period)
-    print("[OK] MLP global actualizado.")
+        mlp = train_or_update_mlp_global(tickers, period=args.period, online=args.online)
+        print("[OK] MLP global actualizado.")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,368 @@
+"""Servidor HTTP de recomendaciones (asyncio) con inferencia en micro-lotes.
+
+A diferencia de la CLI (main.py), el proceso queda vivo: imports, conexión a
+MongoDB, modelos y estado de features se cargan una vez y se reutilizan.
+
+Las solicitudes concurrentes que llegan al mismo modelo dentro de una ventana
+corta (`--batch-wait-ms`) se agrupan en un único `predict_proba`.
+
+Endpoints:
+    GET  /recommend?ticker=AAPL&model=global_xgb&threshold=0.5&registrar=0
+    POST /recommend   {"ticker": "AAPL", "model": "global_xgb", "threshold": 0.5}
+    GET  /stats       latencias p50/p99, tamaño de lotes, versiones de modelos
+    GET  /health
+
+Uso local, sin red ni MongoDB:
+    python server.py --data-dir data/csv --memory-db --port 8080
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from ml.features import FEATURE_COLUMNS
+from ml.recomendacion import _mensaje, predict_scores, registrar_recomendacion, resolve_model
+from ml.streaming_features import latest_features
+
+MODEL_TYPES = ("local_xgb", "global_xgb", "global_mlp")
+
+
+class LatencyStats:
+    """Ventana deslizante de latencias (segundos) con percentiles."""
+
+    def __init__(self, window: int = 10000):
+        self._samples = deque(maxlen=window)
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+            self._count += 1
+
+    def summary(self) -> dict:
+        with self._lock:
+            samples = np.fromiter(self._samples, dtype=float)
+            count = self._count
+        if not len(samples):
+            return {"count": count}
+        p50, p99 = np.percentile(samples, [50, 99])
+        return {
+            "count": count,
+            "p50_ms": round(float(p50) * 1000, 3),
+            "p99_ms": round(float(p99) * 1000, 3),
+            "max_ms": round(float(samples.max()) * 1000, 3),
+        }
+
+
+class MicroBatcher:
+    """Agrupa filas que van al mismo modelo en una sola llamada de predicción.
+
+    La primera fila de un lote abre una ventana de `max_wait_ms`; el lote se
+    envía al cerrarse la ventana o al llegar a `max_batch` filas. La predicción
+    corre en el pool de hilos para no bloquear el event loop.
+    """
+
+    def __init__(self, executor: ThreadPoolExecutor, max_wait_ms: float = 5.0, max_batch: int = 256):
+        self.executor = executor
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_batch = max_batch
+        self._pending: Dict[int, Tuple[object, List[Tuple[pd.DataFrame, asyncio.Future]]]] = {}
+        self._timers: Dict[int, asyncio.TimerHandle] = {}
+        self.batches = 0
+        self.rows = 0
+        self.max_seen = 0
+
+    async def score(self, model, row_df: pd.DataFrame) -> Tuple[float, bool]:
+        """Puntaje de una fila: (probabilidad o clase, es_probabilidad)."""
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        key = id(model)
+        if key not in self._pending:
+            self._pending[key] = (model, [])
+            self._timers[key] = loop.call_later(self.max_wait, self._flush, key)
+        items = self._pending[key][1]
+        items.append((row_df, fut))
+        if len(items) >= self.max_batch:
+            self._timers.pop(key).cancel()
+            self._flush(key)
+        return await fut
+
+    def _flush(self, key: int) -> None:
+        self._timers.pop(key, None)
+        model, items = self._pending.pop(key, (None, []))
+        if not items:
+            return
+        self.batches += 1
+        self.rows += len(items)
+        self.max_seen = max(self.max_seen, len(items))
+        asyncio.ensure_future(self._run(model, items))
+
+    async def _run(self, model, items) -> None:
+        loop = asyncio.get_running_loop()
+        X = pd.concat([row_df[FEATURE_COLUMNS] for row_df, _ in items], ignore_index=True)
+        try:
+            scores, es_prob = await loop.run_in_executor(self.executor, predict_scores, model, X)
+        except Exception as e:
+            for _, fut in items:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        for (_, fut), score in zip(items, scores):
+            if not fut.done():
+                fut.set_result((float(score), es_prob))
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "rows": self.rows,
+            "avg_batch": round(self.rows / self.batches, 2) if self.batches else 0.0,
+            "max_batch": self.max_seen,
+        }
+
+
+class RecommendationService:
+    """Lógica de smart_recommendation separada en etapas para servirla de forma concurrente."""
+
+    def __init__(self, max_wait_ms: float = 5.0, max_batch: int = 256, workers: int = 8):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="recomendacion")
+        self.batcher = MicroBatcher(self.executor, max_wait_ms=max_wait_ms, max_batch=max_batch)
+        self.latency = {"recommend": LatencyStats(), "predict": LatencyStats()}
+        self.errors = 0
+
+    async def _call(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    async def warmup(self, model_types=("global_xgb", "global_mlp")) -> None:
+        """Carga los modelos globales antes de recibir tráfico."""
+        for model_type in model_types:
+            model, _ = await self._call(resolve_model, None, model_type)
+            print(f"[INFO] {model_type}: {'cargado' if model is not None else 'no disponible'}")
+
+    async def recommend(
+        self,
+        ticker: str,
+        model_type: str = "global_xgb",
+        prob_threshold: float = 0.5,
+        registrar: bool = False,
+    ) -> dict:
+        t0 = time.perf_counter()
+        try:
+            return await self._recommend(ticker.upper(), model_type, prob_threshold, registrar)
+        finally:
+            self.latency["recommend"].add(time.perf_counter() - t0)
+
+    async def _recommend(self, ticker: str, model_type: str, prob_threshold: float, registrar: bool) -> dict:
+        if model_type not in MODEL_TYPES:
+            return {"ticker": ticker, "mensaje": f"Tipo de modelo no soportado: {model_type}"}
+        # modelo y features en paralelo (ambos pueden tocar disco/red)
+        (model, error), ultima = await asyncio.gather(
+            self._call(resolve_model, ticker, model_type),
+            self._call(latest_features, ticker),
+        )
+        if model is None:
+            return {"ticker": ticker, "mensaje": error}
+        if ultima is None:
+            return {"ticker": ticker, "mensaje": "No hay suficientes datos para predecir."}
+        fecha, row_df = ultima
+
+        t0 = time.perf_counter()
+        try:
+            score, es_prob = await self.batcher.score(model, row_df)
+        except Exception as e:
+            self.errors += 1
+            return {"ticker": ticker, "mensaje": f"Error al predecir: {e}"}
+        self.latency["predict"].add(time.perf_counter() - t0)
+
+        if es_prob:
+            prob = score
+            pred = 1 if prob >= prob_threshold else 0
+        else:
+            prob = None
+            pred = int(score)
+
+        await self._call(
+            registrar_recomendacion, ticker, row_df.iloc[0], prob, pred, registrar, model_type, prob_threshold
+        )
+        return {
+            "ticker": ticker,
+            "fecha": str(pd.Timestamp(fecha).date()),
+            "recomendacion": "comprar" if pred == 1 else "no_comprar",
+            "probabilidad": prob,
+            "y_pred": pred,
+            "mensaje": _mensaje(pred),
+            "modelo": model_type,
+        }
+
+    def stats(self) -> dict:
+        from config import model_registry, profiling
+
+        return {
+            "latencia": {name: s.summary() for name, s in self.latency.items()},
+            "etapas": profiling.snapshot(),
+            "lotes": self.batcher.stats(),
+            "errores": self.errors,
+            "modelos": model_registry.live_versions(),
+        }
+
+
+# ---- HTTP mínimo (HTTP/1.1 con keep-alive) ----------------------------------------
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+
+
+def _params(query: dict, body: Optional[dict]) -> dict:
+    params = {k: v[-1] for k, v in query.items()}
+    params.update(body or {})
+    return params
+
+
+def _truthy(value) -> bool:
+    return str(value).lower() in ("1", "true", "si", "sí", "yes")
+
+
+class RecommendationServer:
+    def __init__(self, service: RecommendationService):
+        self.service = service
+
+    async def handle(self, method: str, target: str, body: bytes) -> Tuple[int, dict]:
+        url = urlsplit(target)
+        if url.path == "/health":
+            return 200, {"status": "ok"}
+        if url.path == "/stats":
+            return 200, self.service.stats()
+        if url.path != "/recommend":
+            return 404, {"error": f"ruta desconocida: {url.path}"}
+        if method not in ("GET", "POST"):
+            return 405, {"error": "usa GET o POST"}
+        try:
+            payload = json.loads(body) if body else None
+        except ValueError:
+            return 400, {"error": "JSON inválido"}
+        params = _params(parse_qs(url.query), payload)
+        ticker = params.get("ticker")
+        if not ticker:
+            return 400, {"error": "falta el parámetro ticker"}
+        try:
+            threshold = float(params.get("threshold", 0.5))
+        except (TypeError, ValueError):
+            return 400, {"error": "threshold debe ser numérico"}
+        result = await self.service.recommend(
+            str(ticker),
+            model_type=params.get("model", "global_xgb"),
+            prob_threshold=threshold,
+            registrar=_truthy(params.get("registrar", "0")),
+        )
+        return 200, result
+
+    async def _connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    method, target, version = line.decode("latin-1").split()
+                except ValueError:
+                    await self._write(writer, 400, {"error": "línea de solicitud inválida"}, close=True)
+                    break
+                headers = {}
+                while True:
+                    h = await reader.readline()
+                    if h in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = h.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", "0") or 0)
+                body = await reader.readexactly(length) if length else b""
+                close = headers.get("connection", "").lower() == "close" or version == "HTTP/1.0"
+                try:
+                    status, payload = await self.handle(method.upper(), target, body)
+                except Exception as e:
+                    status, payload = 500, {"error": f"{type(e).__name__}: {e}"}
+                await self._write(writer, status, payload, close=close)
+                if close:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _write(writer: asyncio.StreamWriter, status: int, payload: dict, close: bool) -> None:
+        data = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+        head = (
+            f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+            "Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            f"Connection: {'close' if close else 'keep-alive'}\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + data)
+        await writer.drain()
+
+    async def serve(self, host: str, port: int) -> None:
+        server = await asyncio.start_server(self._connection, host, port)
+        print(f"[OK] Servidor de recomendaciones en http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor HTTP de recomendaciones con micro-lotes")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--batch-wait-ms", type=float, default=5.0, help="Ventana para agrupar predicciones")
+    parser.add_argument("--max-batch", type=int, default=256)
+    parser.add_argument("--workers", type=int, default=8, help="Hilos para E/S y predicción")
+    parser.add_argument("--data-dir", default=None, help="Lee barras de <dir>/<TICKER>.csv|.parquet (sin red)")
+    parser.add_argument(
+        "--bar-provider",
+        default=None,
+        choices=["yfinance", "rollup", "rollup-only"],
+        help="Origen de las barras (por defecto BAR_STORE_PROVIDER o yfinance)",
+    )
+    parser.add_argument("--memory-db", action="store_true", help="Usa una base en memoria en lugar de MongoDB")
+    args = parser.parse_args()
+
+    if args.data_dir:
+        from services.bar_store import LocalFilesProvider, set_provider
+
+        set_provider(LocalFilesProvider(args.data_dir))
+        print(f"[INFO] Barras desde archivos locales: {args.data_dir}")
+    elif args.bar_provider:
+        from services.bar_store import make_provider, set_provider
+
+        set_provider(make_provider(args.bar_provider))
+        print(f"[INFO] Barras desde el provider '{args.bar_provider}'.")
+    if args.memory_db:
+        from config.db import use_database
+        from config.memory_db import MemoryDB
+
+        use_database(MemoryDB())
+        print("[INFO] Usando base de datos en memoria.")
+
+    service = RecommendationService(max_wait_ms=args.batch_wait_ms, max_batch=args.max_batch, workers=args.workers)
+
+    async def run():
+        await service.warmup()
+        await RecommendationServer(service).serve(args.host, args.port)
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        print("\n[INFO] Servidor detenido.")
+
+
+if __name__ == "__main__":
+    main()
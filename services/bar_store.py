@@ -0,0 +1,413 @@
+"""Almacén local e incremental de barras OHLCV diarias.
+
+Todas las lecturas de historial (servicios, entrenamiento, recomendación y
+scripts) pasan por aquí. Las barras se guardan en disco, un archivo columnar
+por ticker (Parquet si hay motor disponible), y sólo se descargan las barras
+posteriores a la más reciente ya almacenada. Si el provider reajustó precios
+pasados (split o dividendo), el historial del ticker se descarga completo.
+
+El origen de los datos es un "provider" intercambiable: por defecto yfinance,
+pero `LocalFilesProvider` permite llenar el almacén desde archivos locales sin
+acceso a red (tests, benchmarks, entornos offline). El del almacén compartido
+se elige con `BAR_STORE_PROVIDER` (ver `make_provider`) o con `set_provider`.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from config.profiling import span
+
+
+OHLCV_COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+
+DEFAULT_ROOT = os.environ.get("BAR_STORE_DIR", os.path.join("data", "bars"))
+# segundos durante los que no se vuelve a consultar al provider por barras nuevas
+DEFAULT_REFRESH_TTL = float(os.environ.get("BAR_STORE_REFRESH_TTL", "900"))
+DEFAULT_PROVIDER = os.environ.get("BAR_STORE_PROVIDER", "yfinance")
+# diferencia relativa de cierre que indica un historial reajustado (un dividendo mueve ~0.1-1%)
+ADJUST_RTOL = float(os.environ.get("BAR_STORE_ADJUST_RTOL", "1e-4"))
+
+
+def _parquet_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except Exception:
+        try:
+            import fastparquet  # noqa: F401
+            return True
+        except Exception:
+            return False
+
+
+def _normalize(df: Optional[pd.DataFrame]) -> pd.DataFrame:
+    """Deja sólo OHLCV, índice de fechas sin zona horaria, ordenado y sin duplicados."""
+    if df is None or df.empty:
+        return pd.DataFrame(columns=OHLCV_COLUMNS, index=pd.DatetimeIndex([], name="Date"))
+    df = df[[c for c in OHLCV_COLUMNS if c in df.columns]].copy()
+    idx = pd.DatetimeIndex(df.index)
+    if idx.tz is not None:
+        idx = idx.tz_localize(None)
+    df.index = idx.normalize()
+    df.index.name = "Date"
+    df = df[~df.index.duplicated(keep="last")].sort_index()
+    return df
+
+
+def _readjusted(stored: pd.DataFrame, newer: pd.DataFrame) -> bool:
+    """True si el provider devolvió otros precios para barras cerradas ya guardadas.
+
+    yfinance ajusta por splits y dividendos: tras uno reescala todo el historial,
+    y pegar barras nuevas a las guardadas mezclaría dos escalas. La última barra
+    guardada no se compara (pudo ser la del día, todavía abierta).
+    """
+    common = stored.index[:-1].intersection(newer.index)
+    if not len(common):
+        return False
+    old = stored.loc[common, "Close"].to_numpy(dtype=float)
+    new = newer.loc[common, "Close"].to_numpy(dtype=float)
+    ok = np.isfinite(old) & np.isfinite(new)
+    return bool((np.abs(new[ok] - old[ok]) > ADJUST_RTOL * np.abs(old[ok])).any())
+
+
+def period_start(period: str, now: Optional[datetime] = None) -> Optional[datetime]:
+    """Traduce un periodo estilo yfinance ("5d", "6mo", "6m", "2y", "ytd", "max") a fecha inicial.
+
+    Retorna None para "max" (todo el historial disponible).
+    """
+    now = now or datetime.now()
+    today = datetime(now.year, now.month, now.day)
+    p = (period or "").strip().lower()
+    if p == "max":
+        return None
+    if p == "ytd":
+        return datetime(now.year, 1, 1)
+    m = re.fullmatch(r"(\d+)\s*(d|wk|mo|m|y)", p)
+    if not m:
+        raise ValueError(f"Periodo no soportado: {period}")
+    n, unit = int(m.group(1)), m.group(2)
+    if unit == "d":
+        return today - timedelta(days=n)
+    if unit == "wk":
+        return today - timedelta(weeks=n)
+    if unit in ("mo", "m"):
+        return (pd.Timestamp(today) - pd.DateOffset(months=n)).to_pydatetime()
+    return (pd.Timestamp(today) - pd.DateOffset(years=n)).to_pydatetime()
+
+
+class YFinanceProvider:
+    """Provider por defecto: descarga barras diarias desde yfinance."""
+
+    def fetch(self, ticker: str, start: Optional[datetime], end: Optional[datetime] = None) -> pd.DataFrame:
+        import yfinance as yf
+
+        stock = yf.Ticker(ticker)
+        if start is None:
+            return stock.history(period="max", interval="1d")
+        kwargs = {"start": start.date(), "interval": "1d"}
+        if end is not None:
+            kwargs["end"] = end.date()
+        return stock.history(**kwargs)
+
+    def fetch_many(self, tickers: List[str], start: Optional[datetime], end: Optional[datetime] = None) -> Dict[str, pd.DataFrame]:
+        """Descarga varios tickers en una sola llamada (`yf.download`)."""
+        import yfinance as yf
+
+        kwargs = {"interval": "1d", "group_by": "ticker", "auto_adjust": True, "progress": False, "threads": True}
+        if start is None:
+            kwargs["period"] = "max"
+        else:
+            kwargs["start"] = start.date()
+            if end is not None:
+                kwargs["end"] = end.date()
+        data = yf.download(tickers, **kwargs)
+        if data is None or data.empty:
+            return {t: pd.DataFrame() for t in tickers}
+        if not isinstance(data.columns, pd.MultiIndex):
+            return {tickers[0]: data} if len(tickers) == 1 else {t: pd.DataFrame() for t in tickers}
+        out = {}
+        available = set(data.columns.get_level_values(0))
+        for t in tickers:
+            out[t] = data[t].dropna(how="all") if t in available else pd.DataFrame()
+        return out
+
+
+class LocalFilesProvider:
+    """Provider offline: lee `<directorio>/<TICKER>.parquet` o `<TICKER>.csv`.
+
+    Los CSV deben tener una columna de fecha (`Date`) y columnas OHLCV.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _read(self, ticker: str) -> pd.DataFrame:
+        base = os.path.join(self.directory, ticker)
+        if os.path.exists(base + ".parquet"):
+            return pd.read_parquet(base + ".parquet")
+        if os.path.exists(base + ".csv"):
+            return pd.read_csv(base + ".csv", index_col=0, parse_dates=True)
+        return pd.DataFrame()
+
+    def fetch(self, ticker: str, start: Optional[datetime], end: Optional[datetime] = None) -> pd.DataFrame:
+        df = _normalize(self._read(ticker))
+        if start is not None:
+            df = df[df.index >= pd.Timestamp(start)]
+        if end is not None:
+            df = df[df.index < pd.Timestamp(end)]
+        return df
+
+
+class BarStore:
+    """Almacén de barras por ticker con actualización incremental.
+
+    - Un archivo por ticker (`<root>/<TICKER>.parquet`, o `.pkl` sin motor Parquet).
+    - Un sidecar `<TICKER>.json` con la cobertura descargada y la última consulta.
+    - Sólo se piden al provider las barras desde la última almacenada (inclusive,
+      para refrescar una barra del día aún abierta) y, si hace falta, el tramo
+      anterior a la primera barra guardada.
+    """
+
+    def __init__(self, root: str = DEFAULT_ROOT, provider=None, refresh_ttl: float = DEFAULT_REFRESH_TTL):
+        self.root = root
+        self.provider = provider or YFinanceProvider()
+        self.refresh_ttl = refresh_ttl
+        self._ext = ".parquet" if _parquet_available() else ".pkl"
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+
+    # ---- persistencia -------------------------------------------------
+    def _lock(self, ticker: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(ticker, threading.Lock())
+
+    def _path(self, ticker: str, ext: str) -> str:
+        safe = re.sub(r"[^A-Za-z0-9._^=-]", "_", ticker.upper())
+        return os.path.join(self.root, safe + ext)
+
+    def _load(self, ticker: str):
+        path = self._path(ticker, self._ext)
+        meta_path = self._path(ticker, ".json")
+        df = _normalize(None)
+        meta = {}
+        try:
+            if os.path.exists(path):
+                df = pd.read_parquet(path) if self._ext == ".parquet" else pd.read_pickle(path)
+            if os.path.exists(meta_path):
+                with open(meta_path, "r", encoding="utf-8") as fh:
+                    meta = json.load(fh)
+        except Exception:
+            # archivo corrupto o incompleto: se reconstruye desde el provider
+            df, meta = _normalize(None), {}
+        return df, meta
+
+    def _save(self, ticker: str, df: pd.DataFrame, meta: dict) -> None:
+        os.makedirs(self.root, exist_ok=True)
+        path = self._path(ticker, self._ext)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        if self._ext == ".parquet":
+            df.to_parquet(tmp)
+        else:
+            df.to_pickle(tmp)
+        os.replace(tmp, path)
+
+        meta_path = self._path(ticker, ".json")
+        tmp_meta = f"{meta_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_meta, "w", encoding="utf-8") as fh:
+            json.dump(meta, fh)
+        os.replace(tmp_meta, meta_path)
+
+    # ---- API ------------------------------------------------------------
+    def _fetch_group(self, tickers, start, end) -> Dict[str, pd.DataFrame]:
+        """Una sola llamada multi-ticker si el provider la soporta."""
+        if not tickers:
+            return {}
+        with span("descarga", tickers=len(tickers), provider=type(self.provider).__name__):
+            if hasattr(self.provider, "fetch_many"):
+                frames = self.provider.fetch_many(list(tickers), start, end)
+            else:
+                frames = {t: self.provider.fetch(t, start, end) for t in tickers}
+        return {t: _normalize(frames.get(t)) for t in tickers}
+
+    def history(
+        self,
+        ticker: str,
+        period: str = "2y",
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        refresh_ttl: Optional[float] = None,
+    ) -> pd.DataFrame:
+        """Devuelve barras OHLCV diarias de `ticker` en [start, end).
+
+        Si no se indica `start` se deriva de `period`. Descarga sólo lo que falta.
+        """
+        ticker = ticker.upper()
+        return self.history_many([ticker], period=period, start=start, end=end, refresh_ttl=refresh_ttl)[ticker]
+
+    def history_many(
+        self,
+        tickers: List[str],
+        period: str = "2y",
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        refresh_ttl: Optional[float] = None,
+    ) -> Dict[str, pd.DataFrame]:
+        """Como `history`, para varios tickers, agrupando las descargas pendientes.
+
+        Los tickers sin datos locales se piden en una única llamada multi-ticker,
+        y lo mismo las colas de barras nuevas (desde la última barra más antigua).
+        """
+        tickers = list(dict.fromkeys(t.upper() for t in tickers))
+        if start is None:
+            start = period_start(period)
+        ttl = self.refresh_ttl if refresh_ttl is None else refresh_ttl
+        now = datetime.now()
+
+        locks = [self._lock(t) for t in sorted(tickers)]
+        for lock in locks:
+            lock.acquire()
+        try:
+            frames, metas, changed = {}, {}, set()
+            missing, tails = [], []
+            for t in tickers:
+                df, meta = self._load(t)
+                frames[t], metas[t] = df, meta
+                if df.empty:
+                    missing.append(t)
+                    continue
+                covered = meta.get("covered_from")
+                covered_from = None if covered == "max" else (
+                    datetime.fromisoformat(covered) if covered else df.index[0].to_pydatetime()
+                )
+                # tramo anterior a lo ya descargado
+                if covered_from is not None and (start is None or start < covered_from):
+                    older = self._fetch_group([t], start, covered_from)[t]
+                    if not older.empty:
+                        frames[t] = _normalize(pd.concat([older, frames[t]]))
+                    meta["covered_from"] = start.isoformat() if start else "max"
+                    changed.add(t)
+                # barras nuevas: sólo desde la última almacenada
+                checked = meta.get("checked_at")
+                checked_at = datetime.fromisoformat(checked) if checked else None
+                wants_tail = end is None or pd.Timestamp(end) > frames[t].index[-1]
+                expired = checked_at is None or (now - checked_at).total_seconds() >= ttl
+                if wants_tail and expired:
+                    tails.append(t)
+
+            for t, df in self._fetch_group(missing, start, None).items():
+                frames[t] = df
+                metas[t] = {"covered_from": start.isoformat() if start else "max", "checked_at": now.isoformat()}
+                if not df.empty:
+                    changed.add(t)
+
+            if tails:
+                # desde la anteúltima barra: al menos una barra cerrada se descarga de nuevo y
+                # permite ver si el provider reajustó el historial (split o dividendo)
+                tail_start = min(frames[t].index[max(0, len(frames[t]) - 2)] for t in tails).to_pydatetime()
+                readjust = []
+                for t, newer in self._fetch_group(tails, tail_start, None).items():
+                    if _readjusted(frames[t], newer):
+                        readjust.append(t)
+                        continue
+                    if not newer.empty:
+                        frames[t] = _normalize(pd.concat([frames[t], newer]))
+                    metas[t]["checked_at"] = now.isoformat()
+                    changed.add(t)
+                # precios reajustados: se reemplaza todo lo cubierto (una descarga por inicio)
+                groups: Dict[Optional[datetime], List[str]] = {}
+                for t in readjust:
+                    covered = metas[t].get("covered_from")
+                    since = None if covered == "max" else (
+                        datetime.fromisoformat(covered) if covered else frames[t].index[0].to_pydatetime()
+                    )
+                    groups.setdefault(since, []).append(t)
+                for since, group in groups.items():
+                    for t, full in self._fetch_group(group, since, None).items():
+                        if full.empty:
+                            continue  # se reintenta en la próxima consulta
+                        print(f"[INFO] Historial de {t} reajustado por el proveedor (split o dividendo); se descargó de nuevo.")
+                        frames[t] = full
+                        metas[t]["checked_at"] = now.isoformat()
+                        changed.add(t)
+
+            for t in changed:
+                self._save(t, frames[t], metas[t])
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+        result = {}
+        for t, df in frames.items():
+            if start is not None:
+                df = df[df.index >= pd.Timestamp(start).normalize()]
+            if end is not None:
+                df = df[df.index < pd.Timestamp(end)]
+            result[t] = df.copy()
+        return result
+
+
+def make_provider(name: str):
+    """Provider por nombre (valores de `BAR_STORE_PROVIDER`).
+
+    - "yfinance": descarga desde yfinance.
+    - "rollup": barras diarias resumidas de los snapshots (`history_daily`,
+      services/quote_history.py); los días sin resumen, desde yfinance.
+    - "rollup-only": sólo `history_daily`, sin red.
+    """
+    name = (name or "yfinance").strip().lower()
+    if name == "yfinance":
+        return YFinanceProvider()
+    if name in ("rollup", "rollup-only"):
+        from services.quote_history import SnapshotRollupProvider
+
+        return SnapshotRollupProvider(fallback=YFinanceProvider() if name == "rollup" else None)
+    raise ValueError(f"Provider de barras desconocido: {name!r} (yfinance, rollup, rollup-only)")
+
+
+_store: Optional[BarStore] = None
+_store_guard = threading.Lock()
+
+
+def get_bar_store() -> BarStore:
+    """Instancia compartida del almacén (creada de forma perezosa, con el provider de `BAR_STORE_PROVIDER`)."""
+    global _store
+    with _store_guard:
+        if _store is None:
+            _store = BarStore(provider=make_provider(DEFAULT_PROVIDER))
+        return _store
+
+
+def set_provider(provider) -> None:
+    """Reemplaza el origen de datos del almacén compartido (p. ej. LocalFilesProvider)."""
+    get_bar_store().provider = provider
+
+
+def get_history_many(
+    tickers: List[str],
+    period: str = "2y",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    refresh_ttl: Optional[float] = None,
+) -> Dict[str, pd.DataFrame]:
+    """Historial de varios tickers con descargas agrupadas (ver `BarStore.history_many`)."""
+    return get_bar_store().history_many(tickers, period=period, start=start, end=end, refresh_ttl=refresh_ttl)
+
+
+def get_history(
+    ticker: str,
+    period: str = "2y",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    refresh_ttl: Optional[float] = None,
+) -> pd.DataFrame:
+    """Atajo sobre el almacén compartido; reemplaza a `yf.Ticker(t).history(...)`."""
+    return get_bar_store().history(ticker, period=period, start=start, end=end, refresh_ttl=refresh_ttl)
@@ -0,0 +1,342 @@
+"""Snapshots de cotización como serie temporal, con retención y resumen diario.
+
+- `history` es una colección time series de MongoDB (timeField `timestamp`,
+  metaField `ticker`) con vencimiento de los snapshots crudos a los
+  `HISTORY_RAW_TTL_DAYS` días (0 = sin vencimiento). En servidores sin time
+  series (< 5.0) se usa una colección común con índice TTL.
+- `rollup_daily` resume los snapshots en una barra OHLCV por ticker y día en
+  `history_daily` (apertura = primer precio visto, cierre = último, volumen =
+  máximo del día, porque el volumen de cada snapshot es el acumulado del día).
+  Es incremental: por defecto sólo vuelve a resumir desde el último día ya
+  resumido.
+- `SnapshotRollupProvider` expone esos resúmenes como provider del almacén de
+  barras (services/bar_store.py), así historial y gráficos pueden leerlos; se
+  activa con `BAR_STORE_PROVIDER=rollup`. Los días sin resumen se completan con
+  el provider de respaldo.
+
+El resumen no corre solo (`python -m scripts.history rollup` en un cron): si el
+último día resumido queda atrás de la retención, los snapshots vencen sin
+resumir. `ensure_history_collection` y `status` lo advierten.
+
+La migración de una colección `history` común existente está en
+`python -m scripts.history migrate`.
+"""
+
+from __future__ import annotations
+
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from config.db import get_db
+
+HISTORY = "history"
+DAILY = "history_daily"
+LEGACY = "history_legacy"
+RAW_TTL_DAYS = float(os.environ.get("HISTORY_RAW_TTL_DAYS", "30"))
+GRANULARITY = os.environ.get("HISTORY_GRANULARITY", "minutes")
+ROLLUP_BATCH = 1000
+
+
+def collection_kind(db, name: str) -> Optional[str]:
+    """"timeseries", "collection" o None si la colección no existe."""
+    for info in db.list_collections(filter={"name": name}):
+        return info.get("type", "collection")
+    return None
+
+
+def _ttl_seconds(ttl_days: float) -> Optional[int]:
+    return int(ttl_days * 86400) if ttl_days and ttl_days > 0 else None
+
+
+def is_connection_error(exc: BaseException) -> bool:
+    """True si `exc` es una falla de conexión con MongoDB (transitoria, se reintenta)."""
+    try:
+        from pymongo.errors import ConnectionFailure
+    except ImportError:
+        return False
+    return isinstance(exc, ConnectionFailure)
+
+
+def _step(strict: bool, what: str, fn):
+    """Ejecuta un paso de configuración; sin `strict`, un error del servidor sólo se advierte."""
+    if strict:
+        return fn()
+    try:
+        return fn()
+    except Exception as e:
+        if is_connection_error(e):
+            raise
+        print(f"[WARN] {what}: {e}. Configuralo con `python -m scripts.history setup`.")
+        return None
+
+
+def ensure_history_collection(db=None, ttl_days: float = RAW_TTL_DAYS, strict: bool = True) -> str:
+    """Crea `history` como time series (o ajusta su TTL) y los índices de `history_daily`.
+
+    Retorna el tipo de `history`. Una colección común preexistente no se toca
+    (hay que migrarla) para no vencer datos que todavía no se resumieron.
+    Con `strict=False` (writer de snapshots) los pasos que el servidor rechaza,
+    p. ej. por falta de permisos para collMod o índices, sólo se advierten.
+    """
+    db = db if db is not None else get_db()
+    ttl = _ttl_seconds(ttl_days)
+    kind = collection_kind(db, HISTORY)
+    if kind is None:
+        options = {"timeseries": {"timeField": "timestamp", "metaField": "ticker", "granularity": GRANULARITY}}
+        if ttl:
+            options["expireAfterSeconds"] = ttl
+        try:
+            db.create_collection(HISTORY, **options)
+            kind = "timeseries"
+            print(f"[INFO] Colección time series '{HISTORY}' creada (TTL: {ttl_days or 'sin'} días).")
+        except Exception as e:
+            if is_connection_error(e):
+                raise
+            # servidor sin colecciones time series: colección común + índice TTL
+            print(f"[WARN] No se pudo crear '{HISTORY}' como time series ({e}); se usa una colección común.")
+            _step(strict, f"No se pudo crear '{HISTORY}'", lambda: db.create_collection(HISTORY))
+            if ttl:
+                _step(strict, f"No se pudo crear el índice TTL de '{HISTORY}'", lambda: db[HISTORY].create_index(
+                    [("timestamp", 1)], name="ttl_timestamp", expireAfterSeconds=ttl))
+            kind = "collection"
+    elif kind == "timeseries":
+        _step(strict, f"No se pudo ajustar el TTL de '{HISTORY}'", lambda: db.command(
+            "collMod", HISTORY, expireAfterSeconds=ttl if ttl else "off"))
+    elif "ttl_timestamp" not in db[HISTORY].index_information():
+        print(f"[WARN] '{HISTORY}' es una colección común sin retención; ejecutá `python -m scripts.history migrate`.")
+
+    _step(strict, f"No se pudo crear el índice de '{HISTORY}'", lambda: db[HISTORY].create_index(
+        [("ticker", 1), ("timestamp", -1)], name="idx_ticker_timestamp"))
+    _step(strict, f"No se pudo crear el índice de '{DAILY}'", lambda: db[DAILY].create_index(
+        [("ticker", 1), ("date", 1)], name="uk_ticker_date", unique=True))
+    aviso = rollup_lag_warning(db, ttl_days)
+    if aviso:
+        print(f"[WARN] {aviso}")
+    return kind
+
+
+def last_rolled_day(db=None) -> Optional[datetime]:
+    """Día más reciente ya resumido en `history_daily` (None si no hay ninguno)."""
+    db = db if db is not None else get_db()
+    doc = db[DAILY].find_one({}, {"date": 1}, sort=[("date", -1)])
+    return doc["date"] if doc else None
+
+
+def rollup_lag_warning(db=None, ttl_days: float = RAW_TTL_DAYS) -> Optional[str]:
+    """Aviso si hay snapshots que vencen (o ya vencieron) sin resumir; None si el resumen está al día.
+
+    Se avisa cuando el último día resumido tiene más de la mitad de la retención,
+    para dar tiempo a correr `python -m scripts.history rollup`.
+    """
+    if not ttl_days or ttl_days <= 0:
+        return None
+    db = db if db is not None else get_db()
+    oldest = db[HISTORY].find_one({}, {"timestamp": 1}, sort=[("timestamp", 1)])
+    if oldest is None:
+        return None
+    last = last_rolled_day(db)
+    # sin resumen todavía: cuenta desde el snapshot más viejo
+    desde = last or oldest["timestamp"]
+    edad = (datetime.now() - desde).total_seconds() / 86400.0
+    if edad < ttl_days / 2:
+        return None
+    restan = ttl_days - edad
+    cuando = f"vencen en {restan:.1f} días" if restan > 0 else "ya empezaron a vencer"
+    ultimo = f"último día resumido: {last.date()}" if last else "nunca se resumió"
+    return (
+        f"Los snapshots crudos de '{HISTORY}' {cuando} sin resumir ({ultimo}, retención {ttl_days:g} días); "
+        "ejecutá `python -m scripts.history rollup` (idealmente en un cron)."
+    )
+
+
+def rollup_daily(
+    db=None,
+    source: str = HISTORY,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    full: bool = False,
+    chunk_size: int = 50000,
+) -> int:
+    """Resume los snapshots de `source` en barras diarias de `history_daily`.
+
+    Sin `since` (y sin `full`) arranca en el último día ya resumido, que se
+    vuelve a calcular completo porque pudo haber quedado a medias. Retorna la
+    cantidad de barras (ticker, día) escritas.
+    """
+    from pymongo import ReplaceOne
+
+    db = db if db is not None else get_db()
+    if since is None and not full:
+        since = last_rolled_day(db)
+    query = {}
+    if since is not None or until is not None:
+        query["timestamp"] = {}
+        if since is not None:
+            query["timestamp"]["$gte"] = datetime.combine(since.date(), datetime.min.time())
+        if until is not None:
+            query["timestamp"]["$lt"] = until
+    query["price"] = {"$ne": None}
+
+    # (ticker, día) → [open, high, low, close, volume, n, primero, último]
+    bars: Dict[tuple, list] = {}
+    cursor = (
+        db[source]
+        .find(query, {"_id": 0, "ticker": 1, "timestamp": 1, "price": 1, "volume": 1})
+        .sort("timestamp", 1)
+        .batch_size(chunk_size)
+    )
+    for doc in cursor:
+        ts = doc.get("timestamp")
+        if ts is None:
+            continue
+        price = float(doc["price"])
+        volume = doc.get("volume") or 0
+        key = (doc["ticker"], ts.date())
+        bar = bars.get(key)
+        if bar is None:
+            bars[key] = [price, price, price, price, volume, 1, ts, ts]
+            continue
+        if price > bar[1]:
+            bar[1] = price
+        if price < bar[2]:
+            bar[2] = price
+        bar[3] = price
+        if volume > bar[4]:
+            bar[4] = volume
+        bar[5] += 1
+        bar[7] = ts
+
+    now = datetime.now()
+    ops = []
+    for (ticker, day), (o, h, l, c, v, n, first, last) in bars.items():
+        date = datetime.combine(day, datetime.min.time())
+        ops.append(ReplaceOne(
+            {"ticker": ticker, "date": date},
+            {
+                "ticker": ticker,
+                "date": date,
+                "open": o,
+                "high": h,
+                "low": l,
+                "close": c,
+                "volume": int(v),
+                "snapshots": n,
+                "first_at": first,
+                "last_at": last,
+                "updated_at": now,
+            },
+            upsert=True,
+        ))
+    for i in range(0, len(ops), ROLLUP_BATCH):
+        db[DAILY].bulk_write(ops[i:i + ROLLUP_BATCH], ordered=False)
+    return len(ops)
+
+
+_RENAME = {"open": "Open", "high": "High", "low": "Low", "close": "Close", "volume": "Volume"}
+
+
+def daily_bars_many(
+    tickers: List[str],
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db=None,
+) -> Dict[str, pd.DataFrame]:
+    """Barras diarias resumidas (OHLCV, índice Date) de varios tickers en una sola consulta."""
+    db = db if db is not None else get_db()
+    query = {"ticker": {"$in": list(tickers)}}
+    if start is not None or end is not None:
+        query["date"] = {}
+        if start is not None:
+            query["date"]["$gte"] = pd.Timestamp(start).normalize().to_pydatetime()
+        if end is not None:
+            query["date"]["$lt"] = pd.Timestamp(end).to_pydatetime()
+    projection = {"_id": 0, "ticker": 1, "date": 1, **{k: 1 for k in _RENAME}}
+    rows = list(db[DAILY].find(query, projection).sort("date", 1))
+    out = {t: pd.DataFrame(columns=list(_RENAME.values())) for t in tickers}
+    if not rows:
+        return out
+    df = pd.DataFrame(rows).rename(columns=_RENAME)
+    df["Date"] = pd.to_datetime(df.pop("date"))
+    for ticker, grupo in df.groupby("ticker", sort=False):
+        out[ticker] = grupo.drop(columns="ticker").set_index("Date")[list(_RENAME.values())]
+    return out
+
+
+def _missing_range(df: pd.DataFrame, start: Optional[datetime], end: Optional[datetime]):
+    """Tramo [desde, hasta) que cubre los días hábiles sin resumen en [start, end); None si no falta ninguno.
+
+    `desde` None = desde el comienzo de la historia, `hasta` None = hasta hoy
+    (incluida la barra del día).
+    """
+    if df.empty:
+        return start, end
+    tomorrow = pd.Timestamp(datetime.now()).normalize() + pd.Timedelta(days=1)
+    hi = min(pd.Timestamp(end), tomorrow) if end is not None else tomorrow
+    lo = pd.Timestamp(start).normalize() if start is not None else df.index[0]
+    missing = pd.bdate_range(lo, hi, inclusive="left").difference(df.index)
+    if start is None:
+        # lo anterior al primer resumen siempre se pide: no se sabe dónde empieza la historia
+        first = None
+    elif len(missing):
+        first = missing[0].to_pydatetime()
+    else:
+        return None
+    if not len(missing):
+        last = df.index[0].to_pydatetime()  # sólo el tramo anterior al primer resumen
+    elif missing[-1] + pd.Timedelta(days=1) >= tomorrow:
+        last = end  # la cola llega a hoy: la barra del día la trae el respaldo
+    else:
+        last = (missing[-1] + pd.Timedelta(days=1)).to_pydatetime()
+    return first, last
+
+
+class SnapshotRollupProvider:
+    """Provider del almacén de barras que lee `history_daily`.
+
+    Los resúmenes sólo existen para los días en que se consultó el ticker (y
+    hasta el último rollup). Los días hábiles sin resumen del rango pedido se
+    piden a `fallback` (p. ej. YFinanceProvider) en una sola llamada para todos
+    los tickers; si un día está en ambos, gana el resumen. Sin `fallback` se
+    devuelven sólo los resúmenes.
+    """
+
+    def __init__(self, fallback=None):
+        self.fallback = fallback
+
+    def fetch(self, ticker: str, start: Optional[datetime], end: Optional[datetime] = None) -> pd.DataFrame:
+        return self.fetch_many([ticker], start, end)[ticker]
+
+    def fetch_many(self, tickers: List[str], start: Optional[datetime], end: Optional[datetime] = None) -> Dict[str, pd.DataFrame]:
+        from services.bar_store import _normalize
+
+        frames = {t: _normalize(df) for t, df in daily_bars_many(tickers, start, end).items()}
+        if self.fallback is None:
+            return frames
+        gaps = {t: _missing_range(df, start, end) for t, df in frames.items()}
+        gaps = {t: g for t, g in gaps.items() if g is not None}
+        if not gaps:
+            return frames
+        # una sola llamada que cubre el tramo faltante de todos los tickers
+        desde = None if any(g[0] is None for g in gaps.values()) else min(g[0] for g in gaps.values())
+        hasta = None if any(g[1] is None for g in gaps.values()) else max(g[1] for g in gaps.values())
+        faltan = list(gaps)
+        if hasattr(self.fallback, "fetch_many"):
+            extra = self.fallback.fetch_many(faltan, desde, hasta)
+        else:
+            extra = {t: self.fallback.fetch(t, desde, hasta) for t in faltan}
+        for t in faltan:
+            fb = _normalize(extra.get(t))
+            if fb.empty:
+                continue
+            df = frames[t]
+            fb = fb[~fb.index.isin(df.index)]
+            frames[t] = _normalize(pd.concat([fb, df])) if not df.empty else fb
+        return frames
+
+
+def raw_cutoff(ttl_days: float = RAW_TTL_DAYS) -> Optional[datetime]:
+    """Fecha antes de la cual los snapshots crudos ya vencieron (None = sin vencimiento)."""
+    return datetime.now() - timedelta(days=ttl_days) if ttl_days and ttl_days > 0 else None
@@ -0,0 +1,382 @@
+"""Escritura en segundo plano de los snapshots de cotización (colección `history`).
+
+`get_stock_info` sólo encola el documento y retorna; un hilo daemon lo escribe
+con `insert_many` cuando:
+
+- el buffer llega a `SNAPSHOT_FLUSH_SIZE` documentos, o
+- el documento más viejo lleva `SNAPSHOT_FLUSH_INTERVAL_S` segundos esperando.
+
+Si MongoDB no responde, el lote vuelve al buffer y se reintenta con espera
+exponencial. El buffer está acotado (`SNAPSHOT_MAX_BUFFER`): lo que no entra se
+vuelca a disco como JSON extendido en `SNAPSHOT_SPILL_DIR` (o se descarta si el
+volcado está desactivado con SNAPSHOT_SPILL_DIR=""), y esos archivos se
+reinsertan después del próximo flush exitoso. Al salir del proceso se hace un
+último flush; lo que no se pudo escribir queda volcado a disco.
+
+Antes de la primera escritura se asegura la colección time series con TTL
+(services/quote_history.py), para que un insert no la cree como colección común.
+
+Cada documento recibe su `_id` al encolarse. Una colección time series no
+exige `_id` único, así que eso solo no evita duplicados al reintentar:
+
+- hay un único insert en vuelo por writer (el hilo, `flush` y `close` se turnan),
+  así un lote se reenvía sólo después de saber cómo terminó el anterior;
+- si un insert falla, sus documentos pudieron quedar escritos en parte: antes
+  de reenviarlos se consulta qué `_id` ya están en la colección y se omiten. Lo
+  mismo con los archivos volcados a disco antes de reinsertarlos.
+"""
+
+from __future__ import annotations
+
+import atexit
+import contextlib
+import glob
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Callable, Optional
+
+DEFAULT_SPILL_DIR = os.path.join("data", "snapshots_spill")
+MAX_BACKOFF_S = 30.0
+DUPLICATE_KEY = 11000
+
+
+class SnapshotWriter:
+    """Buffer acotado de documentos que un hilo propio escribe por lotes."""
+
+    def __init__(
+        self,
+        collection: str = "history",
+        flush_size: int = 100,
+        flush_interval_s: float = 2.0,
+        max_buffer: int = 10000,
+        spill_dir: Optional[str] = DEFAULT_SPILL_DIR,
+        ensure: Optional[Callable[[], object]] = None,
+    ):
+        self.collection = collection
+        # se llama una vez, antes del primer insert (p. ej. crear la colección); si el
+        # servidor lo rechaza no bloquea las escrituras
+        self.ensure = ensure
+        self._ensured = ensure is None
+        self.flush_size = max(1, int(flush_size))
+        self.flush_interval_s = float(flush_interval_s)
+        self.max_buffer = max(self.flush_size, int(max_buffer))
+        self.spill_dir = spill_dir or None
+
+        self._cond = threading.Condition()
+        # un solo insert en vuelo: nunca se reenvía un lote cuyo resultado no se conoce
+        self._write_lock = threading.Lock()
+        # _id de documentos de inserts fallidos (pudieron quedar escritos)
+        self._maybe_written: set = set()
+        self._buffer: deque = deque()
+        self._oldest_mono: Optional[float] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self._retry_at = 0.0
+        self._backoff = 0.0
+        self._stats = {
+            "submitted": 0,
+            "written": 0,
+            "flushes": 0,
+            "failures": 0,
+            "spilled": 0,
+            "dropped": 0,
+            "replayed": 0,
+            "last_flush": None,
+            "last_error": None,
+        }
+
+    # ---- API ------------------------------------------------------------
+    def submit(self, doc: dict) -> None:
+        """Encola `doc` para escribirlo más tarde; no toca la BD en el hilo llamador."""
+        from bson import ObjectId
+
+        doc.setdefault("_id", ObjectId())
+        with self._cond:
+            first = not self._buffer
+            if first:
+                self._oldest_mono = time.monotonic()
+            self._buffer.append(doc)
+            self._stats["submitted"] += 1
+            overflow = self._take_overflow()
+            self._ensure_started()
+            # el primero arranca el plazo de flush; el que completa el lote lo dispara
+            if first or len(self._buffer) >= self.flush_size:
+                self._cond.notify()
+        self._spill(overflow)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Escribe ya todo lo pendiente (en el hilo llamador). Retorna True si quedó vacío."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._cond:
+                if not self._buffer:
+                    return True
+                batch = self._take_batch()
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if not self._write(batch, remaining):
+                return False
+            if deadline is not None and time.monotonic() >= deadline:
+                with self._cond:
+                    return not self._buffer
+
+    def close(self, timeout: float = 2.0) -> None:
+        """Detiene el hilo, hace un último flush y vuelca a disco lo que no se pudo escribir.
+
+        Si el hilo sigue con un insert en vuelo al vencer `timeout`, ese lote
+        queda a cargo del hilo (no se reenvía ni se vuelca desde aquí).
+        """
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+        if not self.flush(timeout):
+            with self._cond:
+                rest = list(self._buffer)
+                self._buffer.clear()
+            self._spill(rest)
+
+    def status(self) -> dict:
+        """Contadores y estado del writer (pendientes, escritos, volcados, último error)."""
+        with self._cond:
+            data = dict(self._stats)
+            data.update(
+                pending=len(self._buffer),
+                alive=self._thread is not None and self._thread.is_alive(),
+                retry_in_s=round(max(0.0, self._retry_at - time.monotonic()), 3),
+                spill_files=len(self._spill_files()),
+            )
+        return data
+
+    # ---- interno --------------------------------------------------------
+    def _ensure_started(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="snapshot-writer", daemon=True)
+            self._thread.start()
+
+    def _take_batch(self) -> list:
+        """Saca hasta `flush_size` documentos del buffer (con el lock tomado)."""
+        n = min(len(self._buffer), self.flush_size)
+        batch = [self._buffer.popleft() for _ in range(n)]
+        self._oldest_mono = time.monotonic() if self._buffer else None
+        return batch
+
+    def _take_overflow(self) -> list:
+        """Si el buffer pasó `max_buffer` (BD caída o lenta), saca la mitad más vieja (con el lock tomado)."""
+        if len(self._buffer) <= self.max_buffer:
+            return []
+        n = len(self._buffer) - self.max_buffer // 2
+        return [self._buffer.popleft() for _ in range(n)]
+
+    def _wait_for_batch(self) -> Optional[list]:
+        """Bloquea hasta que corresponda escribir; retorna el lote (None = parar)."""
+        with self._cond:
+            while not self._stopping:
+                now = time.monotonic()
+                if now < self._retry_at:
+                    self._cond.wait(timeout=self._retry_at - now)
+                    continue
+                if self._buffer:
+                    waited = now - (self._oldest_mono or now)
+                    if len(self._buffer) >= self.flush_size or waited >= self.flush_interval_s:
+                        return self._take_batch()
+                    self._cond.wait(timeout=self.flush_interval_s - waited)
+                else:
+                    self._cond.wait()
+            return None
+
+    def _run(self) -> None:
+        while True:
+            batch = self._wait_for_batch()
+            if batch is None:
+                return
+            if self._write(batch):
+                self._replay_spilled()
+
+    def _write(self, batch: list, timeout: Optional[float] = None) -> bool:
+        """insert_many del lote; si falla (o no llega a su turno en `timeout`), lo devuelve al frente del buffer."""
+        if not self._write_lock.acquire(timeout=-1 if timeout is None else max(0.0, timeout)):
+            with self._cond:
+                self._buffer.extendleft(reversed(batch))
+                self._oldest_mono = time.monotonic()
+            return False
+        try:
+            return self._write_locked(batch)
+        finally:
+            self._write_lock.release()
+
+    def _ensure(self) -> None:
+        """Llama a `ensure` una vez. Si falla (salvo por conexión) se advierte y se escribe igual."""
+        from services.quote_history import is_connection_error
+
+        try:
+            self.ensure()
+        except Exception as e:
+            if is_connection_error(e):
+                raise
+            print(f"[WARN] No se pudo preparar '{self.collection}' ({e}); los snapshots se escriben igual.")
+        self._ensured = True
+
+    def _write_locked(self, batch: list) -> bool:
+        from config.db import get_db
+
+        error = None
+        try:
+            if not self._ensured:
+                self._ensure()
+            coll = get_db()[self.collection]
+            dudosos = [d for d in batch if d["_id"] in self._maybe_written]
+            pendientes = batch
+            if dudosos:
+                ya = _existing_ids(coll, dudosos)
+                pendientes = [d for d in batch if d["_id"] not in ya]
+            if pendientes:
+                coll.insert_many(pendientes, ordered=False)
+        except Exception as e:
+            if not _only_duplicates(e):
+                error = f"{type(e).__name__}: {e}"
+        overflow = []
+        with self._cond:
+            if error is None:
+                self._maybe_written.difference_update(d["_id"] for d in batch)
+                self._stats["written"] += len(batch)
+                self._stats["flushes"] += 1
+                self._stats["last_flush"] = datetime.now()
+                self._backoff = 0.0
+                self._retry_at = 0.0
+            else:
+                self._stats["failures"] += 1
+                self._stats["last_error"] = error
+                self._backoff = min(MAX_BACKOFF_S, max(0.5, self._backoff * 2))
+                self._retry_at = time.monotonic() + self._backoff
+                self._maybe_written.update(d["_id"] for d in batch)
+                self._buffer.extendleft(reversed(batch))
+                self._oldest_mono = time.monotonic()
+                overflow = self._take_overflow()
+        self._spill(overflow)
+        return error is None
+
+    # ---- volcado a disco ----------------------------------------------------
+    def _spill_files(self) -> list:
+        if not self.spill_dir:
+            return []
+        return sorted(glob.glob(os.path.join(self.spill_dir, f"{self.collection}-*.jsonl")))
+
+    def _spill(self, docs: list) -> None:
+        if not docs:
+            return
+        with self._cond:
+            # el replay de los archivos consulta siempre qué quedó escrito
+            self._maybe_written.difference_update(d.get("_id") for d in docs)
+        if not self.spill_dir:
+            with self._cond:
+                self._stats["dropped"] += len(docs)
+            print(f"[WARN] Buffer de snapshots lleno: se descartan {len(docs)} documentos.")
+            return
+        from bson import json_util
+
+        os.makedirs(self.spill_dir, exist_ok=True)
+        final = os.path.join(self.spill_dir, f"{self.collection}-{time.time_ns()}-{os.getpid()}.jsonl")
+        fd, tmp = tempfile.mkstemp(prefix=".tmp_", suffix=".jsonl", dir=self.spill_dir)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as fh:
+                for doc in docs:
+                    fh.write(json_util.dumps(doc) + "\n")
+            os.replace(tmp, final)
+        except OSError as e:
+            with contextlib.suppress(OSError):
+                os.remove(tmp)
+            with self._cond:
+                self._stats["dropped"] += len(docs)
+            print(f"[WARN] No se pudieron volcar {len(docs)} snapshots a disco ({e}); se descartan.")
+            return
+        with self._cond:
+            self._stats["spilled"] += len(docs)
+
+    def _replay_spilled(self) -> None:
+        """Reinserta los archivos volcados (uno por vez; se borra cada uno al escribirlo)."""
+        from bson import json_util
+        from config.db import get_db
+
+        for path in self._spill_files():
+            try:
+                with open(path, "r", encoding="utf-8") as fh:
+                    docs = [json_util.loads(line) for line in fh if line.strip()]
+                if docs:
+                    coll = get_db()[self.collection]
+                    with self._write_lock:
+                        # pudieron volcarse después de un insert fallido, o venir de un replay cortado
+                        ya = _existing_ids(coll, docs)
+                        pendientes = [d for d in docs if d["_id"] not in ya]
+                        try:
+                            if pendientes:
+                                coll.insert_many(pendientes, ordered=False)
+                        except Exception as e:
+                            if not _only_duplicates(e):
+                                raise
+                os.remove(path)
+            except Exception as e:
+                with self._cond:
+                    self._stats["last_error"] = f"{type(e).__name__}: {e}"
+                return
+            with self._cond:
+                self._stats["replayed"] += len(docs)
+
+
+def _existing_ids(coll, docs: list) -> set:
+    """`_id` de `docs` que ya están en la colección.
+
+    Filtra también por ticker y rango de `timestamp` para que una time series
+    sólo abra los buckets de esos tickers y fechas.
+    """
+    query = {"_id": {"$in": [d["_id"] for d in docs]}}
+    tickers = {d.get("ticker") for d in docs}
+    stamps = [d["timestamp"] for d in docs if isinstance(d.get("timestamp"), datetime)]
+    if None not in tickers:
+        query["ticker"] = {"$in": sorted(tickers)}
+    if len(stamps) == len(docs):
+        query["timestamp"] = {"$gte": min(stamps), "$lte": max(stamps)}
+    return {d["_id"] for d in coll.find(query, {"_id": 1})}
+
+
+def _only_duplicates(error: Exception) -> bool:
+    """True si el insert falló sólo por documentos que ya estaban escritos (reintento)."""
+    details = getattr(error, "details", None) or {}
+    errors = details.get("writeErrors") or []
+    return bool(errors) and not details.get("writeConcernErrors") and all(
+        e.get("code") == DUPLICATE_KEY for e in errors
+    )
+
+
+_writer: Optional[SnapshotWriter] = None
+_writer_guard = threading.Lock()
+
+
+def get_snapshot_writer() -> SnapshotWriter:
+    """Writer compartido del proceso (creado al primer uso)."""
+    global _writer
+    with _writer_guard:
+        if _writer is None:
+            from services.quote_history import HISTORY, ensure_history_collection
+
+            _writer = SnapshotWriter(
+                collection=HISTORY,
+                flush_size=int(os.environ.get("SNAPSHOT_FLUSH_SIZE", "100")),
+                flush_interval_s=float(os.environ.get("SNAPSHOT_FLUSH_INTERVAL_S", "2")),
+                max_buffer=int(os.environ.get("SNAPSHOT_MAX_BUFFER", "10000")),
+                spill_dir=os.environ.get("SNAPSHOT_SPILL_DIR", DEFAULT_SPILL_DIR),
+                ensure=lambda: ensure_history_collection(strict=False),
+            )
+            atexit.register(_writer.close)
+        return _writer
+
+
+def write_snapshot(doc: dict) -> None:
+    """Encola un snapshot para la colección `history` y retorna enseguida."""
+    get_snapshot_writer().submit(doc)
@@ -1,95 +1,212 @@
 """Servicios de datos bursátiles vía yfinance.
 
 Este módulo evita acoplar la UI: sólo retorna datos y persiste en DB.
+yfinance se importa al primer uso (es lento de importar).
+
+Una cotización se arma con:
+- precio, cierre previo y volumen de las últimas barras diarias del almacén de
+  barras, refrescadas si pasaron `QUOTE_REFRESH_TTL_S` segundos (la barra del
+  día en curso trae el último precio);
+- el nombre del caché de metadatos (services/ticker_metadata.py), que sólo
+  consulta `get_info()` la primera vez y luego cada muchos días.
+
+En el caso común eso es una sola consulta a la red (ninguna si las barras están
+frescas). Las llamadas en vivo que quedan corren en paralelo con un límite
+común de `QUOTE_CALL_TIMEOUT_S` segundos por consulta; `fast_info` sólo se
+consulta para los tickers sin barras. Los metadatos nuevos se guardan en una
+escritura por lote (y otra para los que lleguen tarde).
 """
 
-import yfinance as yf
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from datetime import datetime
-from config.db import get_db
+from typing import Dict, List, Optional, Tuple
 
+from config.profiling import span, timed
+from services.bar_store import get_history, get_history_many
+from services.snapshot_writer import write_snapshot
+from services.ticker_metadata import fetch_metadata, get_metadata_cache
 
-def get_stock_info(ticker: str):
-    """Obtiene nombre, precio actual, variación diaria y volumen de un ticker.
+QUOTE_REFRESH_TTL_S = float(os.environ.get("QUOTE_REFRESH_TTL_S", "60"))
+QUOTE_CALL_TIMEOUT_S = float(os.environ.get("QUOTE_CALL_TIMEOUT_S", "5"))
+QUOTE_WORKERS = int(os.environ.get("QUOTE_WORKERS", "8"))
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_guard = threading.Lock()
 
-    Intenta primero `fast_info` (rápido) y hace respaldo con `history()`.
-    También persiste un snapshot en MongoDB (colección `history`).
-    """
-    stock = yf.Ticker(ticker)
 
-    name = ticker.upper()
-    current_price = None
-    previous_close = None
-    volume = None
+def _executor() -> ThreadPoolExecutor:
+    """Pool compartido para las llamadas a yfinance (creado al primer uso)."""
+    global _pool
+    with _pool_guard:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=QUOTE_WORKERS, thread_name_prefix="quotes")
+        return _pool
 
-    # Intento rápido con fast_info
+
+def _wait(future: Future, deadline: float):
+    """Resultado de `future` si termina antes de `deadline` (time.monotonic); None si falla o vence."""
     try:
-        fi = stock.fast_info
-        if isinstance(fi, dict):
-            current_price = fi.get("last_price") or fi.get("regular_market_price")
-            previous_close = fi.get("regular_market_previous_close") or fi.get("previous_close")
-            volume = fi.get("last_volume") or fi.get("regular_market_volume") or fi.get("volume")
+        return future.result(timeout=max(0.0, deadline - time.monotonic()))
     except Exception:
-        pass
+        return None
 
-    # Respaldo con history()
-    if current_price is None or previous_close is None or volume is None:
-        try:
-            hist = stock.history(period="5d", interval="1d")
-            if not hist.empty:
-                last_row = hist.iloc[-1]
-                if current_price is None:
-                    current_price = float(last_row["Close"])
-                if volume is None and "Volume" in last_row:
-                    volume = int(last_row["Volume"])
-                if previous_close is None:
-                    if len(hist) >= 2:
-                        previous_close = float(hist["Close"].iloc[-2])
-                    else:
-                        previous_close = float(last_row["Close"])  # mejor que nada
-        except Exception:
-            pass
 
-    # Nombre (opcional)
+def _metadata_result(future: Future) -> Optional[dict]:
+    """Resultado de fetch_metadata ya terminado (None si falló)."""
     try:
-        info = stock.get_info()
-        if isinstance(info, dict):
-            name = info.get("shortName", name)
+        return future.result(timeout=0)
     except Exception:
-        pass
+        return None
 
-    if current_price is None or previous_close is None:
+
+def _remember_late_metadata(pending: Dict[str, Future]) -> None:
+    """Guarda en una sola escritura los metadatos que llegan después del timeout de la consulta."""
+    lock = threading.Lock()
+    done: Dict[str, Optional[dict]] = {}
+
+    def _on_done(ticker: str, future: Future) -> None:
+        with lock:
+            done[ticker] = _metadata_result(future)
+            if len(done) < len(pending):
+                return
+        get_metadata_cache().put_many(done)
+
+    for t, fut in pending.items():
+        fut.add_done_callback(lambda f, t=t: _on_done(t, f))
+
+
+def _quote_from_bars(hist) -> Optional[Tuple[float, float, Optional[int]]]:
+    """(precio, cierre previo, volumen) de las últimas barras diarias."""
+    if hist is None or hist.empty:
         return None
+    last_row = hist.iloc[-1]
+    price = float(last_row["Close"])
+    volume = last_row.get("Volume")
+    volume = int(volume) if volume is not None and volume == volume else None  # NaN != NaN
+    # con una sola barra no hay cierre previo: mejor que nada
+    previous_close = float(hist["Close"].iloc[-2]) if len(hist) >= 2 else price
+    return price, previous_close, volume
 
-    change = round((current_price - previous_close) / previous_close * 100, 2) if previous_close else None
 
-    # Persistencia en MongoDB (sin prints/UI)
-    try:
-        db = get_db()
-        db.history.insert_one({
-            "ticker": ticker,
+def _quote_from_fast_info(ticker: str) -> Optional[Tuple[float, float, Optional[int]]]:
+    """Respaldo con `fast_info` (no es un dict: expone `.get`).
+
+    last_price, regular_market_previous_close y last_volume salen de la misma
+    descarga; `previous_close` haría otra (barras horarias), por eso no se usa.
+    """
+    import yfinance as yf
+
+    fi = yf.Ticker(ticker).fast_info
+    price = fi.get("last_price")
+    previous_close = fi.get("regular_market_previous_close")
+    if price is None or previous_close is None:
+        return None
+    volume = fi.get("last_volume")
+    return float(price), float(previous_close), volume
+
+
+def _stock_info_many(tickers: List[str]) -> Dict[str, Optional[dict]]:
+    tickers = list(dict.fromkeys(tickers))
+    if not tickers:
+        return {}
+    cache = get_metadata_cache()
+    pool = _executor()
+
+    # todas las llamadas en vivo a la vez: barras de todos los tickers y metadatos vencidos
+    deadline = time.monotonic() + QUOTE_CALL_TIMEOUT_S
+    bars_future = pool.submit(get_history_many, tickers, period="5d", refresh_ttl=QUOTE_REFRESH_TTL_S)
+    meta_futures = {t: pool.submit(fetch_metadata, t) for t in cache.stale(tickers)}
+
+    with span("historial"):
+        historias = _wait(bars_future, deadline) or {}
+    quotes = {t: _quote_from_bars(historias.get(t.upper())) for t in tickers}
+
+    faltan = [t for t, q in quotes.items() if q is None]
+    if faltan:
+        # el respaldo comparte el límite de la consulta: no suma otro QUOTE_CALL_TIMEOUT_S
+        fi_futures = {t: pool.submit(_quote_from_fast_info, t) for t in faltan}
+        with span("fast_info", tickers=len(faltan)):
+            for t, fut in fi_futures.items():
+                quotes[t] = _wait(fut, deadline)
+
+    fetched: Dict[str, Optional[dict]] = {}
+    if meta_futures:
+        with span("nombre"):
+            wait(list(meta_futures.values()), timeout=max(0.0, deadline - time.monotonic()))
+        # una escritura del caché para lo que llegó a tiempo y otra para lo que llegue después
+        fetched = {t: _metadata_result(f) for t, f in meta_futures.items() if f.done()}
+        if fetched:
+            cache.put_many(fetched)
+        pending = {t: f for t, f in meta_futures.items() if not f.done()}
+        if pending:
+            _remember_late_metadata(pending)
+
+    ahora = datetime.now()
+    resultados: Dict[str, Optional[dict]] = {}
+    for t in tickers:
+        quote = quotes.get(t)
+        if quote is None:
+            resultados[t] = None
+            continue
+        current_price, previous_close, volume = quote
+        meta = fetched.get(t) or cache.lookup(t)[0] or {}
+        name = meta.get("name") or t.upper()
+        change = round((current_price - previous_close) / previous_close * 100, 2) if previous_close else None
+
+        # Persistencia en MongoDB (sin prints/UI): se encola y la escribe otro hilo
+        try:
+            with span("snapshot"):
+                write_snapshot({
+                    "ticker": t,
+                    "name": name,
+                    "price": current_price,
+                    "change": change,
+                    "volume": volume,
+                    "timestamp": ahora,
+                })
+        except Exception:
+            # Si el encolado falla, no romper el flujo de la CLI
+            pass
+
+        resultados[t] = {
+            "ticker": t,
             "name": name,
             "price": current_price,
             "change": change,
             "volume": volume,
-            "timestamp": datetime.now()
-        })
-    except Exception:
-        # Si DB no está disponible, no romper el flujo de la CLI
-        pass
+        }
+    return resultados
+
+
+@timed("get_stock_info")
+def get_stock_info(ticker: str):
+    """Obtiene nombre, precio actual, variación diaria y volumen de un ticker.
 
-    return {
-        "ticker": ticker,
-        "name": name,
-        "price": current_price,
-        "change": change,
-        "volume": volume,
-    }
+    Precio y volumen salen del almacén de barras (con `fast_info` como respaldo)
+    y el nombre del caché de metadatos; las consultas pendientes van en paralelo
+    con timeout. También persiste un snapshot en MongoDB (colección `history`) a
+    través del writer en segundo plano (services/snapshot_writer.py): no espera
+    a la BD. Retorna None si no se pudo obtener el precio.
+    """
+    return _stock_info_many([ticker]).get(ticker)
+
+
+@timed("get_stock_info_many")
+def get_stock_info_many(tickers: List[str]) -> Dict[str, Optional[dict]]:
+    """Versión en lote de get_stock_info: {ticker: info o None}.
+
+    Una sola descarga multi-ticker de barras, los metadatos que falten en
+    paralelo y un snapshot por ticker.
+    """
+    return _stock_info_many(tickers)
 
 
 def get_price_history(ticker: str, period: str = "30d"):
     """Devuelve la serie de cierres diarios para graficar desde la CLI."""
-    stock = yf.Ticker(ticker)
-    hist = stock.history(period=period, interval="1d")
+    hist = get_history(ticker, period=period)
     if hist is None or hist.empty:
         return None
     return hist["Close"]
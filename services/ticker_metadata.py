@@ -0,0 +1,144 @@
+"""Caché persistente de metadatos estáticos de tickers (nombre, moneda, bolsa, sector).
+
+`yf.Ticker(t).get_info()` es la llamada más lenta de yfinance y lo que se usa
+de ella casi nunca cambia. Los campos se guardan en un JSON
+(`TICKER_METADATA_PATH`, por defecto `data/ticker_metadata.json`) y se vuelven a
+pedir recién pasados `TICKER_METADATA_TTL_DAYS` días (30). Si la consulta falla
+se guarda igual la falla y se reintenta a los `TICKER_METADATA_RETRY_S` segundos,
+para no pagar la espera en cada cotización.
+
+Varios procesos pueden compartir el archivo: antes de escribir se relee y se
+mezclan las entradas.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_PATH = os.environ.get("TICKER_METADATA_PATH", os.path.join("data", "ticker_metadata.json"))
+TTL_DAYS = float(os.environ.get("TICKER_METADATA_TTL_DAYS", "30"))
+RETRY_S = float(os.environ.get("TICKER_METADATA_RETRY_S", "3600"))
+
+# campo guardado → claves de get_info() en orden de preferencia
+FIELDS = {
+    "name": ("shortName", "longName"),
+    "long_name": ("longName",),
+    "currency": ("currency",),
+    "exchange": ("exchange",),
+    "quote_type": ("quoteType",),
+    "sector": ("sector",),
+    "industry": ("industry",),
+}
+
+
+def fetch_metadata(ticker: str) -> dict:
+    """Consulta get_info() de yfinance y extrae FIELDS. Lanza la excepción si falla."""
+    import yfinance as yf
+
+    info = yf.Ticker(ticker).get_info()
+    if not isinstance(info, dict) or not info:
+        raise ValueError("get_info() sin datos")
+    entry = {}
+    for field, keys in FIELDS.items():
+        entry[field] = next((info[k] for k in keys if info.get(k)), None)
+    return entry
+
+
+class MetadataCache:
+    """Metadatos por ticker en memoria, respaldados por un archivo JSON."""
+
+    def __init__(self, path: str = DEFAULT_PATH, ttl_days: float = TTL_DAYS, retry_s: float = RETRY_S):
+        self.path = path
+        self.ttl_s = ttl_days * 86400.0
+        self.retry_s = retry_s
+        self._entries: Optional[Dict[str, dict]] = None
+        self._guard = threading.Lock()
+
+    def _read_file(self) -> Dict[str, dict]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as fh:
+                data = json.load(fh)
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def _ensure_loaded(self) -> Dict[str, dict]:
+        with self._guard:
+            if self._entries is None:
+                self._entries = self._read_file()
+            return self._entries
+
+    def _expired(self, entry: dict, now: datetime) -> bool:
+        try:
+            age = (now - datetime.fromisoformat(entry["fetched_at"])).total_seconds()
+        except (KeyError, TypeError, ValueError):
+            return True
+        return age >= (self.ttl_s if entry.get("ok") else self.retry_s)
+
+    def lookup(self, ticker: str, now: Optional[datetime] = None) -> Tuple[Optional[dict], bool]:
+        """(entrada guardada o None, hay que volver a consultarla)."""
+        entry = self._ensure_loaded().get(ticker.upper())
+        if entry is None:
+            return None, True
+        return entry, self._expired(entry, now or datetime.now())
+
+    def stale(self, tickers: Iterable[str]) -> List[str]:
+        """Tickers sin entrada o con la entrada vencida."""
+        now = datetime.now()
+        return [t for t in tickers if self.lookup(t, now)[1]]
+
+    def put_many(self, entries: Dict[str, Optional[dict]]) -> None:
+        """Guarda resultados de fetch_metadata (None = la consulta falló) y persiste el archivo."""
+        if not entries:
+            return
+        now = datetime.now().isoformat()
+        fresh = {}
+        for ticker, entry in entries.items():
+            if entry is None:
+                fresh[ticker.upper()] = {"ok": False, "fetched_at": now}
+            else:
+                fresh[ticker.upper()] = {**entry, "ok": True, "fetched_at": now}
+        self._ensure_loaded()
+        with self._guard:
+            merged = self._read_file()
+            # otro proceso pudo escribir entradas más nuevas: gana la consulta más reciente
+            for ticker, entry in self._entries.items():
+                if entry.get("fetched_at", "") >= merged.get(ticker, {}).get("fetched_at", ""):
+                    merged[ticker] = entry
+            for ticker, entry in fresh.items():
+                # una falla nueva no pisa datos válidos: sólo posterga el reintento
+                old = merged.get(ticker)
+                if not entry["ok"] and old and old.get("ok"):
+                    entry = {**old, "ok": False, "fetched_at": now}
+                merged[ticker] = entry
+            self._entries = merged
+            self._write(merged)
+
+    def _write(self, entries: Dict[str, dict]) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as fh:
+                json.dump(entries, fh, ensure_ascii=False, sort_keys=True)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"[WARN] No se pudo guardar el caché de metadatos ({e}).")
+
+
+_cache: Optional[MetadataCache] = None
+_cache_guard = threading.Lock()
+
+
+def get_metadata_cache() -> MetadataCache:
+    """Caché compartido del proceso (creado al primer uso)."""
+    global _cache
+    with _cache_guard:
+        if _cache is None:
+            _cache = MetadataCache()
+        return _cache
@@ -0,0 +1,58 @@
+"""El almacén de barras no mezcla escalas de precio cuando el provider reajusta el historial."""
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import generate_ohlcv
+from services.bar_store import BarStore
+
+
+class _Provider:
+    """Historial sintético: `visible` barras publicadas y precios pasados multiplicados por `factor`."""
+
+    def __init__(self):
+        self.full = generate_ohlcv("AAA", 300)
+        self.visible = 250
+        self.factor = 1.0
+        self.starts = []
+
+    def bars(self):
+        df = self.full.iloc[: self.visible].copy()
+        df[["Open", "High", "Low", "Close"]] *= self.factor
+        return df
+
+    def fetch(self, ticker, start, end=None):
+        self.starts.append(start)
+        df = self.bars()
+        if start is not None:
+            df = df[df.index >= pd.Timestamp(start)]
+        return df
+
+
+def _store(tmp_path, provider):
+    return BarStore(root=str(tmp_path), provider=provider, refresh_ttl=0)
+
+
+def test_split_reemplaza_el_historial(tmp_path):
+    provider = _Provider()
+    store = _store(tmp_path, provider)
+    store.history("AAA", period="max")
+
+    # split 10:1 y dos barras nuevas: el provider reescala todo lo anterior
+    provider.factor, provider.visible = 0.1, 252
+    df = store.history("AAA", period="max")
+    np.testing.assert_allclose(df["Close"].to_numpy(), provider.bars()["Close"].to_numpy())
+    assert df["Close"].pct_change().abs().max() < 0.5
+    assert provider.starts[-1] is None  # se descargó de nuevo todo lo cubierto
+
+
+def test_barra_del_dia_no_fuerza_descarga_completa(tmp_path):
+    provider = _Provider()
+    store = _store(tmp_path, provider)
+    store.history("AAA", period="max")
+
+    # la barra del día sigue abierta y cambia su cierre
+    provider.full.iloc[provider.visible - 1, provider.full.columns.get_loc("Close")] *= 1.02
+    df = store.history("AAA", period="max")
+    assert df["Close"].iloc[-1] == provider.bars()["Close"].iloc[-1]
+    assert provider.starts[-1] is not None and len(provider.starts) == 2
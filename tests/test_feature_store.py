@@ -0,0 +1,41 @@
+"""Esquema del almacén de features: estable ante cambios cosméticos y sin borrados automáticos."""
+
+import os
+
+from benchmarks.synthetic import generate_ohlcv
+from ml.feature_store import SCHEMA_HASH, FeatureStore, _normalized_source, _schema_hash
+
+CODIGO = '''
+def media(df):
+    """Media móvil."""
+    return df["Close"].rolling(5).mean()
+'''
+
+
+def test_comentarios_y_espacios_no_cambian_el_esquema():
+    cosmetico = '''
+def media(df):
+    """Media móvil de 5 barras (docstring nueva)."""
+    # comentario agregado
+
+    return df["Close"].rolling( 5 ).mean()   # otro
+'''
+    assert _normalized_source(cosmetico) == _normalized_source(CODIGO)
+    assert _normalized_source(CODIGO.replace("5", "10")) != _normalized_source(CODIGO)
+    assert _schema_hash() == SCHEMA_HASH
+
+
+def test_no_borra_esquemas_anteriores_al_guardar(tmp_path):
+    root = str(tmp_path)
+    viejo = FeatureStore(root, schema="viejo")
+    viejo.features("AAA", generate_ohlcv("AAA", 60))
+
+    nuevo = FeatureStore(root)
+    nuevo.features("AAA", generate_ohlcv("AAA", 60))
+    # un proceso con el código anterior sigue leyendo su directorio
+    assert not viejo.read("AAA").empty
+    assert nuevo.old_schemas() == ["viejo"]
+
+    assert nuevo.purge_old_schemas() == ["viejo"]
+    assert not os.path.exists(viejo.directory)
+    assert not nuevo.read("AAA").empty
@@ -0,0 +1,93 @@
+"""Paridad de ml/indicators.py con pandas rolling/ewm, incluso con NaN en medio de la serie."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic import generate_ohlcv, synthetic_tickers
+from ml.features import to_panel
+from ml.indicators import _EMA_VECTOR_MIN_ROWS, INDICATORS, compute_indicators
+
+NAMES = ["Return", "MA5", "MA10", "Volatility", "RSI14", "MACD", "MACDSignal", "MACDHist", "BBWidth20", "ATR14", "VolumeZ20"]
+
+
+def _reference(df: pd.DataFrame) -> pd.DataFrame:
+    """Los mismos indicadores escritos con pandas para un ticker."""
+    close, high, low, volume = df["Close"], df["High"], df["Low"], df["Volume"]
+    prev = close.shift(1)
+    delta = close - prev
+    out = pd.DataFrame(index=df.index)
+    out["Return"] = close / prev - 1.0
+    out["MA5"] = close.rolling(5).mean()
+    out["MA10"] = close.rolling(10).mean()
+    out["Volatility"] = close.rolling(5).std()
+
+    gain = delta.where(delta.isna() | (delta > 0), 0.0).ewm(alpha=1 / 14, adjust=False).mean()
+    loss = (-delta).where(delta.isna() | (delta < 0), 0.0).ewm(alpha=1 / 14, adjust=False).mean()
+    rsi = (100.0 - 100.0 / (1.0 + gain / loss)).where(loss != 0, 100.0)
+    out["RSI14"] = rsi.where(np.arange(len(df)) >= 14)
+
+    macd = close.ewm(span=12, adjust=False).mean() - close.ewm(span=26, adjust=False).mean()
+    signal = macd.ewm(span=9, adjust=False).mean()
+    warm = np.arange(len(df))
+    out["MACD"] = macd.where(warm >= 25)
+    out["MACDSignal"] = signal.where(warm >= 33)
+    out["MACDHist"] = (macd - signal).where(warm >= 33)
+
+    out["BBWidth20"] = 4.0 * close.rolling(20).std(ddof=0) / close.rolling(20).mean()
+    tr = pd.concat([high - low, (high - prev).abs(), (low - prev).abs()], axis=1).max(axis=1)
+    out["ATR14"] = tr.ewm(alpha=1 / 14, adjust=False).mean().where(warm >= 13)
+    mean, std = volume.rolling(20).mean(), volume.rolling(20).std()
+    z = (volume - mean) / std
+    out["VolumeZ20"] = z.mask((std == 0) & mean.notna(), 0.0)
+    return out
+
+
+def _with_gaps(df: pd.DataFrame, seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    df = df.copy()
+    for col in ("Close", "Volume", "High"):
+        rows = rng.choice(np.arange(40, len(df)), size=3, replace=False)
+        df.iloc[rows, df.columns.get_loc(col)] = np.nan
+    # un hueco de varias barras seguidas
+    df.iloc[100:103, df.columns.get_loc("Close")] = np.nan
+    return df
+
+
+def _assert_parity(got: pd.DataFrame, ref: pd.DataFrame):
+    for name in NAMES:
+        a, b = got[name].to_numpy(), ref[name].to_numpy()
+        np.testing.assert_array_equal(np.isnan(a), np.isnan(b), err_msg=name)
+        np.testing.assert_allclose(a[~np.isnan(a)], b[~np.isnan(b)], rtol=1e-7, atol=1e-9, err_msg=name)
+
+
+def test_todos_los_indicadores_estan_cubiertos():
+    assert set(NAMES) | {f"ReturnLag{i}" for i in range(1, 6)} == set(INDICATORS)
+
+
+@pytest.mark.parametrize("gaps", [False, True])
+def test_un_ticker_coincide_con_pandas(gaps):
+    df = generate_ohlcv("AAA", 300)
+    if gaps:
+        df = _with_gaps(df, 0)
+    _assert_parity(compute_indicators(df, NAMES), _reference(df))
+
+
+def test_un_nan_solo_anula_sus_ventanas():
+    df = generate_ohlcv("AAA", 300)
+    df.iloc[150, df.columns.get_loc("Volume")] = np.nan
+    z = compute_indicators(df, ["VolumeZ20"])["VolumeZ20"]
+    assert z.isna().sum() == 19 + 20
+    assert z.iloc[170:].notna().all()
+
+
+@pytest.mark.parametrize("gaps", [False, True])
+def test_panel_coincide_con_pandas(gaps):
+    # suficientes tickers para la EMA vectorizada entre tickers, con largos distintos
+    tickers = synthetic_tickers(_EMA_VECTOR_MIN_ROWS + 2)
+    frames = {t: generate_ohlcv(t, 120 + 7 * i) for i, t in enumerate(tickers)}
+    if gaps:
+        frames = {t: _with_gaps(df, i) for i, (t, df) in enumerate(frames.items())}
+    got = compute_indicators(to_panel(frames), NAMES)
+    for t, df in frames.items():
+        _assert_parity(got.xs(t, level=0), _reference(df))
@@ -0,0 +1,102 @@
+"""Refresco incremental de modelos locales: usa los árboles nuevos y tolera barras de una sola clase."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("xgboost")
+
+from ml.local_refresh import _base_booster, _continue_boosting
+
+
+def _data(n, seed):
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame(rng.normal(size=(n, 4)), columns=list("abcd"))
+    y = pd.Series((X["a"] + 0.5 * rng.normal(size=n) > 0).astype(int))
+    return X, y
+
+
+def _modelo_con_early_stopping():
+    from xgboost import XGBClassifier
+
+    X, y = _data(400, 0)
+    X_val, y_val = _data(100, 1)
+    model = XGBClassifier(n_estimators=500, early_stopping_rounds=10, eval_metric="auc", random_state=42)
+    model.fit(X, y, eval_set=[(X_val, y_val)], verbose=False)
+    assert model.best_iteration + 1 < model.get_booster().num_boosted_rounds()
+    return model
+
+
+def test_base_booster_recorta_hasta_best_iteration():
+    model = _modelo_con_early_stopping()
+    base = _base_booster(model)
+    assert base.num_boosted_rounds() == model.best_iteration + 1
+    assert base.attr("best_iteration") is None
+    X, _ = _data(50, 2)
+    np.testing.assert_allclose(
+        model.predict_proba(X)[:, 1],
+        base.inplace_predict(X.to_numpy(), validate_features=False),
+        rtol=1e-6,
+    )
+
+
+def test_continue_boosting_cambia_las_predicciones():
+    model = _modelo_con_early_stopping()
+    # barras nuevas con otra relación: los árboles agregados deben notarse
+    X_new, y_new = _data(60, 3)
+    y_new = 1 - y_new
+    updated = _continue_boosting(model, X_new, y_new, rounds=20)
+
+    assert updated.get_booster().num_boosted_rounds() == model.best_iteration + 1 + 20
+    X, _ = _data(50, 4)
+    antes = model.predict_proba(X)[:, 1]
+    despues = updated.predict_proba(X)[:, 1]
+    assert np.abs(despues - antes).max() > 1e-3
+
+
+@pytest.fixture
+def barras_de_una_clase(monkeypatch):
+    """Barras nuevas cuyas etiquetas son todas 1; guardar en Mongo queda registrado en `guardados`."""
+    from ml import local_refresh
+
+    X_old, y_old = _data(400, 0)
+    X_new, _ = _data(4, 5)
+    X = pd.concat([X_old, X_new], ignore_index=True)
+    X.index = pd.bdate_range("2024-01-01", periods=len(X))
+    y = pd.concat([y_old, pd.Series([1] * len(X_new))], ignore_index=True)
+    y.index = X.index
+    # una barra más (la última, sin etiqueta) en el historial
+    df = pd.DataFrame(index=pd.bdate_range("2024-01-01", periods=len(X) + 1))
+
+    guardados = []
+    monkeypatch.setattr(local_refresh, "get_history", lambda ticker, period: df)
+    monkeypatch.setattr(local_refresh, "_labeled_rows", lambda ticker, df: (X, y))
+    monkeypatch.setattr(local_refresh, "guardar_modelo_en_mongo", lambda t, m, metadata: guardados.append(metadata))
+    monkeypatch.setattr(local_refresh, "dump_atomic", lambda m, path: None)
+    metadata = {"last_bar": str(X.index[len(X_old) - 1].date()), "trained_at": "2020-01-01T00:00:00"}
+    return metadata, X.index[-1], guardados
+
+
+def test_barras_nuevas_de_una_clase_conservan_el_modelo(barras_de_una_clase):
+    from ml.local_refresh import refresh_local_model
+
+    metadata, ultima, guardados = barras_de_una_clase
+    model = _modelo_con_early_stopping()
+    nuevo, accion = refresh_local_model("AAA", model, metadata)
+
+    assert accion == "vigente" and nuevo is model
+    assert guardados and guardados[-1]["last_bar"] == str(ultima.date())
+    assert guardados[-1]["refresh"]["accion"] == "sin_cambios"
+    assert len(guardados[-1]["oos"]["labels"]) == 4
+
+
+def test_si_el_refresco_falla_devuelve_el_modelo_existente(barras_de_una_clase, monkeypatch):
+    from ml import local_refresh
+
+    def falla(*args, **kwargs):
+        raise RuntimeError("boom")
+
+    metadata, _, _ = barras_de_una_clase
+    monkeypatch.setattr(local_refresh, "_labeled_rows", falla)
+    model = _modelo_con_early_stopping()
+    assert local_refresh.refresh_local_model("AAA", model, metadata) == (model, "error")
@@ -0,0 +1,106 @@
+"""Marcas de agua y buffers de repaso del MLP global en línea (barras y acciones_usuario)."""
+
+import os
+
+import pytest
+
+from benchmarks.synthetic import SyntheticProvider, seed_interactions, synthetic_tickers
+from config import model_registry
+from config.db import use_database
+from config.memory_db import MemoryDB
+from ml.feature_store import FeatureStore, set_feature_store
+from services.bar_store import get_bar_store
+
+
+class _Provider(SyntheticProvider):
+    """Barras sintéticas sin las últimas `hide` (para simular que llegan barras nuevas)."""
+
+    hide = 0
+
+    def fetch(self, ticker, start, end=None):
+        df = super().fetch(ticker, start, end)
+        if self.hide:
+            df = df[df.index <= self._full(ticker).index[-1 - self.hide]]
+        return df
+
+
+@pytest.fixture
+def entorno(tmp_path, monkeypatch):
+    from services.bar_store import get_bar_store, set_provider
+
+    monkeypatch.chdir(tmp_path)
+    store = get_bar_store()
+    prev = store.root, store.provider, store.refresh_ttl
+    store.root = str(tmp_path / "bars")
+    store.refresh_ttl = 0
+    set_provider(_Provider(n_bars=300))
+    set_feature_store(FeatureStore(str(tmp_path / "features")))
+    db = MemoryDB()
+    use_database(db)
+    yield db
+    use_database(None)
+    set_feature_store(None)
+    store.root, store.provider, store.refresh_ttl = prev
+
+
+def test_actualizacion_por_barras_sigue_en_linea_despues_de_una_por_registros(entorno):
+    from ml.global_models import train_or_update_mlp_global
+    from ml.online_mlp import BARS_REPLAY_PATH, REPLAY_PATH, high_water_marks, train_mlp_online
+
+    tickers = synthetic_tickers(3)
+    get_bar_store().provider.hide = 5
+    train_or_update_mlp_global(tickers, period="1y")
+    fin_barras = model_registry.get_metadata("GLOBAL_MLP")["training_window"]["end"]
+
+    seed_interactions(entorno, tickers, 200, n_bars=300)
+    _, n_new = train_mlp_online()
+    assert n_new > 0
+    meta = model_registry.get_metadata("GLOBAL_MLP")
+    assert "training_window" not in meta
+    # la versión por registros conserva la marca de barras de la anterior
+    assert meta["hwm"]["bars"] == fin_barras
+    assert high_water_marks()["interactions"] == meta["online"]["hwm"]
+
+    get_bar_store().provider.hide = 0
+    train_or_update_mlp_global(tickers, period="1y", online=True)
+    meta = model_registry.get_metadata("GLOBAL_MLP")
+    # partial_fit sólo con las barras nuevas, no un reajuste completo
+    assert meta["online"]["n_new"] > 0
+    assert meta["hwm"]["bars"] > fin_barras
+    assert meta["hwm"]["interactions"] is not None
+    assert os.path.exists(REPLAY_PATH) and os.path.exists(BARS_REPLAY_PATH)
+
+
+def test_marcas_de_versiones_anteriores_al_campo_hwm_salen_del_historial(entorno):
+    from sklearn.dummy import DummyClassifier
+
+    modelo = DummyClassifier().fit([[0], [1]], [0, 1])
+    model_registry.publish("GLOBAL_MLP", modelo, metadata={"training_window": {"end": "2024-01-31"}})
+    model_registry.publish("GLOBAL_MLP", modelo, metadata={"source": "acciones_usuario", "online": {"hwm": "2024-02-15T10:00:00"}})
+
+    from ml.online_mlp import high_water_marks
+
+    assert high_water_marks() == {"bars": "2024-01-31", "interactions": "2024-02-15T10:00:00"}
+
+
+def test_la_ultima_barra_sin_etiqueta_se_aprende_en_la_siguiente_actualizacion(entorno):
+    from ml.global_models import build_global_dataset, train_or_update_mlp_global
+    from services.bar_store import get_history
+
+    tickers = synthetic_tickers(3)
+    provider = get_bar_store().provider
+    provider.hide = 5
+    visibles = get_history(tickers[0], period="1y").index
+    ds = build_global_dataset(tickers, period="1y")
+    # la última barra de cada ticker no tiene etiqueta: no entra al dataset
+    assert ds.dates.max() == visibles[-2]
+
+    train_or_update_mlp_global(tickers, period="1y")
+    assert model_registry.get_metadata("GLOBAL_MLP")["hwm"]["bars"] == str(visibles[-2].date())
+
+    # llega una barra: la que era última ya tiene etiqueta y es lo único nuevo
+    provider.hide = 4
+    train_or_update_mlp_global(tickers, period="1y", online=True)
+    meta = model_registry.get_metadata("GLOBAL_MLP")
+    assert meta["online"]["n_new"] == len(tickers)
+    assert meta["hwm"]["bars"] == str(visibles[-1].date())
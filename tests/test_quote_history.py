@@ -0,0 +1,125 @@
+"""Provider de resúmenes diarios (huecos completados con el respaldo) y writer de snapshots (sin duplicados, sin bloquearse por permisos)."""
+
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("bson")
+
+from benchmarks.synthetic import SyntheticProvider
+from config.db import use_database
+from config.memory_db import MemoryDB
+from services.bar_store import BarStore
+from services.quote_history import DAILY, HISTORY, SnapshotRollupProvider, ensure_history_collection, rollup_lag_warning
+from services.snapshot_writer import SnapshotWriter
+
+
+@pytest.fixture
+def db():
+    mem = MemoryDB()
+    use_database(mem)
+    yield mem
+    use_database(None)
+
+
+def _seed_rollups(db, ticker, days):
+    for day in days:
+        db[DAILY].insert_one({
+            "ticker": ticker, "date": day.to_pydatetime(),
+            "open": -1.0, "high": -1.0, "low": -1.0, "close": -1.0, "volume": 1,
+        })
+
+
+def test_provider_completa_los_dias_sin_resumen(db):
+    fallback = SyntheticProvider(n_bars=300)
+    full = fallback.fetch("AAA", None)
+    resumidos = full.index[-40:-37]  # tres días sueltos en medio
+    _seed_rollups(db, "AAA", resumidos)
+    start = full.index[-120].to_pydatetime()
+
+    df = SnapshotRollupProvider(fallback=fallback).fetch("AAA", start)
+
+    esperado = full[full.index >= start]
+    assert df.index.equals(esperado.index)
+    # gana el resumen en los días que lo tienen; el resto viene del respaldo
+    assert (df.loc[resumidos, "Close"] == -1.0).all()
+    otros = esperado.index.difference(resumidos)
+    pd.testing.assert_series_equal(df.loc[otros, "Close"], esperado.loc[otros, "Close"], check_freq=False)
+
+
+def test_provider_sin_respaldo_devuelve_solo_resumenes(db):
+    full = SyntheticProvider(n_bars=60).fetch("AAA", None)
+    _seed_rollups(db, "AAA", full.index[-5:])
+    df = SnapshotRollupProvider().fetch("AAA", full.index[0].to_pydatetime())
+    assert len(df) == 5
+
+
+def test_bar_store_con_rollups_no_trunca_la_historia(db, tmp_path):
+    fallback = SyntheticProvider(n_bars=600)
+    full = fallback.fetch("AAA", None)
+    _seed_rollups(db, "AAA", full.index[-3:])
+    store = BarStore(root=str(tmp_path), provider=SnapshotRollupProvider(fallback=fallback))
+    df = store.history("AAA", period="1y")
+    assert len(df) == len(full[full.index >= df.index[0]])
+    assert df.index[0] <= pd.Timestamp(datetime.now() - timedelta(days=360))
+
+
+def test_writer_no_duplica_al_reintentar_un_lote_escrito_en_parte(db, tmp_path):
+    coll = db[HISTORY]
+    insert_many = coll.insert_many
+    fallos = []
+
+    def insert_parcial(docs, ordered=True):
+        if not fallos:
+            fallos.append(1)
+            insert_many(docs[: len(docs) // 2], ordered=ordered)
+            raise ConnectionError("conexión cortada después de escribir")
+        return insert_many(docs, ordered=ordered)
+
+    coll.insert_many = insert_parcial
+    # lote grande e intervalo largo: el hilo no escribe solo, los flush son explícitos
+    writer = SnapshotWriter(collection=HISTORY, flush_size=100, flush_interval_s=60, spill_dir=str(tmp_path))
+    ahora = datetime.now()
+    for i in range(10):
+        writer.submit({"ticker": "AAA", "price": float(i), "timestamp": ahora + timedelta(seconds=i)})
+    assert not writer.flush()
+    assert writer.flush()
+    writer.close()
+
+    ids = [d["_id"] for d in coll.find({})]
+    assert len(ids) == 10 and len(set(ids)) == 10
+    assert writer.status()["failures"] == 1
+
+
+def test_aviso_si_el_resumen_queda_atras_de_la_retencion(db):
+    db[HISTORY].insert_one({"ticker": "AAA", "price": 1.0, "timestamp": datetime.now() - timedelta(days=20)})
+    assert rollup_lag_warning(db, ttl_days=30) is not None
+    db[DAILY].insert_one({"ticker": "AAA", "date": datetime.now() - timedelta(days=1)})
+    assert rollup_lag_warning(db, ttl_days=30) is None
+    assert rollup_lag_warning(db, ttl_days=0) is None
+
+
+def test_writer_escribe_aunque_falten_permisos_para_configurar(db, tmp_path, monkeypatch):
+    from pymongo.errors import OperationFailure
+
+    ensure_history_collection(db)  # la time series ya existe (la creó un administrador)
+
+    def sin_permiso(*args, **kwargs):
+        raise OperationFailure("not authorized", code=13)
+
+    monkeypatch.setattr(db, "command", sin_permiso)
+    monkeypatch.setattr(type(db[HISTORY]), "create_index", sin_permiso)
+    with pytest.raises(OperationFailure):
+        ensure_history_collection(db)
+
+    writer = SnapshotWriter(
+        collection=HISTORY, flush_size=100, flush_interval_s=60, spill_dir=str(tmp_path),
+        ensure=lambda: ensure_history_collection(db, strict=False),
+    )
+    for i in range(5):
+        writer.submit({"ticker": "AAA", "price": float(i), "timestamp": datetime.now()})
+    assert writer.flush()
+    writer.close()
+    assert db[HISTORY].count_documents({}) == 5
+    assert writer.status()["failures"] == 0
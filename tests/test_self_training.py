@@ -0,0 +1,58 @@
+"""El auto-entrenamiento sólo usa referencias que reproducen el vector puntuado."""
+
+import pytest
+
+from benchmarks.synthetic import SyntheticProvider
+from ml.feature_store import FeatureStore, feature_hash, get_feature_store, set_feature_store
+from ml.features import FEATURE_COLUMNS
+from ml.recomendacion import _feature_ref
+from ml.self_training import _resolve_refs
+from ml.streaming_features import latest_features
+
+
+@pytest.fixture
+def almacenes(tmp_path):
+    from services.bar_store import get_bar_store, set_provider
+
+    store = get_bar_store()
+    prev = store.root, store.provider
+    store.root = str(tmp_path / "bars")
+    set_provider(SyntheticProvider(n_bars=120))
+    set_feature_store(FeatureStore(str(tmp_path / "features")))
+    yield store
+    store.root, store.provider = prev
+    set_feature_store(None)
+
+
+def test_hash_del_calculo_incremental_coincide_con_el_almacen(almacenes):
+    from services.bar_store import get_history
+
+    ticker = "REFS"
+    fecha, fila = latest_features(ticker)
+    guardada = get_feature_store().features(ticker, get_history(ticker, period="2mo")).loc[fecha]
+    assert _feature_ref(fecha, fila.iloc[0])["hash"] == feature_hash(guardada[FEATURE_COLUMNS])
+
+
+def test_descarta_referencias_que_no_coinciden(almacenes):
+    from services.bar_store import get_history
+
+    ticker = "REFS"
+    feats = get_feature_store().features(ticker, get_history(ticker, period="2mo")).dropna()
+    fecha = feats.index[-1]
+    fila = feats.loc[fecha, FEATURE_COLUMNS]
+    # la barra del día puntuada antes del cierre: el vector guardado ya es otro
+    abierta = fila.copy()
+    abierta["Close"] *= 1.01
+    otro_esquema = _feature_ref(fecha, fila)
+    otro_esquema["schema"] = "otro"
+    sin_hash = _feature_ref(fecha, fila)
+    del sin_hash["hash"]
+
+    docs = [
+        {"ticker": ticker, "feature_ref": _feature_ref(fecha, fila)},
+        {"ticker": ticker, "feature_ref": _feature_ref(fecha, abierta)},
+        {"ticker": ticker, "feature_ref": otro_esquema},
+        {"ticker": ticker, "feature_ref": sin_hash},
+    ]
+    _resolve_refs(docs)
+    assert [doc.get("features") is not None for doc in docs] == [True, False, False, True]
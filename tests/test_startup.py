@@ -0,0 +1,43 @@
+"""El arranque de la CLI no debe traer dependencias pesadas ni superar su presupuesto de tiempo."""
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ("pandas", "yfinance", "pymongo", "xgboost", "sklearn")
+# segundos para `import main` (sin contar el arranque del intérprete); sólo pandas ya tarda más
+IMPORT_MAIN_BUDGET_S = float(os.environ.get("IMPORT_MAIN_BUDGET_S", "0.25"))
+
+
+def _import_fresh(statement: str, forbidden) -> dict:
+    """Ejecuta `statement` en un intérprete nuevo: {"seconds", "loaded"} (los `forbidden` importados)."""
+    code = (
+        "import json, sys, time\n"
+        "t0 = time.perf_counter()\n"
+        f"{statement}\n"
+        "elapsed = time.perf_counter() - t0\n"
+        f"print(json.dumps({{'seconds': elapsed, 'loaded': [m for m in {tuple(forbidden)!r} if m in sys.modules]}}))\n"
+    )
+    out = subprocess.run([sys.executable, "-c", code], cwd=REPO_ROOT, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def test_import_main_no_trae_dependencias_pesadas():
+    result = _import_fresh("import main", HEAVY_MODULES)
+    assert result["loaded"] == []
+
+
+def test_import_main_dentro_del_presupuesto():
+    # el mejor de tres: el primer arranque puede pagar la compilación de .pyc o una caché de disco fría
+    seconds = min(_import_fresh("import main", ())["seconds"] for _ in range(3))
+    assert seconds <= IMPORT_MAIN_BUDGET_S, f"import main tardó {seconds:.3f} s (presupuesto {IMPORT_MAIN_BUDGET_S} s)"
+
+
+@pytest.mark.parametrize("module", ["ml.recomendacion", "server"])
+def test_modulos_de_inferencia_no_traen_yfinance_ni_entrenamiento(module):
+    result = _import_fresh(f"import {module}", ("yfinance", "xgboost", "sklearn"))
+    assert result["loaded"] == []
@@ -0,0 +1,73 @@
+"""Cotizaciones en lote: un límite de tiempo por consulta y escrituras agrupadas del caché de nombres."""
+
+import threading
+import time
+
+import pytest
+
+from benchmarks.synthetic import generate_ohlcv
+from services import stocks
+
+
+class _Cache:
+    """Caché de metadatos en memoria que cuenta las escrituras."""
+
+    def __init__(self):
+        self.writes = []
+        self.written = threading.Event()
+
+    def stale(self, tickers):
+        return list(tickers)
+
+    def lookup(self, ticker):
+        return None, True
+
+    def put_many(self, entries):
+        self.writes.append(dict(entries))
+        self.written.set()
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = _Cache()
+    monkeypatch.setattr(stocks, "get_metadata_cache", lambda: cache)
+    monkeypatch.setattr(stocks, "write_snapshot", lambda doc: None)
+    monkeypatch.setattr(stocks, "QUOTE_CALL_TIMEOUT_S", 0.5)
+    return cache
+
+
+def test_metadatos_en_una_escritura_por_lote(cache, monkeypatch):
+    tickers = [f"T{i}" for i in range(6)]
+    monkeypatch.setattr(stocks, "get_history_many", lambda ts, **kw: {t: generate_ohlcv(t, 5) for t in ts})
+
+    def fetch(t):
+        if t == "T5":
+            time.sleep(0.8)  # llega después del límite
+        return {"name": f"Empresa {t}"}
+
+    monkeypatch.setattr(stocks, "fetch_metadata", fetch)
+    out = stocks.get_stock_info_many(tickers)
+    assert out["T0"]["name"] == "Empresa T0"
+    assert out["T5"]["name"] == "T5"
+    assert len(cache.writes) == 1 and set(cache.writes[0]) == set(tickers[:5])
+
+    cache.written.clear()
+    assert cache.written.wait(2)
+    assert len(cache.writes) == 2 and set(cache.writes[1]) == {"T5"}
+
+
+def test_fast_info_usa_el_tiempo_restante(cache, monkeypatch):
+    def sin_barras(ts, **kw):
+        time.sleep(0.3)
+        return {}
+
+    def fast_info(t):
+        time.sleep(0.4)
+        return 10.0, 9.0, 100
+
+    monkeypatch.setattr(stocks, "get_history_many", sin_barras)
+    monkeypatch.setattr(stocks, "_quote_from_fast_info", fast_info)
+    monkeypatch.setattr(stocks, "fetch_metadata", lambda t: {"name": t})
+    inicio = time.monotonic()
+    assert stocks.get_stock_info("AAA") is None
+    assert time.monotonic() - inicio < 0.65
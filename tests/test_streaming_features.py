@@ -0,0 +1,99 @@
+"""El estado incremental de ml/streaming_features.py produce las mismas features que ml/features.py."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic import SyntheticProvider, generate_ohlcv
+from ml.feature_store import FeatureStore, set_feature_store
+from ml.features import FEATURE_COLUMNS, FEATURE_LOOKBACK, add_basic_features
+from ml.streaming_features import FeatureState, latest_features
+
+
+def _esperado(df: pd.DataFrame) -> np.ndarray:
+    return add_basic_features(df)[FEATURE_COLUMNS].iloc[-1].to_numpy(dtype=float)
+
+
+def _assert_vector(state: FeatureState, df: pd.DataFrame):
+    np.testing.assert_allclose(state.vector(), _esperado(df), rtol=1e-9, atol=1e-9)
+    assert state.last_date == df.index[-1]
+
+
+def test_barra_por_barra_coincide_con_add_basic_features():
+    # más barras que _RESYNC_EVERY para pasar por la resincronización de las sumas
+    df = generate_ohlcv("AAA", 1200)
+    state = FeatureState()
+    for i, (date, bar) in enumerate(df.iterrows()):
+        state.update(date, bar["Open"], bar["High"], bar["Low"], bar["Close"], bar["Volume"])
+        if i + 1 < FEATURE_LOOKBACK:
+            assert state.vector() is None
+        elif i % 97 == 0 or i == len(df) - 1:
+            _assert_vector(state, df.iloc[: i + 1])
+
+
+def test_update_frame_coincide_con_add_basic_features():
+    df = generate_ohlcv("AAA", 300)
+    state = FeatureState()
+    state.update_frame(df.iloc[:200])
+    state.update_frame(df.iloc[:260])
+    _assert_vector(state, df.iloc[:260])
+
+
+def test_reemplaza_la_barra_del_dia():
+    df = generate_ohlcv("AAA", 100)
+    state = FeatureState()
+    state.update_frame(df)
+    intradia = df.copy()
+    intradia.iloc[-1, intradia.columns.get_loc("Close")] *= 1.03
+    intradia.iloc[-1, intradia.columns.get_loc("Volume")] *= 2
+    state.update_frame(intradia)
+    _assert_vector(state, intradia)
+
+
+def test_se_resincroniza_despues_de_un_hueco():
+    df = generate_ohlcv("AAA", 300)
+    state = FeatureState()
+    state.update_frame(df.iloc[:200])
+    # el estado nunca vio las barras 200..249
+    state.update_frame(df.iloc[250:])
+    _assert_vector(state, df)
+
+
+def test_se_resincroniza_con_historial_revisado():
+    df = generate_ohlcv("AAA", 300)
+    state = FeatureState()
+    state.update_frame(df.iloc[:-1])
+    # ajuste por split: cambian todos los precios previos y llega una barra nueva
+    revisado = df.copy()
+    revisado[["Open", "High", "Low", "Close"]] *= 0.5
+    state.update_frame(revisado)
+    _assert_vector(state, revisado)
+
+
+@pytest.fixture
+def almacenes(tmp_path):
+    from services.bar_store import get_bar_store, set_provider
+
+    store = get_bar_store()
+    prev = store.root, store.provider
+    store.root = str(tmp_path / "bars")
+    set_feature_store(FeatureStore(str(tmp_path / "features")))
+    yield store
+    store.root, store.provider = prev
+    set_feature_store(None)
+
+
+def test_minimo_de_historia_igual_en_ambos_caminos(almacenes):
+    from ml.recomendacion import _latest_feature_rows
+    from services.bar_store import get_history_many, set_provider
+
+    set_provider(SyntheticProvider(n_bars=FEATURE_LOOKBACK))
+    ticker = "MINHIST"
+    historias = get_history_many([ticker], period="2mo")
+    assert len(historias[ticker]) == FEATURE_LOOKBACK
+
+    fecha, fila = latest_features(ticker)
+    lote = _latest_feature_rows(historias)
+    assert ticker in lote.index
+    assert lote.loc[ticker, "Date"] == fecha
+    np.testing.assert_allclose(fila.iloc[0].to_numpy(), lote.loc[ticker, FEATURE_COLUMNS].to_numpy(dtype=float), rtol=1e-9)
@@ -0,0 +1,66 @@
+"""Las muestras pendientes del auto-entrenamiento sobreviven a procesos cortos (CLI)."""
+
+import time
+
+import pytest
+
+from benchmarks.synthetic import seed_interactions
+from config.db import use_database
+from config.memory_db import MemoryDB
+from ml.training_worker import SelfTrainingWorker
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    # registro de modelos vacío: ninguna versión aprendió registros todavía
+    monkeypatch.chdir(tmp_path)
+    db = MemoryDB()
+    use_database(db)
+    yield db
+    use_database(None)
+
+
+def _esperar(cond, timeout=5.0):
+    fin = time.monotonic() + timeout
+    while time.monotonic() < fin and not cond():
+        time.sleep(0.02)
+    return cond()
+
+
+def _worker(corridas):
+    return SelfTrainingWorker(train_fn=lambda: corridas.append(1), min_new_samples=25, min_interval_s=3600)
+
+
+def test_el_siguiente_proceso_recupera_las_pendientes(db):
+    corridas = []
+    # primera sesión: 10 registros, no alcanza el umbral y el proceso termina
+    seed_interactions(db, ["AAA", "BBB"], 10, n_bars=120)
+    primero = _worker(corridas)
+    primero.submit(10)
+    assert _esperar(lambda: primero.status()["state"] == "waiting")
+    primero.stop(1.0)
+    assert corridas == []
+
+    # segunda sesión: 20 más; con lo pendiente de la anterior supera el umbral
+    seed_interactions(db, ["AAA", "BBB"], 20, n_bars=120, seed=1)
+    segundo = _worker(corridas)
+    segundo.submit(1)
+    assert _esperar(lambda: segundo.status()["runs"] == 1)
+    assert segundo.status()["recovered"] > 0
+    segundo.stop(1.0)
+
+
+def test_cuenta_solo_lo_posterior_a_la_marca_de_agua(db):
+    from ml.self_training import count_new_samples
+
+    seed_interactions(db, ["AAA"], 12, n_bars=120)
+    ultima = max(d["fecha"] for d in db.acciones_usuario.find({}))
+    assert count_new_samples() == 12
+    assert count_new_samples(limit=5) == 5
+    assert count_new_samples(since=ultima) == 0
+
+
+def test_modo_desconocido_es_un_error():
+    SelfTrainingWorker(train_fn=lambda: None, mode="window")
+    with pytest.raises(ValueError):
+        SelfTrainingWorker(train_fn=lambda: None, mode="full")